@@ -0,0 +1,108 @@
+"""
+Import-time and cold-start budget check for the slack_bot Lambda.
+
+Imports lambdas/slack_bot/index.py in a fresh interpreter and answers a Slack URL verification
+event, timing both. AWS endpoints point at a closed local port, so any network call made during
+import or URL verification fails the run as well. Exits non-zero when a budget is exceeded.
+
+    python benchmarks/cold_start.py --import-budget-ms 1500 --cold-start-budget-ms 150
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import index
+import_ms = (time.perf_counter() - start) * 1000
+
+
+class Context:
+    function_name = "slackbot"
+    memory_limit_in_mb = 128
+    invoked_function_arn = "arn:aws:lambda:us-east-1:000000000000:function:slackbot"
+    aws_request_id = "cold-start-benchmark"
+
+
+event = {
+    "requestContext": {"requestId": "cold-start-benchmark"},
+    "headers": {},
+    "body": json.dumps({"type": "url_verification", "challenge": "challenge"}),
+}
+start = time.perf_counter()
+response = index.lambda_handler(event, Context())
+cold_start_ms = (time.perf_counter() - start) * 1000
+assert response["body"] == "challenge", response
+
+sys.stderr.write(json.dumps({"import_ms": import_ms, "cold_start_ms": cold_start_ms}) + "\\n")
+"""
+
+ENVIRONMENT = {
+    "AWS_REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "AWS_ENDPOINT_URL": "http://127.0.0.1:9",
+    "AWS_MAX_ATTEMPTS": "1",
+    "POWERTOOLS_METRICS_NAMESPACE": "radiuss",
+    "POWERTOOLS_SERVICE_NAME": "radiuss",
+    "POWERTOOLS_TRACE_DISABLED": "true",
+    "POWERTOOLS_LOG_LEVEL": "WARNING",
+    "kendra_index_id": "benchmark",
+    "model_id": "anthropic.claude-v2:1",
+    "slack_token_arn": "arn:aws:secretsmanager:us-east-1:000000000000:secret:benchmark",
+    "parent_channel_param_name": "/Radiuss/Spack/ParentChannelId",
+    "slackbot_member_id_param_name": "/Radiuss/Spack/SlackbotMemberId",
+    "index_version_param_name": "/Radiuss/Spack/IndexVersion",
+}
+
+
+def measure():
+    env = dict(os.environ, **ENVIRONMENT)
+    env["PYTHONPATH"] = os.pathsep.join([
+        os.path.join(ROOT, "lambdas", "slack_bot"),
+        os.path.join(ROOT, "lambdas", "common"),
+    ])
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        env=env,
+        cwd=os.path.join(ROOT, "lambdas", "slack_bot"),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"Cold start probe failed:\n{result.stderr}")
+    return json.loads(result.stderr.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--import-budget-ms", type=float, default=1500)
+    parser.add_argument("--cold-start-budget-ms", type=float, default=150)
+    parser.add_argument("--runs", type=int, default=5, help="report the median of this many fresh interpreters")
+    args = parser.parse_args()
+
+    runs = sorted((measure() for _ in range(args.runs)), key=lambda run: run["import_ms"])
+    import_ms = runs[len(runs) // 2]["import_ms"]
+    cold_start_ms = sorted(run["cold_start_ms"] for run in runs)[len(runs) // 2]
+    print(json.dumps({"import_ms": round(import_ms, 1), "cold_start_ms": round(cold_start_ms, 1)}))
+
+    failures = []
+    if import_ms > args.import_budget_ms:
+        failures.append(f"import took {import_ms:.0f} ms, budget is {args.import_budget_ms:.0f} ms")
+    if cold_start_ms > args.cold_start_budget_ms:
+        failures.append(f"first invocation took {cold_start_ms:.0f} ms, budget is {args.cold_start_budget_ms:.0f} ms")
+    if failures:
+        raise SystemExit("Cold start budget exceeded: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
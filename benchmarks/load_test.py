@@ -0,0 +1,354 @@
+"""
+Local load test for the slack_bot Lambda.
+
+Synthesizes API Gateway-wrapped Slack `event_callback` events and drives `index.lambda_handler`
+with `--concurrency` worker processes. Each process stands in for one Lambda container: it
+imports the handler fresh, so the first request it serves is a cold start, and it handles one
+request at a time. SSM, Secrets Manager, Kendra, Bedrock and the Slack Web API are replaced by
+the fakes in tests/fakes.py. Each one takes a "median[,p99[,error_rate]]" latency spec in seconds.
+
+Per-stage latencies come from the metrics the handler already records (see timing.py), and
+`Handler` is the end-to-end latency of each invocation. Results go to stdout and, with
+`--output`, to a JSON file so runs can be compared across commits.
+
+With `--split`, each container acknowledges events the way the deployed bot does and hands the
+answers to an InMemoryWorkQueue, whose threads drain it through `index.worker_handler` as the SQS
+worker Lambda would. `Handler` is then the acknowledgement latency and `Worker` the time to answer
+each queued message; the run ends once every queue is empty.
+
+    python benchmarks/load_test.py --requests 500 --concurrency 16 --kendra-latency 0.15,0.6 \\
+        --bedrock-latency 0.8,2.5,0.02 --output load-test.json
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PARENT_CHANNEL = "C0SPACK"
+SLACKBOT_MEMBER_ID = "U0SPACKBOT"
+INDEX_VERSION = "load-test"
+
+ENVIRONMENT = {
+    "AWS_REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    # Anything that is not stubbed fails fast instead of reaching AWS
+    "AWS_ENDPOINT_URL": "http://127.0.0.1:9",
+    "AWS_MAX_ATTEMPTS": "1",
+    "POWERTOOLS_METRICS_NAMESPACE": "radiuss",
+    "POWERTOOLS_SERVICE_NAME": "radiuss",
+    "POWERTOOLS_TRACE_DISABLED": "true",
+    "POWERTOOLS_LOG_LEVEL": "ERROR",
+    "kendra_index_id": "load-test",
+    "model_id": "anthropic.claude-v2:1",
+    "slack_token_arn": "arn:aws:secretsmanager:us-east-1:000000000000:secret:load-test",
+    "parent_channel_param_name": "/Radiuss/Spack/ParentChannelId",
+    "slackbot_member_id_param_name": "/Radiuss/Spack/SlackbotMemberId",
+    "index_version_param_name": "/Radiuss/Spack/IndexVersion",
+}
+
+QUESTIONS = [
+    "How do I add a mirror to spack?",
+    "How can I create a spack environment and install packages into it?",
+    "Why does spack not find my compiler?",
+    "How do I push installed packages to a build cache?",
+    "What does the ^ mean in a spec like hdf5 ^openmpi?",
+    "How do I pick a specific gcc version for a build?",
+    "Can spack install from binaries instead of building from source?",
+    "How do I make spack use an external cmake?",
+]
+
+SERVICES = ["ssm", "secrets", "kendra", "bedrock", "slack"]
+
+
+class Context:
+    function_name = "slackbot"
+    memory_limit_in_mb = 128
+    invoked_function_arn = "arn:aws:lambda:us-east-1:000000000000:function:slackbot"
+
+    def __init__(self, request_id):
+        self.aws_request_id = request_id
+
+
+def synthesize_events(count, distinct_questions, seed):
+    """API Gateway proxy events for Slack messages, `distinct_questions` different texts in total."""
+    rng = random.Random(seed)
+    questions = [
+        QUESTIONS[i % len(QUESTIONS)] + ("" if i < len(QUESTIONS) else f" (variant {i // len(QUESTIONS)})")
+        for i in range(distinct_questions)
+    ]
+    events = []
+    for i in range(count):
+        ts = f"{1700000000 + i}.{i % 1000000:06d}"
+        body = {
+            "type": "event_callback",
+            "event_id": f"Ev{i:08d}",
+            "event": {
+                "type": "message",
+                "channel": PARENT_CHANNEL,
+                "user": f"U{rng.randrange(1000):04d}",
+                "ts": ts,
+                "text": f"<@{SLACKBOT_MEMBER_ID}> {rng.choice(questions)}",
+            },
+        }
+        events.append({
+            "requestContext": {"requestId": f"load-test-{i}"},
+            "headers": {},
+            "body": json.dumps(body),
+        })
+    return events
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(q / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(samples):
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 3),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3),
+    }
+
+
+def container(worker_id, config, events, results):
+    """Serve events from the queue one at a time, like a single Lambda container."""
+    os.environ.update(ENVIRONMENT)
+    os.environ["stream_answers"] = "true" if config["stream"] else "false"
+    os.environ["stream_update_interval"] = str(config["stream_update_interval"])
+
+    # Powertools writes logs and EMF blobs to stdout, which would swamp the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        from tests.fakes import (
+            FakeKendra, FakeSSM, FakeSecretsManager, FakeSlackHttp, FakeStreamingBedrock, LatencyModel,
+            ThrottlingBedrock,
+        )
+
+        seed = config["seed"] * 1000 + worker_id
+        latency = {service: LatencyModel.parse(config["latency"][service], seed=seed + i)
+                   for i, service in enumerate(SERVICES)}
+
+        import_start = time.perf_counter()
+        import clients
+        import index
+        import slack
+        import timing
+        from config_loader import ParameterLoader
+        import_ms = (time.perf_counter() - import_start) * 1000
+
+        # Tap the stage metrics on their way into the EMF blob
+        stage_metrics = {
+            f"{stage}Latency": stage
+            for stage in [timing.PARAMETER_LOAD, timing.RETRIEVE, timing.RERANK, timing.CONTEXT_PACK, timing.MODEL,
+                          timing.MODEL_FIRST_TOKEN, timing.SLACK_POST]
+        }
+        stages = {}
+        add_metric = timing.metrics.add_metric
+
+        def record_metric(name, unit, value, **kwargs):
+            if name in stage_metrics:
+                stages.setdefault(stage_metrics[name], []).append(value)
+            return add_metric(name=name, unit=unit, value=value, **kwargs)
+
+        timing.metrics.add_metric = record_metric
+
+        index.parameters = ParameterLoader(index.parameters.names, client=FakeSSM({
+            ENVIRONMENT["parent_channel_param_name"]: PARENT_CHANNEL,
+            ENVIRONMENT["slackbot_member_id_param_name"]: SLACKBOT_MEMBER_ID,
+            ENVIRONMENT["index_version_param_name"]: INDEX_VERSION,
+        }, latency=latency["ssm"]))
+        clients.secretsmanager.set(FakeSecretsManager(
+            {ENVIRONMENT["slack_token_arn"]: json.dumps({"token": "xoxb-load-test"})},
+            latency=latency["secrets"],
+        ))
+        clients.kendra.set(FakeKendra(latency=latency["kendra"]))
+        clients.bedrock_runtime.set(ThrottlingBedrock(
+            FakeStreamingBedrock(
+                answer=config["answer"],
+                token_interval=config["token_interval"],
+                latency=latency["bedrock"],
+            ),
+            ThrottlingBedrock.at_rate(latency["bedrock"].error_rate, seed=seed),
+        ))
+        slack.client.http = FakeSlackHttp(latency=latency["slack"])
+
+        handler = []
+        errors = []
+        served = 0
+
+        if config["split"]:
+            from work_queue import InMemoryWorkQueue
+
+            worker = stages.setdefault("Worker", [])
+
+            def answer(message):
+                # Wrapped as the single record of an SQS batch, as the worker Lambda receives it
+                start = time.perf_counter()
+                result = index.worker_handler(
+                    {"Records": [{"messageId": message["execution_id"], "body": json.dumps(message)}]},
+                    Context(f"worker-{message['execution_id']}"),
+                )
+                worker.append((time.perf_counter() - start) * 1000)
+                if result["batchItemFailures"]:
+                    errors.append("worker_handler: batch item failure")
+
+            index.work_queue = InMemoryWorkQueue(consumer=answer, workers=config["split_workers"])
+        else:
+            index.work_queue = None
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            start = time.perf_counter()
+            try:
+                index.lambda_handler(event, Context(event["requestContext"]["requestId"]))
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+            handler.append((time.perf_counter() - start) * 1000)
+            served += 1
+
+        if index.work_queue is not None:
+            index.work_queue.close()
+
+    results.put({
+        "worker": worker_id,
+        "import_ms": import_ms,
+        "served": served,
+        "handler": handler,
+        "stages": stages,
+        "errors": errors,
+    })
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(config):
+    for path in (ROOT, os.path.join(ROOT, "lambdas", "common"), os.path.join(ROOT, "lambdas", "slack_bot")):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    # Each container is a fresh interpreter so it pays its own cold start
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    results = context.Queue()
+    for event in synthesize_events(config["requests"], config["distinct_questions"], config["seed"]):
+        events.put(event)
+    for _ in range(config["concurrency"]):
+        events.put(None)
+
+    start = time.perf_counter()
+    workers = [
+        context.Process(target=container, args=(i, config, events, results), daemon=True)
+        for i in range(config["concurrency"])
+    ]
+    for worker in workers:
+        worker.start()
+    reports = [results.get() for _ in workers]
+    wall_seconds = time.perf_counter() - start
+    for worker in workers:
+        worker.join()
+
+    handler = [sample for report in reports for sample in report["handler"]]
+    stages = {"Handler": handler}
+    for report in reports:
+        for stage, samples in report["stages"].items():
+            stages.setdefault(stage, []).extend(samples)
+    errors = [error for report in reports for error in report["errors"]]
+
+    return {
+        "commit": git_commit(),
+        "config": config,
+        "requests": len(handler),
+        "errors": len(errors),
+        "error_rate": round(len(errors) / len(handler), 4) if handler else None,
+        "error_samples": sorted(set(errors))[:10],
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(handler) / wall_seconds, 2),
+        "import_ms": summarize([report["import_ms"] for report in reports]),
+        "stages": {stage: summarize(samples) for stage, samples in sorted(stages.items()) if samples},
+    }
+
+
+def print_report(result):
+    print(f"{result['requests']} requests, {result['errors']} errors in {result['wall_seconds']} s "
+          f"({result['throughput_rps']} req/s) at concurrency {result['config']['concurrency']}")
+    print(f"{'stage':<18}{'count':>8}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+    for stage, summary in result["stages"].items():
+        print(f"{stage:<18}{summary['count']:>8}{summary['p50_ms']:>11.1f}{summary['p95_ms']:>11.1f}"
+              f"{summary['p99_ms']:>11.1f}{summary['max_ms']:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8, help="number of simulated Lambda containers")
+    parser.add_argument("--distinct-questions", type=int, default=40,
+                        help="fewer distinct questions means more answer and retrieval cache hits")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True,
+                        help="stream answers into Slack, as deployed")
+    parser.add_argument("--stream-update-interval", type=float, default=1.5)
+    parser.add_argument("--split", action="store_true",
+                        help="acknowledge events and answer them from an in-process work queue")
+    parser.add_argument("--split-workers", type=int, default=4, help="answer threads per container with --split")
+    parser.add_argument("--answer", default="Use `spack mirror add <name> <url>` to register a mirror, then "
+                                            "`spack mirror list` to check it was added. " * 4)
+    parser.add_argument("--token-interval", type=float, default=0.01, help="seconds between streamed deltas")
+    parser.add_argument("--ssm-latency", default="0.02,0.08")
+    parser.add_argument("--secrets-latency", default="0.03,0.1")
+    parser.add_argument("--kendra-latency", default="0.15,0.6")
+    parser.add_argument("--bedrock-latency", default="0.6,2.0", help="time to first token")
+    parser.add_argument("--slack-latency", default="0.08,0.3")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    result = run({
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "distinct_questions": args.distinct_questions,
+        "stream": args.stream,
+        "stream_update_interval": args.stream_update_interval,
+        "split": args.split,
+        "split_workers": args.split_workers,
+        "answer": args.answer,
+        "token_interval": args.token_interval,
+        "seed": args.seed,
+        "latency": {
+            "ssm": args.ssm_latency,
+            "secrets": args.secrets_latency,
+            "kendra": args.kendra_latency,
+            "bedrock": args.bedrock_latency,
+            "slack": args.slack_latency,
+        },
+    })
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
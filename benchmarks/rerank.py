@@ -0,0 +1,126 @@
+"""
+Overhead of the lexical re-ranker against the prompt tokens it saves.
+
+Builds synthetic Kendra retrieve results of several sizes, times `rag.rerank` on each and
+compares the passages packed into the prompt with and without it. Passages are ~200 words,
+like Kendra Retrieve passages, drawn from a Spack-flavoured vocabulary so term statistics are
+realistic enough for BM25.
+
+    python benchmarks/rerank.py --sizes 10 25 50 100 --top-n 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "true")
+os.environ.setdefault("kendra_index_id", "benchmark")
+os.environ.setdefault("model_id", "anthropic.claude-v2:1")
+sys.path[:0] = [ROOT, os.path.join(ROOT, "lambdas", "common"), os.path.join(ROOT, "lambdas", "slack_bot")]
+
+from packing import pack_passages  # noqa: E402
+from rag import rerank, passage_terms_cache  # noqa: E402
+from tests.fakes import FakeKendra, SPACK_PASSAGES  # noqa: E402
+
+VOCABULARY = (
+    "spack install uninstall spec variant compiler gcc clang intel oneapi cuda rocm mpi openmpi mpich hdf5 "
+    "netcdf cmake python py-numpy environment env activate concretize concretizer mirror buildcache binary "
+    "cache module lmod tcl view package recipe dependency external packages.yaml compilers.yaml config.yaml "
+    "spack.yaml lockfile hash version target microarchitecture x86_64 aarch64 build stage fetch patch "
+    "checksum url git branch tag commit develop test ci pipeline gitlab container docker singularity"
+).split()
+FILLER = "the a to of and in is for with that this it on you can be as by or from when your".split()
+
+QUESTIONS = [
+    "How do I add a mirror and push binaries to a build cache?",
+    "Why does concretize pick the wrong compiler version for hdf5?",
+    "How can I make spack use an external cmake from packages.yaml?",
+    "How do I create an environment with a lockfile for CI?",
+]
+
+
+def passage(rng, words=200):
+    return " ".join(rng.choice(VOCABULARY) if rng.random() < 0.45 else rng.choice(FILLER) for _ in range(words))
+
+
+def result_items(size, seed):
+    rng = random.Random(seed)
+    items = FakeKendra(top_k=len(SPACK_PASSAGES)).retrieve(IndexId="benchmark", QueryText="")['ResultItems']
+    confidences = ["VERY_HIGH", "HIGH", "MEDIUM", "LOW"]
+    while len(items) < size:
+        i = len(items)
+        items.append({
+            'Id': f"benchmark-{i}",
+            'DocumentTitle': " ".join(rng.sample(VOCABULARY, 3)),
+            'DocumentURI': f"https://spack.readthedocs.io/en/latest/page-{i}.html",
+            'Content': passage(rng),
+            'ScoreAttributes': {'ScoreConfidence': rng.choice(confidences)},
+        })
+    rng.shuffle(items)
+    return items[:size]
+
+
+def time_rerank(question, items, top_n, repeat, cold):
+    samples = []
+    for _ in range(repeat):
+        if cold:
+            passage_terms_cache.clear()
+        start = time.perf_counter()
+        rerank(question, items, top_n=top_n)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 25, 50, 100])
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--price-per-1k-input-tokens", type=float, default=0.008,
+                        help="USD, defaults to Claude v2 on-demand input pricing")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        cold_ms, warm_ms, baseline_tokens, reranked_tokens = [], [], [], []
+        for i, question in enumerate(QUESTIONS):
+            items = result_items(size, seed=size * 100 + i)
+            cold_ms.append(time_rerank(question, items, args.top_n, args.repeat, cold=True))
+            warm_ms.append(time_rerank(question, items, args.top_n, args.repeat, cold=False))
+            baseline_tokens.append(pack_passages(items).tokens)
+            reranked_tokens.append(pack_passages(rerank(question, items, top_n=args.top_n), ranked=True).tokens)
+
+        saved = (sum(baseline_tokens) - sum(reranked_tokens)) / len(QUESTIONS)
+        results.append({
+            "results": size,
+            # Cold: every passage is tokenized. Warm: term counts come from the per-container cache
+            "rerank_cold_ms": round(sorted(cold_ms)[len(cold_ms) // 2], 3),
+            "rerank_warm_ms": round(sorted(warm_ms)[len(warm_ms) // 2], 3),
+            "prompt_tokens_without_rerank": round(sum(baseline_tokens) / len(QUESTIONS)),
+            "prompt_tokens_with_rerank": round(sum(reranked_tokens) / len(QUESTIONS)),
+            "prompt_tokens_saved": round(saved),
+            "usd_saved_per_1k_questions": round(saved * args.price_per_1k_input_tokens, 2),
+        })
+
+    print(f"{'results':>8}{'cold ms':>9}{'warm ms':>9}{'tokens before':>15}{'tokens after':>14}{'saved':>8}"
+          f"{'USD/1k q':>10}")
+    for row in results:
+        print(f"{row['results']:>8}{row['rerank_cold_ms']:>9.3f}{row['rerank_warm_ms']:>9.3f}"
+              f"{row['prompt_tokens_without_rerank']:>15}"
+              f"{row['prompt_tokens_with_rerank']:>14}{row['prompt_tokens_saved']:>8}"
+              f"{row['usd_saved_per_1k_questions']:>10.2f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"top_n": args.top_n, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Time and bytes the Slack ingest spends writing documents to S3, before and after the upload pipeline.
+
+Writes the same synthetic documents into a tests.fakes.FakeS3 with per-request latency three ways:
+- serial: the previous path, three PUTs per document, the text uploaded to both buckets;
+- pipeline at each `--workers`: one List of the channel's documents, then for each document one
+  PUT to the raw bucket, a server-side copy to the processed bucket and the metadata PUT, for
+  several documents at once;
+- rerun: the pipeline again over unchanged documents, which costs the List and one HEAD each.
+
+Every run's buckets are checked to hold the same objects as the serial one.
+
+    python benchmarks/s3_writes.py --documents 500 --latency 0.03,0.12 --workers 1 4 8 16
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "lambdas", "slack_ingest")]
+
+from tests.fakes import FakeS3, LatencyModel  # noqa: E402
+from upload_pipeline import UploadPipeline  # noqa: E402
+
+RAW = "raw-slack"
+PROCESSED = "processed-slack"
+CHANNEL_PREFIX = "C0SPACK-"
+
+
+def documents(count, seed):
+    rng = random.Random(seed)
+    words = "spack install mirror buildcache compiler environment variant dependency concretize".split()
+    for i in range(count):
+        name = f"{CHANNEL_PREFIX}{1700000000 + i}.000100"
+        # Most messages are a line or two, threads run to a few KB
+        text = " ".join(rng.choice(words) for _ in range(int(rng.lognormvariate(3, 1.2)) + 1)) + "\n\n"
+        metadata = json.dumps({
+            "Attributes": {"_source_uri": f"https://example.cloudfront.net/{name}.txt", "data_source": "slack"},
+            "Title": name,
+            "ContentType": "PLAIN_TEXT",
+        })
+        yield name, text, metadata
+
+
+def serial(s3, docs):
+    for name, text, metadata in docs:
+        s3.put_object(Body=text, Bucket=RAW, Key=name + ".txt")
+        s3.put_object(Body=text, Bucket=PROCESSED, Key=name + ".txt")
+        s3.put_object(Body=metadata, Bucket=PROCESSED, Key=name + ".txt.metadata.json")
+
+
+def pipeline(s3, docs, workers):
+    with UploadPipeline(s3, RAW, PROCESSED, workers=workers, prefix=CHANNEL_PREFIX) as uploads:
+        for name, text, metadata in docs:
+            uploads.submit(name, text, metadata)
+    return uploads.stats
+
+
+def contents(s3):
+    return {bucket: {key: value['Body'] for key, value in objects.items()} for bucket, objects in s3.buckets.items()}
+
+
+def measure(label, workers, s3, run):
+    start = time.perf_counter()
+    stats = run()
+    return {
+        "run": label,
+        "workers": workers,
+        "seconds": round(time.perf_counter() - start, 2),
+        "requests": sum(s3.requests.values()),
+        "bytes_uploaded": s3.bytes_uploaded,
+        "saved": stats.saved if stats else None,
+        "unchanged": stats.unchanged if stats else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--latency", default="0.03,0.12", help='S3 latency, "median[,p99]" seconds')
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    docs = list(documents(args.documents, args.seed))
+
+    def store():
+        return FakeS3([RAW, PROCESSED], latency=LatencyModel.parse(args.latency, seed=args.seed))
+
+    s3 = store()
+    results = [measure("serial", 1, s3, lambda: serial(s3, docs))]
+    expected = contents(s3)
+    for workers in args.workers:
+        s3 = store()
+        results.append(measure("pipeline", workers, s3, lambda: pipeline(s3, docs, workers)))
+        results[-1]["same_objects"] = contents(s3) == expected
+    # Unchanged documents on the last store: one HEAD each and nothing uploaded
+    s3.requests.clear()
+    s3.bytes_uploaded = 0
+    results.append(measure("rerun", args.workers[-1], s3, lambda: pipeline(s3, docs, args.workers[-1])))
+
+    print(f"{args.documents} documents, S3 latency {args.latency}s")
+    print(f"{'run':>9}{'workers':>8}{'seconds':>9}{'speedup':>9}{'requests':>10}{'KB up':>9}{'same objects':>14}")
+    for row in results:
+        print(f"{row['run']:>9}{row['workers']:>8}{row['seconds']:>9.2f}{results[0]['seconds'] / row['seconds']:>9.1f}"
+              f"{row['requests']:>10}{row['bytes_uploaded'] / 1024:>9.0f}{str(row.get('same_objects', '')):>14}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Wall-clock time of the nightly ingest's thread expansion, serial against a worker pool.
+
+Serves a synthetic channel from tests.fakes.FakeSlackServer on a local socket, then reads its
+history and expands every thread with `slack_ingest.index.expand_threads` at each `--workers`
+setting. The server enforces Slack's Tier 3 limit on conversations.replies and the client its
+own token bucket, so the pool can only go as fast as the limit allows: at Slack's documented
+50 per minute a serial fetch is often already at that floor, and the pool pays off once the
+workspace allows more (see slack_rate_limit_scale). Each `--tier3-per-minute` is run in turn.
+
+Real Slack limits are per minute, so by default latencies are divided and limits multiplied by
+`--speedup` and the times reported are scaled back to real seconds. Output order is checked to
+be identical across worker counts.
+
+    python benchmarks/thread_fetch.py --messages 300 --latency 0.3,1.2 --workers 1 4 8 16 --tier3-per-minute 50 300
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHANNEL = "C0SPACK"
+ENVIRONMENT = {
+    "AWS_REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "POWERTOOLS_TRACE_DISABLED": "true",
+    "POWERTOOLS_METRICS_NAMESPACE": "radiuss",
+    "POWERTOOLS_LOG_LEVEL": "ERROR",
+    "slack_token_arn": "arn:aws:secretsmanager:us-east-1:000000000000:secret:slack",
+    "kendra_index_id": "benchmark",
+    "kendra_data_source_id": "benchmark",
+    "cloudfront_distribution_prefix": "benchmark.cloudfront.net",
+    "parent_channel_param_name": "/Radiuss/Spack/ParentChannelId",
+}
+
+for name, value in ENVIRONMENT.items():
+    os.environ.setdefault(name, value)
+sys.path[:0] = [ROOT, os.path.join(ROOT, "lambdas", "common"), os.path.join(ROOT, "lambdas", "slack_ingest")]
+
+from tests.fakes import FakeSecretsManager, FakeSlackServer, LatencyModel  # noqa: E402
+
+
+def import_ingest():
+    # The ingest Lambda creates its boto3 clients and reads the Slack token at import
+    secrets = FakeSecretsManager({ENVIRONMENT["slack_token_arn"]: json.dumps({"token": "xoxb-benchmark"})})
+    with mock.patch("boto3.client", side_effect=lambda name, **kwargs: secrets if name == "secretsmanager"
+                    else mock.MagicMock()):
+        import index
+    return index
+
+
+def run(index, server, workers, tier3_per_minute, speedup):
+    from slack_client import SlackClient, TIER_LIMITS
+
+    tier_limits = {**TIER_LIMITS, 3: (tier3_per_minute / 60, TIER_LIMITS[3][1])}
+    index.slack = SlackClient(
+        token="xoxb-benchmark",
+        base_url=server.url,
+        tier_limits={tier: (rate * speedup, burst) for tier, (rate, burst) in tier_limits.items()},
+    )
+    start = time.perf_counter()
+    output = [
+        (message['ts'], text)
+        for message, text in index.expand_threads(index.fetch_channel_history(CHANNEL, 0), CHANNEL, workers=workers)
+    ]
+    return time.perf_counter() - start, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--thread-share", type=float, default=0.4)
+    parser.add_argument("--max-replies", type=int, default=300, help="threads over 200 replies take two pages")
+    parser.add_argument("--latency", default="0.3,1.2", help='Slack latency, "median[,p99[,error_rate]]" seconds')
+    parser.add_argument("--tier3-per-minute", type=int, nargs="+", default=[50, 300])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--speedup", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    latency = LatencyModel.parse(args.latency, seed=args.seed)
+    latency.median /= args.speedup
+    latency.p99 = latency.p99 / args.speedup if latency.p99 else None
+
+    # Powertools writes EMF blobs to stdout, which would swamp the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        index = import_ingest()
+        results = []
+        for per_minute in args.tier3_per_minute:
+            baseline = None
+            for workers in args.workers:
+                server = FakeSlackServer.synthetic(
+                    CHANNEL, args.messages, thread_share=args.thread_share, max_replies=args.max_replies,
+                    seed=args.seed, latency=latency, limits={'conversations.replies': (per_minute, 60 / args.speedup)},
+                )
+                with server:
+                    seconds, output = run(index, server, workers, per_minute, args.speedup)
+                baseline = baseline or output
+                results.append({
+                    "tier3_per_minute": per_minute,
+                    "workers": workers,
+                    "seconds": round(seconds * args.speedup, 1),
+                    "messages": len(output),
+                    "threads": len(server.threads),
+                    "replies_requests": server.requests['conversations.replies'],
+                    "rate_limited": server.rate_limited['conversations.replies'],
+                    "same_output": output == baseline,
+                })
+
+    print(f"{results[0]['messages']} messages, {results[0]['threads']} threads, Slack latency {args.latency}s")
+    print(f"{'tier 3/min':>10}{'workers':>8}{'seconds':>10}{'speedup':>9}{'floor s':>9}{'requests':>10}{'429s':>6}"
+          f"{'same output':>13}")
+    for row in results:
+        serial = next(r["seconds"] for r in results if r["tier3_per_minute"] == row["tier3_per_minute"])
+        # Time the rate limit alone imposes, after the initial burst
+        floor = max(row["replies_requests"] - 10, 0) * 60 / row["tier3_per_minute"]
+        print(f"{row['tier3_per_minute']:>10}{row['workers']:>8}{row['seconds']:>10.1f}{serial / row['seconds']:>9.2f}"
+              f"{floor:>9.1f}{row['replies_requests']:>10}{row['rate_limited']:>6}{str(row['same_output']):>13}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
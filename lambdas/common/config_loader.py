@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+
+import boto3
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricUnit, MetricResolution
+
+logger = Logger()
+metrics = Metrics()
+
+# GetParameters accepts at most 10 names per call
+GET_PARAMETERS_BATCH_SIZE = 10
+
+parameter_cache_ttl = float(os.environ.get('parameter_cache_ttl', 300))
+
+
+class ParameterLoader:
+    """
+    Loads a fixed set of SSM parameters with batched GetParameters calls and caches them.
+
+    Instances are meant to live at module level so the cache survives across warm invocations.
+    Values are served from the cache for `ttl` seconds. Once an entry is past `refresh_ahead`
+    of its lifetime, the cached value is still returned while a background thread reloads it,
+    so warm invocations do no SSM I/O at all. Only the first load and fully expired entries
+    block on SSM. `clock` returns the current time in seconds, `time.monotonic` by default.
+    """
+
+    def __init__(self, names, ttl=parameter_cache_ttl, refresh_ahead=0.8, client=None, clock=time.monotonic):
+        self.names = [name for name in names if name]
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.hits = 0
+        self.misses = 0
+        self._client = client
+        self.clock = clock
+        self._values = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        # Separate from _lock, which a background refresh holds while it waits on SSM
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client('ssm')
+        return self._client
+
+    def get(self, name):
+        return self.get_all()[name]
+
+    def get_all(self):
+        age = None if self._loaded_at is None else self.clock() - self._loaded_at
+
+        if age is None or age >= self.ttl:
+            self._record(hit=False)
+            with self._lock:
+                # Another thread may have reloaded while we waited on the lock
+                if self._loaded_at is None or self.clock() - self._loaded_at >= self.ttl:
+                    self._load()
+            return self._values
+
+        self._record(hit=True)
+        if age >= self.ttl * self.refresh_ahead:
+            self._refresh_in_background()
+        return self._values
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.add_metric(
+            name="ParameterCacheHit" if hit else "ParameterCacheMiss",
+            unit=MetricUnit.Count,
+            value=1,
+            resolution=MetricResolution.High
+        )
+
+    def _load(self):
+        logger.info(f"Loading parameters: {self.names}")
+        values = {}
+        for i in range(0, len(self.names), GET_PARAMETERS_BATCH_SIZE):
+            response = self.client.get_parameters(Names=self.names[i:i + GET_PARAMETERS_BATCH_SIZE])
+            if response['InvalidParameters']:
+                raise Exception(f"Parameters not found: {response['InvalidParameters']}")
+            for parameter in response['Parameters']:
+                values[parameter['Name']] = parameter['Value']
+
+        # Swap the whole dict so readers never see a partial reload
+        self._values = values
+        self._loaded_at = self.clock()
+
+    def _refresh_in_background(self):
+        with self._refresh_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="parameter-refresh", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            with self._lock:
+                self._load()
+        except Exception as e:
+            logger.warning(f"Background parameter refresh failed, serving cached values: {e}")
+        finally:
+            self._refreshing = False
@@ -0,0 +1,237 @@
+import json
+import os
+import random
+import threading
+import time
+
+import urllib3
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricUnit, MetricResolution
+
+from rate_limit import TokenBucket
+
+logger = Logger()
+metrics = Metrics()
+
+SLACK_API_URL = "https://slack.com/api/"
+
+slack_connect_timeout = float(os.environ.get('slack_connect_timeout', 3))
+slack_read_timeout = float(os.environ.get('slack_read_timeout', 10))
+slack_pool_size = int(os.environ.get('slack_pool_size', 10))
+slack_max_retries = int(os.environ.get('slack_max_retries', 3))
+# Longest Retry-After honoured before giving up with SlackRateLimitedError
+slack_max_retry_wait = float(os.environ.get('slack_max_retry_wait', 30))
+
+# Slack documents its tiers as minimums ("50+ per minute"); apps granted more can raise this
+slack_rate_limit_scale = float(os.environ.get('slack_rate_limit_scale', 1))
+
+# Slack's documented per-workspace limits: (requests per second, burst)
+TIER_LIMITS = {
+    1: (1 / 60, 1),
+    2: (20 / 60, 5),
+    3: (50 / 60, 10),
+    4: (100 / 60, 20),
+    # chat.postMessage: about one message per second per channel
+    'post': (1.0, 3),
+}
+METHOD_TIERS = {
+    'auth.test': 4,
+    'chat.postMessage': 'post',
+    'chat.update': 3,
+    'conversations.history': 3,
+    'conversations.replies': 3,
+    'conversations.info': 3,
+}
+DEFAULT_TIER = 3
+# Limits that apply to each channel separately rather than to the whole workspace
+PER_CHANNEL_TIERS = {'post'}
+# Methods that accept a JSON body, the rest take form or query parameters
+JSON_METHODS = {'chat.postMessage', 'chat.update', 'chat.delete', 'chat.postEphemeral'}
+# Methods safe to repeat after a 5xx or a read timeout, where Slack may already have acted on the
+# first request. Anything else, chat.postMessage above all, is only retried on 429
+IDEMPOTENT_METHODS = {'auth.test', 'chat.update'}
+IDEMPOTENT_PREFIXES = ('conversations.',)
+
+# Slack API errors that mean the token itself has gone bad
+TOKEN_ERRORS = {'invalid_auth', 'token_revoked', 'token_expired', 'not_authed', 'account_inactive'}
+
+
+class SlackError(Exception):
+    """A Slack Web API call that came back with `ok: false` or failed at the HTTP level."""
+
+    def __init__(self, method, error, response=None):
+        super().__init__(f"{method} failed: {error}")
+        self.method = method
+        self.error = error
+        self.response = response or {}
+
+
+class SlackAuthError(SlackError):
+    """The token was rejected, see TOKEN_ERRORS."""
+
+
+class SlackRateLimitedError(SlackError):
+    """Still rate limited after the allowed retries, or asked to wait longer than allowed."""
+
+    def __init__(self, method, retry_after):
+        super().__init__(method, f"ratelimited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class SlackHttpError(SlackError):
+    def __init__(self, method, status):
+        super().__init__(method, f"HTTP {status}")
+        self.status = status
+
+
+def is_idempotent(method):
+    return method in IDEMPOTENT_METHODS or method.startswith(IDEMPOTENT_PREFIXES)
+
+
+def create_pool():
+    # Connections are kept alive between calls and across warm invocations. urllib3 only retries
+    # failed connects, which never reach Slack; read timeouts, dropped connections, 429s and 5xx
+    # come back to SlackClient, which knows which methods are safe to repeat
+    return urllib3.PoolManager(
+        num_pools=2,
+        maxsize=slack_pool_size,
+        timeout=urllib3.Timeout(connect=slack_connect_timeout, read=slack_read_timeout),
+        retries=urllib3.Retry(total=2, connect=2, read=0, other=0, status=0, respect_retry_after_header=False,
+                              raise_on_status=False, backoff_factor=0.2),
+    )
+
+
+class SlackClient:
+    """
+    Slack Web API client shared by the Slack Lambdas.
+
+    Calls go through one pooled urllib3 manager with connect and read timeouts. Before each call
+    a token is taken from the method's tier bucket (per channel for chat.postMessage), so bursts
+    queue locally instead of tripping Slack's limits. HTTP 429 responses are retried after their
+    Retry-After, which also holds back every other caller of that method. 5xx responses and
+    network failures are retried with jittered backoff only for IDEMPOTENT_METHODS, so a message
+    is never posted twice. Errors surface as SlackError subclasses.
+
+    Buckets are per container, Slack's limits are per workspace, so 429 handling remains the
+    backstop when many containers run at once. `token` is a string or a callable returning one.
+    `request_timer`, when set, is called with the method name for a context manager wrapped around
+    each HTTP request, so waits on the rate limiter and skipped calls are not timed.
+    """
+
+    def __init__(self, token, http=None, max_retries=slack_max_retries, max_retry_wait=slack_max_retry_wait,
+                 tier_limits=TIER_LIMITS, rate_limit_scale=slack_rate_limit_scale, base_url=SLACK_API_URL,
+                 request_timer=None):
+        self._token = token
+        self.request_timer = request_timer
+        self.base_url = base_url
+        self.http = http or create_pool()
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        self.tier_limits = tier_limits
+        self.rate_limit_scale = rate_limit_scale
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @property
+    def token(self):
+        return self._token() if callable(self._token) else self._token
+
+    def limiter(self, method, params):
+        tier = METHOD_TIERS.get(method, DEFAULT_TIER)
+        key = (tier, params.get('channel')) if tier in PER_CHANNEL_TIERS else (tier, method)
+        with self._lock:
+            if key not in self._buckets:
+                rate, burst = self.tier_limits[tier]
+                self._buckets[key] = TokenBucket(rate=rate * self.rate_limit_scale, capacity=burst)
+            return self._buckets[key]
+
+    def _request(self, method, params):
+        if self.request_timer is None:
+            return self._send(method, params)
+        with self.request_timer(method):
+            return self._send(method, params)
+
+    def _send(self, method, params):
+        headers = {'Authorization': f'Bearer {self.token}'}
+        if method in JSON_METHODS:
+            headers['Content-Type'] = 'application/json; charset=utf-8'
+            return self.http.request('POST', self.base_url + method, headers=headers, body=json.dumps(params))
+        fields = {name: value for name, value in params.items() if value is not None}
+        return self.http.request('GET', self.base_url + method, headers=headers, fields=fields)
+
+    def call(self, method, **params):
+        """Call a Web API method and return its response. Raises SlackError unless it is `ok`."""
+        limiter = self.limiter(method, params)
+        limiter.acquire()
+        return self._call(method, params, limiter)
+
+    def try_call(self, method, **params):
+        """Like `call`, but returns None straight away instead of waiting when the method's bucket is empty."""
+        limiter = self.limiter(method, params)
+        if limiter.try_acquire():
+            return None
+        return self._call(method, params, limiter)
+
+    def _call(self, method, params, limiter):
+        retry_failures = is_idempotent(method)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                limiter.acquire()
+            try:
+                response = self._request(method, params)
+            except urllib3.exceptions.HTTPError as e:
+                if not retry_failures or attempt == self.max_retries:
+                    raise SlackError(method, f"network error: {e}") from e
+                logger.warning(f"Slack {method} failed with {type(e).__name__}, retrying")
+                time.sleep(random.uniform(0, 0.5 * 2 ** attempt))
+                continue
+
+            if response.status == 429:
+                retry_after = float(response.headers.get('Retry-After', 1))
+                logger.warning(f"Slack rate limited {method}, retrying after {retry_after}s")
+                metrics.add_metric(name="SlackRateLimited", unit=MetricUnit.Count, value=1,
+                                   resolution=MetricResolution.High)
+                if attempt == self.max_retries or retry_after > self.max_retry_wait:
+                    raise SlackRateLimitedError(method, retry_after)
+                limiter.defer(retry_after)
+                continue
+
+            if response.status >= 500:
+                if not retry_failures or attempt == self.max_retries:
+                    raise SlackHttpError(method, response.status)
+                time.sleep(random.uniform(0, 0.5 * 2 ** attempt))
+                continue
+
+            if response.status != 200:
+                raise SlackHttpError(method, response.status)
+
+            data = json.loads(response.data.decode('utf-8'))
+            if not data.get('ok'):
+                error = data.get('error', 'unknown_error')
+                raise (SlackAuthError if error in TOKEN_ERRORS else SlackError)(method, error, data)
+            return data
+
+    def paginate(self, method, key, limit=200, **params):
+        """Yield every item under `key` across the pages of a cursor-paginated method."""
+        cursor = None
+        while True:
+            page_params = dict(params, limit=limit)
+            if cursor:
+                page_params['cursor'] = cursor
+            data = self.call(method, **page_params)
+            yield from data.get(key, [])
+            cursor = data.get('response_metadata', {}).get('next_cursor')
+            if not cursor:
+                return
+
+    def verify_token(self):
+        """auth.test, logging the workspace and user the token belongs to. Returns False if it is rejected."""
+        try:
+            data = self.call('auth.test')
+        except SlackError as e:
+            logger.error(f"Token validation failed: {e.error}")
+            return False
+        logger.info(f"Token is valid for workspace: {data['team']}")
+        logger.info(f"Associated with user: {data['user']}")
+        return True
@@ -0,0 +1,83 @@
+import os
+import boto3
+import json
+from datetime import datetime, timedelta, timezone
+
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricUnit, MetricResolution
+from aws_lambda_powertools import Tracer
+
+logger = Logger()
+metrics = Metrics()
+tracer = Tracer(service="Radiuss")
+
+kendra_index_id = os.environ['kendra_index_id']
+kendra_data_source_ids = [source_id for source_id in os.environ['kendra_data_source_ids'].split(',') if source_id]
+index_version_param_name = os.environ['index_version_param_name']
+# Only syncs started this recently are looked at; ingestion runs daily
+sync_lookback_hours = float(os.environ.get('sync_lookback_hours', 48))
+
+kendra = boto3.client("kendra")
+ssm_client = boto3.client('ssm')
+
+
+def finished_syncs(data_source_id, since):
+    """Yield the data source's sync jobs started after `since` that have ended, whatever their outcome."""
+    params = {
+        'Id': data_source_id,
+        'IndexId': kendra_index_id,
+        'StartTimeFilter': {'StartTime': since, 'EndTime': datetime.now(timezone.utc)},
+    }
+    while True:
+        page = kendra.list_data_source_sync_jobs(**params)
+        # Failed and stopped syncs may still have indexed part of their documents
+        yield from (job for job in page.get('History', []) if job.get('EndTime'))
+        if not page.get('NextToken'):
+            return
+        params['NextToken'] = page['NextToken']
+
+
+def latest_finished_sync(since):
+    jobs = [job for data_source_id in kendra_data_source_ids for job in finished_syncs(data_source_id, since)]
+    return max(jobs, key=lambda job: job['EndTime'], default=None)
+
+
+def is_newer(sync, parameter):
+    """Whether `sync` ended after the index version in `parameter` was published, and is not that version."""
+    return sync is not None and sync['ExecutionId'] != parameter['Value'] and sync['EndTime'] > parameter['LastModifiedDate']
+
+
+@logger.inject_lambda_context(log_event=True)
+@metrics.log_metrics(capture_cold_start_metric=True)
+@tracer.capture_lambda_handler
+def lambda_handler(event, context: LambdaContext):
+    """
+    Publish the latest finished Kendra sync as the index version, so the Slack bot drops answers
+    and retrievals cached against the documents from before it. Runs on a schedule: Kendra sends
+    no event when a sync job finishes.
+
+    The version is only bumped for a sync that ended after the parameter was last written, which
+    also leaves a newer bump by the self-hosted index builder in place.
+    """
+    metrics.add_dimension(name="Application", value="Radiuss")
+
+    parameter = ssm_client.get_parameter(Name=index_version_param_name)['Parameter']
+    sync = latest_finished_sync(datetime.now(timezone.utc) - timedelta(hours=sync_lookback_hours))
+
+    if not is_newer(sync, parameter):
+        logger.info(f"Index version {parameter['Value']} is current")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'msg': "Index version is current"})
+        }
+
+    logger.info(f"Sync {sync['ExecutionId']} ended {sync['EndTime']} with status {sync['Status']}, bumping index version")
+    ssm_client.put_parameter(Name=index_version_param_name, Value=sync['ExecutionId'], Overwrite=True)
+    metrics.add_metric(name="IndexVersionBumped", unit=MetricUnit.Count, value=1, resolution=MetricResolution.High)
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'msg': f"Index version {sync['ExecutionId']}"})
+    }
@@ -2,7 +2,6 @@ import boto3
 from datetime import datetime, timedelta
 import json
 import os
-import urllib3
 
 from aws_lambda_powertools import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
@@ -10,14 +9,13 @@ from aws_lambda_powertools import Metrics
 from aws_lambda_powertools.metrics import MetricUnit, MetricResolution
 from aws_lambda_powertools import Tracer
 
+from config_loader import ParameterLoader
+from slack_client import SlackClient
 
 logger = Logger()
 metrics = Metrics()
 tracer = Tracer(service="Radiuss")
 
-ssm_client = boto3.client('ssm')
-http = urllib3.PoolManager()
-
 today = datetime.today()
 yesterday = today - timedelta(days=1)
 cloudwatch = boto3.client('cloudwatch')
@@ -37,14 +35,13 @@ dimensions = [
 report_metrics = [
     'SlackBotLambdaInvocation',
     'RespondToMessage',
+    'FastPathMessage',
     'ThumbsUp',
     'ThumbsDown',
     'Retry',
     'SlackDailyIngestLambdaInvocation'
 ]
 
-slack_post_channel_url = 'https://slack.com/api/chat.postMessage'
-
 secretsmanager_client = boto3.client('secretsmanager')
 slack_token = json.loads(
     secretsmanager_client.get_secret_value(
@@ -52,12 +49,10 @@ slack_token = json.loads(
     )['SecretString']
 )['token']
 
-headers = {
-    'Authorization': f'Bearer {slack_token}',
-    'Content-Type': 'application/json',
-}
+slack = SlackClient(token=slack_token)
 
 child_channel_param_name = os.environ.get('child_channel_param_name')
+parameters = ParameterLoader([child_channel_param_name])
 
 
 def get_metric(metric_name):
@@ -81,11 +76,7 @@ def get_metric(metric_name):
 
 def send_message(channel, message):
     logger.info(f"Sending message: {message} to channel: {channel}")
-    data = {
-        'channel': channel,
-        'text': message,
-    }
-    response = http.request('POST', slack_post_channel_url, headers=headers, body=json.dumps(data))
+    slack.call('chat.postMessage', channel=channel, text=message)
 
 
 def format_message(message: dict):
@@ -101,7 +92,7 @@ def format_message(message: dict):
 @metrics.log_metrics(raise_on_empty_metrics=True, capture_cold_start_metric=True)
 @tracer.capture_lambda_handler
 def lambda_handler(event: dict, context: LambdaContext):
-    child_channel = ssm_client.get_parameter(Name=child_channel_param_name)['Parameter']['Value']
+    child_channel = parameters.get(child_channel_param_name)
 
     data = {}
     for metric in report_metrics:
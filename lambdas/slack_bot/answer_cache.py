@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from aws_lambda_powertools import Logger
+
+import clients
+from normalize import normalize_query
+from ttl_cache import LruCache
+
+logger = Logger()
+
+answer_cache_table = os.environ.get('answer_cache_table')
+answer_cache_ttl = float(os.environ.get('answer_cache_ttl', 24 * 60 * 60))
+answer_cache_size = int(os.environ.get('answer_cache_size', 256))
+
+
+class AnswerStore:
+    """Shared answer tier. Values are JSON-serializable dicts."""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def put(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class DynamoDBAnswerStore(AnswerStore):
+    """
+    Table keyed on `cache_key` (S) with `expires_at` (N) as its TTL attribute.
+
+    DynamoDB deletes expired items lazily, so expiry is also checked on read.
+    """
+
+    def __init__(self, table_name, client=None):
+        self.table_name = table_name
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or clients.dynamodb()
+
+    def get(self, key):
+        item = self.client.get_item(
+            TableName=self.table_name,
+            Key={'cache_key': {'S': key}},
+        ).get('Item')
+        if item is None or float(item['expires_at']['N']) <= time.time():
+            return None
+        return json.loads(item['value']['S'])
+
+    def put(self, key, value, ttl):
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                'cache_key': {'S': key},
+                'value': {'S': json.dumps(value)},
+                'expires_at': {'N': str(int(time.time() + ttl))},
+            },
+        )
+
+    def delete(self, key):
+        self.client.delete_item(TableName=self.table_name, Key={'cache_key': {'S': key}})
+
+
+class SqliteAnswerStore(AnswerStore):
+    """Local stand-in for DynamoDBAnswerStore. Defaults to an in-memory database."""
+
+    def __init__(self, path=":memory:"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers (cache_key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+        )
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM answers WHERE cache_key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def put(self, key, value, ttl):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl),
+            )
+
+    def delete(self, key):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM answers WHERE cache_key = ?", (key,))
+
+
+class AnswerCache:
+    """
+    Two-tier question-to-answer cache: a per-container LRU in front of an optional shared store.
+
+    Entries are stamped with the index version they were generated against. Once a Kendra sync
+    publishes a new version, older entries are treated as misses and dropped.
+    """
+
+    def __init__(self, lru=None, store=None, ttl=answer_cache_ttl):
+        self.lru = lru or LruCache(max_size=answer_cache_size, ttl=ttl)
+        self.store = store
+        self.ttl = ttl
+
+    @staticmethod
+    def key(question):
+        return hashlib.sha256(normalize_query(question).encode('utf-8')).hexdigest()
+
+    def get(self, question, index_version):
+        key = self.key(question)
+
+        entry = self.lru.get(key)
+        if entry is None and self.store is not None:
+            try:
+                entry = self.store.get(key)
+            except Exception as e:
+                logger.warning(f"Answer store lookup failed: {e}")
+            if entry is not None:
+                self.lru.put(key, entry)
+
+        if entry is None:
+            return None
+        if entry['index_version'] != index_version:
+            logger.info(f"Dropping answer cached for index version {entry['index_version']}")
+            self.invalidate(question)
+            return None
+        return entry
+
+    def put(self, question, index_version, answer, sources):
+        key = self.key(question)
+        entry = {'index_version': index_version, 'answer': answer, 'sources': sources}
+        self.lru.put(key, entry)
+        if self.store is not None:
+            try:
+                self.store.put(key, entry, self.ttl)
+            except Exception as e:
+                logger.warning(f"Answer store write failed: {e}")
+
+    def invalidate(self, question):
+        key = self.key(question)
+        self.lru.delete(key)
+        if self.store is not None:
+            try:
+                self.store.delete(key)
+            except Exception as e:
+                logger.warning(f"Answer store delete failed: {e}")
+
+
+def create_answer_cache():
+    store = DynamoDBAnswerStore(answer_cache_table) if answer_cache_table else None
+    return AnswerCache(store=store)
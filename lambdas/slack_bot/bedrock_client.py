@@ -0,0 +1,181 @@
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, HTTPClientError
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricUnit, MetricResolution
+
+from rate_limit import TokenBucket
+
+logger = Logger()
+metrics = Metrics()
+
+bedrock_max_attempts = int(os.environ.get('bedrock_max_attempts', 4))
+bedrock_base_delay = float(os.environ.get('bedrock_base_delay', 0.25))
+bedrock_max_delay = float(os.environ.get('bedrock_max_delay', 4))
+bedrock_requests_per_second = float(os.environ.get('bedrock_requests_per_second', 10))
+breaker_failure_threshold = int(os.environ.get('bedrock_breaker_failure_threshold', 5))
+breaker_reset_timeout = float(os.environ.get('bedrock_breaker_reset_timeout', 30))
+
+# Errors that mean the model is saturated rather than the request being wrong
+THROTTLING_ERRORS = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceQuotaExceededException',
+    'ServiceUnavailableException',
+    'ModelNotReadyException',
+}
+
+# Server-side failures worth another attempt; unlike throttles they do not count towards the breaker
+TRANSIENT_ERRORS = {
+    'InternalServerException',
+    'ModelTimeoutException',
+}
+# Connection failures and read timeouts, raised before or instead of a response
+NETWORK_ERRORS = (BotocoreConnectionError, HTTPClientError)
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+def add_count(name):
+    metrics.add_metric(name=name, unit=MetricUnit.Count, value=1, resolution=MetricResolution.High)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive throttles and rejects calls for `reset_timeout`
+    seconds. It then lets one trial call through; success closes it, and a trial that fails in
+    any other way, throttled or not, reopens it.
+    """
+
+    def __init__(self, failure_threshold=breaker_failure_threshold, reset_timeout=breaker_reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                return True
+            return self.state == CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_throttle(self):
+        """Returns True if this throttle opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_failure(self):
+        """A call that failed without being throttled. Only reopens the circuit when it was the trial call."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+class ResilientBedrock:
+    """
+    Wraps a bedrock-runtime client with client-side rate limiting, jittered exponential backoff
+    on throttling, transient server errors and network errors, a circuit breaker per model and
+    fallback to the next model in `model_ids`. The client itself should not retry.
+
+    Every decision is emitted as a metric: BedrockRateLimited, BedrockThrottled, BedrockTransientError,
+    BedrockRetry, BedrockCircuitOpened, BedrockCircuitRejected and BedrockFallback.
+    """
+
+    def __init__(
+            self,
+            client,
+            model_ids,
+            max_attempts=bedrock_max_attempts,
+            base_delay=bedrock_base_delay,
+            max_delay=bedrock_max_delay,
+            limiter=None,
+    ):
+        self.client = client
+        self.model_ids = model_ids
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = limiter or TokenBucket(rate=bedrock_requests_per_second)
+        self.breakers = {model_id: CircuitBreaker() for model_id in model_ids}
+
+    def invoke_model(self, body, **kwargs):
+        return self._invoke('invoke_model', body, **kwargs)
+
+    def invoke_model_with_response_stream(self, body, **kwargs):
+        return self._invoke('invoke_model_with_response_stream', body, **kwargs)
+
+    def _invoke(self, method, body, **kwargs):
+        last_error = None
+        for i, model_id in enumerate(self.model_ids):
+            if i:
+                logger.warning(f"Falling back to '{model_id}'")
+                add_count("BedrockFallback")
+
+            breaker = self.breakers[model_id]
+            if not breaker.allow_request():
+                logger.warning(f"Circuit open for '{model_id}', skipping")
+                add_count("BedrockCircuitRejected")
+                continue
+
+            succeeded = False
+            try:
+                for attempt in range(self.max_attempts):
+                    waited = self.limiter.acquire()
+                    if waited:
+                        add_count("BedrockRateLimited")
+
+                    try:
+                        response = getattr(self.client, method)(modelId=model_id, body=body, **kwargs)
+                    except (ClientError, *NETWORK_ERRORS) as e:
+                        code = e.response['Error']['Code'] if isinstance(e, ClientError) else type(e).__name__
+                        if isinstance(e, ClientError) and code not in THROTTLING_ERRORS | TRANSIENT_ERRORS:
+                            raise
+                        last_error = e
+                        if code in THROTTLING_ERRORS:
+                            add_count("BedrockThrottled")
+                            if breaker.record_throttle():
+                                logger.warning(f"Circuit opened for '{model_id}'")
+                                add_count("BedrockCircuitOpened")
+                                break
+                        else:
+                            add_count("BedrockTransientError")
+                        if attempt + 1 == self.max_attempts:
+                            break
+                        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                        logger.info(f"'{model_id}' failed with {code}, retrying in {delay:.2f}s")
+                        add_count("BedrockRetry")
+                        time.sleep(delay)
+                        continue
+
+                    breaker.record_success()
+                    succeeded = True
+                    return response
+            finally:
+                # However the attempts ended, a half-open trial must not leave the breaker half open
+                if not succeeded:
+                    breaker.record_failure()
+
+        logger.error(f"ERROR: All models throttled or unavailable: {self.model_ids}")
+        if last_error is not None:
+            raise last_error
+        raise Exception(f"Circuit open for all models: {self.model_ids}")
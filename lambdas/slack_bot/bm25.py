@@ -0,0 +1,63 @@
+import math
+from collections import Counter
+
+from citations import STOP_WORDS, TOKEN_PATTERN
+
+# Standard Okapi BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def terms(text):
+    """Lower-cased terms with stop words dropped, keeping names such as `py-numpy` or `spack.yaml` whole."""
+    tokens = (token.rstrip('.-') for token in TOKEN_PATTERN.findall(text.lower()))
+    return [token for token in tokens if token and token not in STOP_WORDS]
+
+
+def idf(document_frequency, document_count):
+    # Lucene's variant, which stays positive for terms found in most documents
+    return math.log(1 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+
+def score(query_terms, documents, k1=K1, b=B):
+    """
+    BM25 score of every document against the query, in document order.
+
+    `documents` are term Counters. Only the query's terms are looked up, so the cost is linear in
+    the number of documents times distinct query terms once the documents are counted.
+    """
+    if not documents:
+        return []
+    query = set(query_terms)
+    lengths = [sum(document.values()) for document in documents]
+    average_length = sum(lengths) / len(documents) or 1
+    weights = {
+        term: idf(sum(1 for document in documents if term in document), len(documents))
+        for term in query
+    }
+
+    scores = []
+    for document, length in zip(documents, lengths):
+        norm = k1 * (1 - b + b * length / average_length)
+        total = 0.0
+        for term, weight in weights.items():
+            frequency = document.get(term)
+            if frequency:
+                total += weight * frequency * (k1 + 1) / (frequency + norm)
+        scores.append(total)
+    return scores
+
+
+def count_terms(text, title="", title_boost=2):
+    """Term counts for a passage, with title terms counted `title_boost` times."""
+    # Same terms as `terms`, but counted first so stop words and trailing punctuation are handled
+    # once per distinct token rather than once per occurrence
+    counts = Counter(TOKEN_PATTERN.findall(text.lower()))
+    for token in [token for token in counts if token in STOP_WORDS or token[-1] in '.-']:
+        count = counts.pop(token)
+        token = token.rstrip('.-')
+        if token and token not in STOP_WORDS:
+            counts[token] += count
+    for term in terms(title):
+        counts[term] += title_boost
+    return counts
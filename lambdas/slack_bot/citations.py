@@ -0,0 +1,97 @@
+import re
+
+# Kendra retrieve results carry a confidence bucket rather than a numeric score
+SCORE_CONFIDENCE_RANK = {
+    "VERY_HIGH": 4,
+    "HIGH": 3,
+    "MEDIUM": 2,
+    "LOW": 1,
+    "NOT_AVAILABLE": 0,
+}
+# Score relative to the best result, mapped onto Kendra's confidence buckets for self-hosted retrievers
+CONFIDENCE_THRESHOLDS = [(0.8, "VERY_HIGH"), (0.6, "HIGH"), (0.4, "MEDIUM"), (0.0, "LOW")]
+
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "for", "from", "how", "i", "if", "in", "is",
+    "it", "of", "on", "or", "that", "the", "this", "to", "use", "with", "you", "your",
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9_+.\-]*")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def relative_confidence(relative_score):
+    return next(bucket for threshold, bucket in CONFIDENCE_THRESHOLDS if relative_score >= threshold)
+
+
+def result_score(result_item):
+    confidence = result_item.get('ScoreAttributes', {}).get('ScoreConfidence', "NOT_AVAILABLE")
+    return SCORE_CONFIDENCE_RANK.get(confidence, 0)
+
+
+def rank_results(result_items):
+    """Order retrieve results by score, keeping Kendra's order within the same confidence bucket."""
+    return sorted(result_items, key=result_score, reverse=True)
+
+
+def tokenize(text):
+    return {token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS}
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_PATTERN.split(text) if len(sentence.strip()) > 1]
+
+
+def attribute_sentences(answer, result_items, min_overlap=0.3):
+    """
+    Map each answer sentence to the passage sharing the largest fraction of its terms.
+
+    Returns (sentence, DocumentURI) pairs for sentences with at least `min_overlap` of their
+    terms found in a passage.
+    """
+    passages = [(item['DocumentURI'], tokenize(item['Content'])) for item in rank_results(result_items)]
+    attributions = []
+    for sentence in split_sentences(answer):
+        sentence_terms = tokenize(sentence)
+        if not sentence_terms:
+            continue
+        best_uri, best_overlap = None, 0.0
+        for uri, passage_terms in passages:
+            overlap = len(sentence_terms & passage_terms) / len(sentence_terms)
+            if overlap > best_overlap:
+                best_uri, best_overlap = uri, overlap
+        if best_uri is not None and best_overlap >= min_overlap:
+            attributions.append((sentence, best_uri))
+    return attributions
+
+
+def unique_uris(result_items):
+    uris = []
+    for item in rank_results(result_items):
+        uri = item.get('DocumentURI')
+        if uri and uri not in uris:
+            uris.append(uri)
+    return uris
+
+
+def build_sources(result_items, answer=None, max_sources=5):
+    """
+    Build the numbered "Sources" block straight from the retrieve results.
+
+    Links are deduped by DocumentURI and ordered by score. When `answer` is given, only the
+    passages the answer's sentences can be attributed to are cited, falling back to the top
+    results if nothing matches.
+    """
+    uris = unique_uris(result_items)
+    if answer:
+        cited = {uri for _, uri in attribute_sentences(answer, result_items)}
+        if cited:
+            uris = [uri for uri in uris if uri in cited]
+
+    uris = uris[:max_sources]
+    if not uris:
+        return ""
+
+    lines = ["*Sources:*"]
+    lines += [f" [{i}] {uri}" for i, uri in enumerate(uris, start=1)]
+    return "\n".join(lines)
@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+# boto3 sessions are not thread-safe, so clients are built from one session under a lock.
+# Network calls made with them (e.g. fetching the Slack token) still run concurrently.
+session = boto3.session.Session()
+session_lock = threading.Lock()
+
+
+def memoized(factory):
+    """
+    Defer `factory` to its first call and reuse the result for the life of the container.
+
+    `set(value)` replaces the memoized value, e.g. with a stand-in for local runs, and `reset()`
+    forgets it so the next call builds it again.
+    """
+    lock = threading.Lock()
+    state = {}
+
+    def get():
+        if 'value' not in state:
+            with lock:
+                if 'value' not in state:
+                    state['value'] = factory()
+        return state['value']
+
+    def set(value):
+        state['value'] = value
+
+    def reset():
+        state.pop('value', None)
+
+    get.set = set
+    get.reset = reset
+    get.__name__ = factory.__name__
+    get.__doc__ = factory.__doc__
+    return get
+
+
+def client(service_name, **kwargs):
+    with session_lock:
+        return session.client(service_name, **kwargs)
+
+
+@memoized
+def kendra():
+    return client("kendra")
+
+
+@memoized
+def bedrock_runtime():
+    # Retries, of throttles as well as 5xx and network errors, are left to ResilientBedrock so backoff,
+    # circuit breaking and fallback see every failure
+    return client(
+        "bedrock-runtime",
+        region_name=os.environ['AWS_REGION'],
+        config=Config(retries={'total_max_attempts': 1}),
+    )
+
+
+@memoized
+def secretsmanager():
+    return client('secretsmanager')
+
+
+@memoized
+def dynamodb():
+    return client('dynamodb')
+
+
+@memoized
+def sqs():
+    return client('sqs')
+
+
+@memoized
+def s3():
+    return client('s3')
+
+
+@memoized
+def ssm():
+    return client('ssm')
+
+
+@memoized
+def slack_token():
+    return json.loads(
+        secretsmanager().get_secret_value(
+            SecretId=os.environ.get('slack_token_arn')
+        )['SecretString']
+    )['token']
+
+
+def warm_up(*resources):
+    """Build or fetch independent resources concurrently, e.g. `warm_up(slack_token, kendra)`."""
+    with ThreadPoolExecutor(max_workers=max(len(resources), 1), thread_name_prefix="warm-up") as executor:
+        for future in [executor.submit(resource) for resource in resources]:
+            future.result()
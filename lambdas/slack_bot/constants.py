@@ -1,2 +1,4 @@
-slack_post_channel_url = 'https://slack.com/api/chat.postMessage'
 feedback_text = "\n\n_*React with 👍 or 👎 for feedback!*_"
+streaming_placeholder_text = " :hourglass_flowing_sand:"
+greeting_reply_text = " Hi! Ask me anything about Spack and I'll answer from the docs and past Slack threads."
+bare_mention_reply_text = " What would you like to know about Spack? Mention me with your question."
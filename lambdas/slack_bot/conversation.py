@@ -0,0 +1,204 @@
+import json
+import os
+import re
+import time
+from typing import NamedTuple
+
+from aws_lambda_powertools import Logger
+
+import clients
+from citations import split_sentences
+from packing import estimate_tokens, CHARS_PER_TOKEN
+from ttl_cache import LruCache
+
+logger = Logger()
+
+conversation_table = os.environ.get('conversation_table')
+conversation_ttl = float(os.environ.get('conversation_ttl', 7 * 24 * 60 * 60))
+conversation_cache_size = int(os.environ.get('conversation_cache_size', 512))
+# History carried into a follow-up prompt, summary included
+conversation_token_budget = int(os.environ.get('conversation_token_budget', 600))
+conversation_summary_budget = int(os.environ.get('conversation_summary_budget', 200))
+
+# Follow-ups shorter than this are retrieved together with the previous question
+SHORT_FOLLOW_UP_WORDS = 8
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class Turn(NamedTuple):
+    question: str
+    answer: str
+
+
+class Conversation(NamedTuple):
+    summary: str = ""
+    turns: tuple = ()
+    # Opening question of the thread, kept to anchor retrieval for short follow-ups
+    topic: str = ""
+
+    def __bool__(self):
+        return bool(self.summary or self.turns)
+
+    @property
+    def tokens(self):
+        return estimate_tokens(self.summary) + sum(
+            estimate_tokens(turn.question) + estimate_tokens(turn.answer) for turn in self.turns
+        )
+
+    def to_dict(self):
+        return {'summary': self.summary, 'turns': [list(turn) for turn in self.turns], 'topic': self.topic}
+
+    @classmethod
+    def from_dict(cls, value):
+        return cls(
+            summary=value['summary'],
+            turns=tuple(Turn(*turn) for turn in value['turns']),
+            topic=value.get('topic', ""),
+        )
+
+
+def clip(text, tokens):
+    text = WHITESPACE_PATTERN.sub(" ", text).strip()
+    limit = tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:max(limit - 3, 0)].rstrip() + "..."
+
+
+def summarize_turns(summary, turns, token_budget=conversation_summary_budget):
+    """
+    Fold `turns` into `summary` without a model call: one line per turn with the question and the
+    first sentence of its answer. The oldest lines are dropped once the summary exceeds its budget.
+    """
+    lines = summary.splitlines() if summary else []
+    for turn in turns:
+        sentences = split_sentences(turn.answer)
+        answer = sentences[0] if sentences else turn.answer
+        lines.append(f"- Asked: {clip(turn.question, 40)} Answered: {clip(answer, 40)}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > token_budget:
+        lines.pop(0)
+    summary = "\n".join(lines)
+    return summary if estimate_tokens(summary) <= token_budget else clip(summary, token_budget)
+
+
+def compact(conversation, token_budget=conversation_token_budget, summarize=summarize_turns):
+    """
+    Roll the oldest turns into the summary until the conversation fits `token_budget`.
+
+    The latest turn is always kept verbatim, with its answer clipped if it alone is over budget.
+    """
+    summary, turns = conversation.summary, list(conversation.turns)
+    while len(turns) > 1 and Conversation(summary, tuple(turns)).tokens > token_budget:
+        summary = summarize(summary, [turns.pop(0)])
+
+    if turns and Conversation(summary, tuple(turns)).tokens > token_budget:
+        question, answer = turns[-1]
+        remaining = token_budget - estimate_tokens(summary) - estimate_tokens(question)
+        turns[-1] = Turn(question, clip(answer, max(remaining, 0)))
+    return Conversation(summary, tuple(turns), conversation.topic)
+
+
+class ConversationStore:
+    """Conversation state by thread. Values are JSON-serializable dicts."""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def put(self, key, value, ttl):
+        raise NotImplementedError
+
+
+class DynamoDBConversationStore(ConversationStore):
+    """Table keyed on `thread_key` (S) with `expires_at` (N) as its TTL attribute."""
+
+    def __init__(self, table_name, client=None):
+        self.table_name = table_name
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or clients.dynamodb()
+
+    def get(self, key):
+        item = self.client.get_item(
+            TableName=self.table_name,
+            Key={'thread_key': {'S': key}},
+        ).get('Item')
+        if item is None or float(item['expires_at']['N']) <= time.time():
+            return None
+        return json.loads(item['value']['S'])
+
+    def put(self, key, value, ttl):
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                'thread_key': {'S': key},
+                'value': {'S': json.dumps(value)},
+                'expires_at': {'N': str(int(time.time() + ttl))},
+            },
+        )
+
+
+class InMemoryConversationStore(ConversationStore):
+    """Per-container stand-in for DynamoDBConversationStore."""
+
+    def __init__(self, max_size=conversation_cache_size):
+        self.lru = LruCache(max_size=max_size, ttl=conversation_ttl)
+
+    def get(self, key):
+        return self.lru.get(key)
+
+    def put(self, key, value, ttl):
+        self.lru.put(key, value, ttl)
+
+
+class ConversationMemory:
+    """
+    Bounded history of the questions and answers in each Slack thread.
+
+    Threads are keyed on channel and parent `thread_ts`. After every turn the history is
+    compacted to `token_budget`, so a follow-up carries at most that much context no matter how
+    long the thread gets. Store failures are logged and treated as an empty history.
+    """
+
+    def __init__(self, store, token_budget=conversation_token_budget, ttl=conversation_ttl):
+        self.store = store
+        self.token_budget = token_budget
+        self.ttl = ttl
+
+    @staticmethod
+    def key(channel, thread_ts):
+        return f"{channel}:{thread_ts}"
+
+    def get(self, channel, thread_ts):
+        try:
+            value = self.store.get(self.key(channel, thread_ts))
+        except Exception as e:
+            logger.warning(f"Conversation lookup failed: {e}")
+            return Conversation()
+        return Conversation() if value is None else Conversation.from_dict(value)
+
+    def record(self, channel, thread_ts, question, answer, history=None):
+        """Append a turn to `history`, or to the stored conversation when not given."""
+        if history is None:
+            history = self.get(channel, thread_ts)
+        topic = history.topic or clip(question, 40)
+        conversation = compact(
+            Conversation(history.summary, history.turns + (Turn(question, answer),), topic),
+            token_budget=self.token_budget,
+        )
+        try:
+            self.store.put(self.key(channel, thread_ts), conversation.to_dict(), self.ttl)
+        except Exception as e:
+            logger.warning(f"Conversation write failed: {e}")
+        return conversation
+
+
+def retrieval_query(question, history):
+    """Prefix short follow-ups with the thread's opening question, so "what about on macOS?" retrieves well."""
+    if not history.topic or len(question.split()) >= SHORT_FOLLOW_UP_WORDS:
+        return question
+    return f"{history.topic} {question}"
+
+
+def create_conversation_memory():
+    store = DynamoDBConversationStore(conversation_table) if conversation_table else InMemoryConversationStore()
+    return ConversationMemory(store)
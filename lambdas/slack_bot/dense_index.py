@@ -0,0 +1,251 @@
+import hashlib
+import json
+import math
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+import bm25
+import clients
+from bedrock_client import ResilientBedrock
+from rate_limit import TokenBucket
+from lexical_index import PassageIndex, map_arrays, passage_arrays, write_arrays
+
+MAGIC = b"RADVEC\x00\x01"
+
+# "bedrock" for a Bedrock embedding model, or "hashing" for the local embedder used offline
+dense_embedder = os.environ.get('dense_embedder', 'bedrock')
+embedding_model_id = os.environ.get('embedding_model_id', 'amazon.titan-embed-text-v2:0')
+embedding_dimensions = int(os.environ.get('embedding_dimensions', 512))
+embedding_workers = int(os.environ.get('embedding_workers', 8))
+embedding_requests_per_second = float(os.environ.get('embedding_requests_per_second', 20))
+# A nightly build makes thousands of calls, so it rides out throttling longer than a question would
+embedding_max_attempts = int(os.environ.get('embedding_max_attempts', 6))
+
+# Rows scored at once when dequantizing int8 vectors, bounding the temporary float32 copy
+SCORE_BLOCK_ROWS = 16384
+# Titan accepts about 8k tokens; passages are far shorter, questions are clipped like Kendra queries
+MAX_EMBED_CHARS = 20000
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.where(norms > 0, norms, 1)).astype(np.float32)
+
+
+class Embedder:
+    """Turns texts into unit-length float32 vectors. `name` identifies the vector space an index was built in."""
+
+    name = None
+    dimensions = None
+
+    def embed(self, texts):
+        """Return a (len(texts), dimensions) float32 array."""
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic bag-of-terms embedder: terms and adjacent term pairs are hashed into signed
+    buckets with sublinear weights. It needs no model or network, so indexes and searches are
+    reproducible offline, but it only matches shared words.
+    """
+
+    def __init__(self, dimensions=256):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    @lru_cache(maxsize=65536)
+    def _bucket(self, feature):
+        digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+        return digest % self.dimensions, 1.0 if digest >> 63 else -1.0
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            terms = bm25.terms(text)
+            features = Counter(terms + [f"{a} {b}" for a, b in zip(terms, terms[1:])])
+            for feature, count in features.items():
+                bucket, sign = self._bucket(feature)
+                vectors[row, bucket] += sign * (1 + math.log(count))
+        return normalize(vectors)
+
+
+class BedrockEmbedder(Embedder):
+    """
+    Amazon Titan text embeddings. The model takes one text per request, so batches fan out over
+    threads, all drawing on one ResilientBedrock for rate limiting and backoff on throttles.
+    """
+
+    def __init__(self, model_id=embedding_model_id, dimensions=embedding_dimensions, workers=embedding_workers,
+                 client=None, requests_per_second=embedding_requests_per_second, max_attempts=embedding_max_attempts):
+        self.model_id = model_id
+        self.dimensions = dimensions
+        self.workers = workers
+        self.name = f"{model_id}:{dimensions}"
+        self.requests_per_second = requests_per_second
+        self.max_attempts = max_attempts
+        self._client = client
+        self._bedrock = None
+
+    @property
+    def bedrock(self):
+        if self._bedrock is None:
+            self._bedrock = ResilientBedrock(
+                client=self._client or clients.bedrock_runtime(),
+                model_ids=[self.model_id],
+                max_attempts=self.max_attempts,
+                limiter=TokenBucket(rate=self.requests_per_second),
+            )
+        return self._bedrock
+
+    def embed(self, texts):
+        bedrock = self.bedrock
+
+        def embed_one(text):
+            response = bedrock.invoke_model(
+                body=json.dumps({'inputText': text[:MAX_EMBED_CHARS], 'dimensions': self.dimensions, 'normalize': True}),
+                contentType='application/json',
+                accept='application/json',
+            )
+            return json.loads(response['body'].read())['embedding']
+
+        if len(texts) == 1:
+            embeddings = [embed_one(texts[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed") as executor:
+                embeddings = list(executor.map(embed_one, texts))
+        return normalize(np.array(embeddings, dtype=np.float32).reshape(len(texts), self.dimensions))
+
+
+def create_embedder():
+    if dense_embedder == 'hashing':
+        return HashingEmbedder(embedding_dimensions)
+    return BedrockEmbedder()
+
+
+def passage_key(text, metadata):
+    """Content hash of a passage, used to carry its vector over to the next build."""
+    return hashlib.blake2b(f"{metadata['title']}\0{text}".encode('utf-8'), digest_size=16).digest()
+
+
+def quantize(vectors):
+    """Symmetric per-row int8 quantization, returning the int8 rows and their float32 scales."""
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def build_dense_index(passages, path, embedder, quantized=False, previous=None, batch_size=64):
+    """
+    Embed (text, metadata) `passages` and write them to `path` as a single file.
+
+    Passages whose content hash is found in `previous`, a DenseIndex built with the same
+    embedder, reuse its vectors, so a nightly rebuild only embeds new and changed chunks.
+    Vectors are stored normalized, as float32 or, when `quantized`, as int8 with a float32 scale
+    per row at a quarter of the size. Returns (passages indexed, passages embedded).
+    """
+    reusable = {}
+    if previous is not None and previous.embedder_name == embedder.name:
+        reusable = {previous.key(i): i for i in range(previous.passage_count)}
+
+    texts, metadata, keys = [], [], []
+    for text, passage_metadata in passages:
+        texts.append(text)
+        metadata.append(passage_metadata)
+        keys.append(passage_key(text, passage_metadata))
+
+    vectors = np.zeros((len(texts), embedder.dimensions), dtype=np.float32)
+    missing = []
+    for row, key in enumerate(keys):
+        if key in reusable:
+            vectors[row] = previous.vector(reusable[key])
+        else:
+            missing.append(row)
+    for start in range(0, len(missing), batch_size):
+        rows = missing[start:start + batch_size]
+        vectors[rows] = embedder.embed([texts[row] for row in rows])
+
+    arrays = {}
+    if quantized:
+        arrays['vectors'], arrays['scales'] = quantize(vectors)
+    else:
+        arrays['vectors'] = vectors
+    arrays['vectors'] = arrays['vectors'].reshape(-1)
+    arrays['keys'] = np.frombuffer(b"".join(keys), dtype=np.uint8)
+    arrays.update(passage_arrays(texts, metadata))
+
+    write_arrays(path, arrays, {
+        'passage_count': len(texts),
+        'dimensions': embedder.dimensions,
+        'embedder': embedder.name,
+        'quantized': quantized,
+    }, magic=MAGIC)
+    return len(texts), len(missing)
+
+
+class DenseIndex(PassageIndex):
+    """
+    Read-only vector index over a memory-mapped file written by `build_dense_index`.
+
+    The vectors form one contiguous (passages, dimensions) matrix, so a batch of queries is
+    scored with a single matrix product. Queries are embedded with `embedder`, which must be the
+    one the index was built with.
+    """
+
+    magic = MAGIC
+
+    def __init__(self, header, arrays, embedder=None):
+        super().__init__(header, arrays)
+        self.dimensions = header['dimensions']
+        self.embedder_name = header['embedder']
+        self.quantized = header['quantized']
+        self.vectors = self.vectors.reshape(self.passage_count, self.dimensions)
+        if embedder is not None and embedder.name != self.embedder_name:
+            raise ValueError(f"Index was built with {self.embedder_name}, not {embedder.name}")
+        self.embedder = embedder
+
+    @classmethod
+    def open(cls, path, embedder=None):
+        return cls(*map_arrays(path, cls.magic), embedder=embedder)
+
+    def key(self, passage_id):
+        return self.keys[passage_id * 16:(passage_id + 1) * 16].tobytes()
+
+    def vector(self, passage_id):
+        if self.quantized:
+            return self.vectors[passage_id].astype(np.float32) * self.scales[passage_id]
+        return self.vectors[passage_id]
+
+    def scores(self, queries):
+        """Dot products of normalized (queries, dimensions) `queries` with every passage."""
+        if not self.quantized:
+            return queries @ self.vectors.T
+        scores = np.empty((len(queries), self.passage_count), dtype=np.float32)
+        for start in range(0, self.passage_count, SCORE_BLOCK_ROWS):
+            block = self.vectors[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores * self.scales
+
+    def search_vectors(self, queries, top_k=10):
+        """(passage id, cosine similarity) pairs for the best `top_k` passages of each query, best first."""
+        queries = normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        if self.passage_count == 0:
+            return [[] for _ in queries]
+        scores = self.scores(queries)
+        top_k = min(top_k, self.passage_count)
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        results = []
+        for row, candidates in zip(scores, top):
+            ordered = candidates[np.argsort(-row[candidates], kind='stable')]
+            results.append([(int(i), float(row[i])) for i in ordered if row[i] > 0])
+        return results
+
+    def search_many(self, queries, top_k=10):
+        return self.search_vectors(self.embedder.embed(list(queries)), top_k=top_k)
+
+    def search(self, query, top_k=10):
+        return self.search_many([query], top_k=top_k)[0]
@@ -0,0 +1,35 @@
+import uuid
+
+from citations import relative_confidence
+
+# Damping constant from Cormack et al.; larger values flatten the advantage of the top ranks
+RRF_K = 60
+
+
+def passage_identity(item):
+    return item.get('DocumentId') or item.get('DocumentURI'), item['Content']
+
+
+def reciprocal_rank_fusion(responses, page_size=10, k=RRF_K):
+    """
+    Merge retrieve responses by reciprocal rank: each passage scores the sum of 1 / (k + rank)
+    over the responses it appears in, so only ranks matter and BM25 scores and cosine
+    similarities need no calibration against each other.
+
+    Passages are matched on document and text, and the first response's copy is kept. Returns a
+    Kendra Retrieve response with the best `page_size` passages.
+    """
+    fused = {}
+    for response in responses:
+        for rank, item in enumerate(response['ResultItems'], start=1):
+            identity = passage_identity(item)
+            score, first = fused.get(identity, (0.0, item))
+            fused[identity] = (score + 1 / (k + rank), first)
+
+    ranked = sorted(fused.values(), key=lambda entry: entry[0], reverse=True)[:page_size]
+    best = ranked[0][0] if ranked else 1.0
+    items = [
+        dict(item, Score=score, ScoreAttributes={'ScoreConfidence': relative_confidence(score / best)})
+        for score, item in ranked
+    ]
+    return {'QueryId': str(uuid.uuid4()), 'ResultItems': items}
@@ -0,0 +1,254 @@
+import os
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+import clients
+
+idempotency_table = os.environ.get('idempotency_table')
+# Longer than an answer takes, shorter than the gap before Slack's last retry (~5 minutes)
+in_progress_timeout = float(os.environ.get('idempotency_in_progress_timeout', 180))
+# Held by each answer worker attempt: longer than the queue's visibility timeout, so the lease
+# still stands when SQS redelivers after a failure
+worker_lease = float(os.environ.get('idempotency_worker_lease', 600))
+record_ttl = float(os.environ.get('idempotency_record_ttl', 24 * 60 * 60))
+
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETED = "COMPLETED"
+
+
+class LeaseHeldError(Exception):
+    """Another delivery of the same queued event holds its lease; SQS should redeliver this one later."""
+
+    def __init__(self, event_id):
+        super().__init__(f"Event {event_id} is held by another worker attempt")
+        self.event_id = event_id
+
+
+class IdempotencyStore:
+    """
+    Tracks Slack events by event_id through IN_PROGRESS -> COMPLETED.
+
+    `claim` succeeds for an unseen event, or for one whose IN_PROGRESS lease has run out because
+    the attempt holding it crashed or timed out. A failed attempt calls `release` so the next
+    retry is processed. Both return (claimed, status) where status is the state found.
+
+    An event handed to the answer queue is owned by one worker attempt at a time, identified by an
+    `owner` token. An attempt `renew`s the lease for `worker_lease` when it starts, which fails
+    while another attempt holds an unexpired lease, since SQS may deliver the same message twice.
+    It then either `complete`s the event or, on failure, `release`s it with its owner: the event
+    stays IN_PROGRESS for another lease, so Slack retries keep being acknowledged, but without an
+    owner so the next SQS delivery can take it.
+    """
+
+    def claim(self, event_id):
+        raise NotImplementedError
+
+    def complete(self, event_id, owner=None):
+        """Mark the event COMPLETED, only if `owner`, when given, still holds it. Returns whether it did."""
+        raise NotImplementedError
+
+    def renew(self, event_id, lease, owner):
+        """
+        Hold the event IN_PROGRESS for `owner` for another `lease` seconds. Succeeds unless it is
+        COMPLETED or another owner's lease has not run out yet. Returns (renewed, status).
+        """
+        raise NotImplementedError
+
+    def release(self, event_id, owner=None, lease=None):
+        """
+        Without an `owner`, forget an IN_PROGRESS event so the next Slack retry claims it. With one,
+        hand the event back: it stays IN_PROGRESS for `lease` seconds, unowned.
+        """
+        raise NotImplementedError
+
+    def status(self, event_id):
+        raise NotImplementedError
+
+
+class DynamoDBIdempotencyStore(IdempotencyStore):
+    """Table keyed on `event_id` (S) with `expires_at` (N) as its TTL attribute."""
+
+    def __init__(self, table_name, client=None):
+        self.table_name = table_name
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or clients.dynamodb()
+
+    def claim(self, event_id):
+        now = time.time()
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    'event_id': {'S': event_id},
+                    'status': {'S': IN_PROGRESS},
+                    'lease_expires_at': {'N': str(now + in_progress_timeout)},
+                    'expires_at': {'N': str(int(now + record_ttl))},
+                },
+                ConditionExpression=(
+                    "attribute_not_exists(event_id) OR (#status = :in_progress AND lease_expires_at < :now)"
+                ),
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':in_progress': {'S': IN_PROGRESS}, ':now': {'N': str(now)}},
+                ReturnValuesOnConditionCheckFailure='ALL_OLD',
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False, e.response.get('Item', {}).get('status', {}).get('S', IN_PROGRESS)
+        return True, None
+
+    def complete(self, event_id, owner=None):
+        names = {'#status': 'status'}
+        values = {
+            ':completed': {'S': COMPLETED},
+            ':expires_at': {'N': str(int(time.time() + record_ttl))},
+        }
+        condition = {}
+        if owner is not None:
+            names['#owner'] = 'owner'
+            values[':owner'] = {'S': owner}
+            condition['ConditionExpression'] = "#owner = :owner"
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={'event_id': {'S': event_id}},
+                UpdateExpression="SET #status = :completed, expires_at = :expires_at",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                **condition,
+            )
+        except ClientError as e:
+            # The lease ran out and another attempt took the event over; it completes it
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False
+        return True
+
+    def renew(self, event_id, lease, owner):
+        now = time.time()
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    'event_id': {'S': event_id},
+                    'status': {'S': IN_PROGRESS},
+                    'owner': {'S': owner},
+                    'lease_expires_at': {'N': str(now + lease)},
+                    'expires_at': {'N': str(int(now + record_ttl))},
+                },
+                ConditionExpression=(
+                    "attribute_not_exists(event_id) OR (#status = :in_progress AND "
+                    "(attribute_not_exists(#owner) OR #owner = :owner OR lease_expires_at < :now))"
+                ),
+                ExpressionAttributeNames={'#status': 'status', '#owner': 'owner'},
+                ExpressionAttributeValues={
+                    ':in_progress': {'S': IN_PROGRESS},
+                    ':owner': {'S': owner},
+                    ':now': {'N': str(now)},
+                },
+                ReturnValuesOnConditionCheckFailure='ALL_OLD',
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False, e.response.get('Item', {}).get('status', {}).get('S', COMPLETED)
+        return True, None
+
+    def release(self, event_id, owner=None, lease=None):
+        try:
+            if owner is None:
+                self.client.delete_item(
+                    TableName=self.table_name,
+                    Key={'event_id': {'S': event_id}},
+                    ConditionExpression="#status = :in_progress",
+                    ExpressionAttributeNames={'#status': 'status'},
+                    ExpressionAttributeValues={':in_progress': {'S': IN_PROGRESS}},
+                )
+            else:
+                self.client.update_item(
+                    TableName=self.table_name,
+                    Key={'event_id': {'S': event_id}},
+                    UpdateExpression="REMOVE #owner SET lease_expires_at = :lease_expires_at",
+                    ConditionExpression="#status = :in_progress AND #owner = :owner",
+                    ExpressionAttributeNames={'#status': 'status', '#owner': 'owner'},
+                    ExpressionAttributeValues={
+                        ':in_progress': {'S': IN_PROGRESS},
+                        ':owner': {'S': owner},
+                        ':lease_expires_at': {'N': str(time.time() + lease)},
+                    },
+                )
+        except ClientError as e:
+            # Already completed, or taken over by another attempt, keep the record
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+    def status(self, event_id):
+        item = self.client.get_item(
+            TableName=self.table_name,
+            Key={'event_id': {'S': event_id}},
+            ConsistentRead=True,
+        ).get('Item')
+        return None if item is None else item['status']['S']
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """Per-container stand-in for DynamoDBIdempotencyStore."""
+
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def claim(self, event_id):
+        now = time.time()
+        with self._lock:
+            record = self._records.get(event_id)
+            if record is not None and not (record['status'] == IN_PROGRESS and record['lease_expires_at'] < now):
+                return False, record['status']
+            self._records[event_id] = {'status': IN_PROGRESS, 'owner': None, 'lease_expires_at': now + in_progress_timeout}
+            return True, None
+
+    def complete(self, event_id, owner=None):
+        with self._lock:
+            record = self._records.get(event_id)
+            if owner is not None and (record is None or record['owner'] != owner):
+                return False
+            self._records[event_id] = {'status': COMPLETED, 'owner': None, 'lease_expires_at': None}
+            return True
+
+    def renew(self, event_id, lease, owner):
+        now = time.time()
+        with self._lock:
+            record = self._records.get(event_id)
+            if record is not None and (
+                    record['status'] != IN_PROGRESS
+                    or record['owner'] not in (None, owner) and record['lease_expires_at'] >= now
+            ):
+                return False, record['status']
+            self._records[event_id] = {'status': IN_PROGRESS, 'owner': owner, 'lease_expires_at': now + lease}
+            return True, None
+
+    def release(self, event_id, owner=None, lease=None):
+        with self._lock:
+            record = self._records.get(event_id)
+            if record is None or record['status'] != IN_PROGRESS:
+                return
+            if owner is None:
+                del self._records[event_id]
+            elif record['owner'] == owner:
+                self._records[event_id] = {'status': IN_PROGRESS, 'owner': None, 'lease_expires_at': time.time() + lease}
+
+    def status(self, event_id):
+        with self._lock:
+            record = self._records.get(event_id)
+            return None if record is None else record['status']
+
+
+def create_idempotency_store():
+    if idempotency_table:
+        return DynamoDBIdempotencyStore(idempotency_table)
+    return InMemoryIdempotencyStore()
@@ -5,22 +5,172 @@ from aws_lambda_powertools.metrics import MetricUnit, MetricResolution
 from aws_lambda_powertools import Tracer
 
 import json
-import boto3
 import os
+import uuid
 
-from slack import respond_to_question
-from prompts import get_question_prompt, get_source_prompt
-from rag import call_bedrock, kendra_retrieve
+from slack import respond_to_question, stream_response_to_question, post_reply
+from prompts import get_question_prompt
+from rag import bedrock, call_bedrock, stream_bedrock, retrieve, retriever, rerank
+from citations import build_sources
+from packing import pack_passages
+from work_queue import SqsWorkQueue
+from config_loader import ParameterLoader
+from answer_cache import create_answer_cache
+from retrieval_cache import RetrievalCache
+from idempotency import COMPLETED, LeaseHeldError, create_idempotency_store, worker_lease
+from conversation import create_conversation_memory, retrieval_query
+from router import create_router
+from timing import timed, record_count, PARAMETER_LOAD, RETRIEVE, RERANK, CONTEXT_PACK
+import clients
 
 
 parent_channel_param_name = os.environ.get('parent_channel_param_name')
 slackbot_member_id_param_name = os.environ.get('slackbot_member_id_param_name')
+answer_queue_url = os.environ.get('answer_queue_url')
+index_version_param_name = os.environ.get('index_version_param_name')
+stream_answers = os.environ.get('stream_answers', 'false').lower() == 'true'
 
 logger = Logger()
 metrics = Metrics()
 tracer = Tracer(service="Radiuss")
 
-ssm_client = boto3.client('ssm')
+parameters = ParameterLoader([parent_channel_param_name, slackbot_member_id_param_name, index_version_param_name])
+answer_cache = create_answer_cache()
+retrieval_cache = RetrievalCache(retrieve)
+idempotency_store = create_idempotency_store()
+conversation_memory = create_conversation_memory()
+router = create_router()
+
+# Split mode: acknowledge Slack right away and let the worker build the answer
+work_queue = SqsWorkQueue(answer_queue_url) if answer_queue_url else None
+
+
+@tracer.capture_method(capture_response=False)
+def load_parameters():
+    with timed(PARAMETER_LOAD):
+        return parameters.get_all()
+
+
+@tracer.capture_method(capture_response=False)
+def answer_question(channel, slack_user, ts, slack_text, thread_ts=None):
+    user_prompt = slack_text.replace('<@U06D5B8AR8R>', '').replace("<@SpackChatbot>", "")
+
+    # Replies go under the thread's parent message, which also keys the conversation
+    thread_ts = thread_ts or ts
+    history = conversation_memory.get(channel, thread_ts)
+
+    index_version = load_parameters()[index_version_param_name] if index_version_param_name else None
+
+    # A follow-up's answer depends on the thread so far, so only standalone questions are cached
+    cached = None if history else answer_cache.get(user_prompt, index_version)
+    if cached is not None:
+        logger.info("Answering from cache")
+        metrics.add_metric(name="AnswerCacheHit", unit=MetricUnit.Count, value=1, resolution=MetricResolution.High)
+        respond_to_question(
+            channel=channel,
+            slack_user=slack_user,
+            ts=thread_ts,
+            msg=cached['answer'],
+            sources=cached['sources'],
+        )
+        conversation_memory.record(channel, thread_ts, user_prompt, cached['answer'], history)
+        return
+
+    if history:
+        logger.info(f"Follow-up with {len(history.turns)} recent turns, ~{history.tokens} tokens of history")
+        metrics.add_metric(name="FollowUpQuestion", unit=MetricUnit.Count, value=1, resolution=MetricResolution.High)
+        record_count("HistoryTokens", history.tokens)
+    else:
+        metrics.add_metric(name="AnswerCacheMiss", unit=MetricUnit.Count, value=1, resolution=MetricResolution.High)
+
+    query = retrieval_query(user_prompt, history)
+    with timed(RETRIEVE):
+        result_items = retrieval_cache.retrieve(query, index_version)['ResultItems']
+    record_count("RetrievedPassages", len(result_items))
+
+    with timed(RERANK):
+        result_items = rerank(query, result_items)
+
+    with timed(CONTEXT_PACK):
+        context = pack_passages(result_items, ranked=True)
+    logger.info(f"Packed {len(context.items)} of {len(result_items)} re-ranked passages, ~{context.tokens} tokens")
+    record_count("PackedPassages", len(context.items))
+    record_count("ContextTokens", context.tokens)
+    result_items = context.items
+
+    question_prompt = get_question_prompt(user_prompt, context.passage_str, history)
+
+    if stream_answers:
+        answer, sources = stream_response_to_question(
+            channel=channel,
+            slack_user=slack_user,
+            ts=thread_ts,
+            chunks=stream_bedrock(question_prompt),
+            get_sources=lambda answer: build_sources(result_items, answer=answer),
+        )
+    else:
+        answer = call_bedrock(question_prompt)
+        sources = build_sources(result_items, answer=answer)
+        respond_to_question(
+            channel=channel,
+            slack_user=slack_user,
+            ts=thread_ts,
+            msg=answer,
+            sources=sources,
+        )
+
+    if not history:
+        answer_cache.put(user_prompt, index_version, answer, sources)
+    conversation_memory.record(channel, thread_ts, user_prompt, answer, history)
+
+
+@clients.memoized
+def warm_up():
+    """Fetch everything answering needs concurrently, once per container."""
+    clients.warm_up(clients.slack_token, parameters.get_all, retriever, bedrock)
+
+
+def complete_event(event_id, owner=None):
+    if event_id is not None:
+        idempotency_store.complete(event_id, owner)
+
+
+@tracer.capture_method(capture_response=False)
+def process_answer_request(message: dict, lease=None):
+    """
+    Answer a message claimed by lambda_handler. The worker passes a `lease`: each attempt holds the
+    event for that long under its own owner token, and hands it back rather than releasing it on
+    failure while SQS redelivers it. Raises LeaseHeldError while another delivery of the same
+    message holds the event.
+    """
+    event_id = message.get('event_id')
+    owner = None
+    if event_id is not None and lease is not None:
+        owner = str(uuid.uuid4())
+        renewed, status = idempotency_store.renew(event_id, lease, owner)
+        if not renewed and status == COMPLETED:
+            logger.info(f"Event {event_id} is {status}, skipping duplicate delivery")
+            return
+        if not renewed:
+            raise LeaseHeldError(event_id)
+
+    logger.info(f"Answering queued message from execution: {message['execution_id']}")
+    warm_up()
+    try:
+        answer_question(
+            channel=message['channel'],
+            slack_user=message['user'],
+            ts=message['ts'],
+            slack_text=message['text'],
+            thread_ts=message.get('thread_ts'),
+        )
+    except Exception:
+        if event_id is not None:
+            # A worker keeps the event leased, unowned, over the wait until SQS redelivers it; after
+            # the last attempt the lease runs out on its own
+            idempotency_store.release(event_id, owner, lease)
+        raise
+    complete_event(event_id, owner)
 
 
 @logger.inject_lambda_context(log_event=True)
@@ -36,14 +186,9 @@ def lambda_handler(event: dict, context: LambdaContext):
     metrics.add_metric(name="SlackBotLambdaInvocation", unit=MetricUnit.Count, value=1, resolution=MetricResolution.High)
     metrics.add_metadata(key="execution_id", value=execution_id)
 
-    logger.info(f"Loading parameters")
-    parent_channel = ssm_client.get_parameter(Name=parent_channel_param_name)['Parameter']['Value']
-    slackbot_member_id = ssm_client.get_parameter(Name=slackbot_member_id_param_name)['Parameter']['Value']
-    general_channel = parent_channel
-
-    # Dont do anything if retry
-    if 'x-slack-retry-num' in event['headers']:
-        slk_retry = event['headers']['x-slack-retry-num']
+    # Slack retries events it did not get a 200 for within 3 seconds
+    slk_retry = event['headers'].get('x-slack-retry-num')
+    if slk_retry is not None:
         logger.info({"slk_retry": slk_retry})
         metrics.add_metric(
             name="Retry",
@@ -51,11 +196,6 @@ def lambda_handler(event: dict, context: LambdaContext):
             value=1,
             resolution=MetricResolution.High
         )
-        metrics.add_metadata(key="execution_id", value=execution_id)
-        return {
-            'statusCode': 200,
-            'body': json.dumps({'msg': f"Retry: {slk_retry}"})
-        }
 
     slack_body = json.loads(event['body'])
     if slack_body.get("type") == "url_verification":
@@ -72,8 +212,31 @@ def lambda_handler(event: dict, context: LambdaContext):
             'body': slack_body['challenge']
         }
 
+    logger.info(f"Loading parameters")
+    config = load_parameters()
+    parent_channel = config[parent_channel_param_name]
+    slackbot_member_id = config[slackbot_member_id_param_name]
+    general_channel = parent_channel
+
     event = slack_body.get('event')
 
+    # Acknowledge retries of events that are already done or still being worked on
+    event_id = slack_body.get('event_id')
+    if event_id is not None:
+        claimed, status = idempotency_store.claim(event_id)
+        if not claimed:
+            logger.info(f"Event {event_id} is {status}, acknowledging retry: {slk_retry}")
+            metrics.add_metric(
+                name="DuplicateEvent",
+                unit=MetricUnit.Count,
+                value=1,
+                resolution=MetricResolution.High
+            )
+            return {
+                'statusCode': 200,
+                'body': json.dumps({'msg': f"Retry: {slk_retry}"})
+            }
+
     # Thumbs down
     if event['type'] == "reaction_added" and event['item_user'] == slackbot_member_id and event["reaction"] == "-1":
         logger.info("Thumbs down detected!")
@@ -86,6 +249,7 @@ def lambda_handler(event: dict, context: LambdaContext):
         metrics.add_metadata(key="execution_id", value=execution_id)
 
         logger.info(f"slack_body -> event -> item: {slack_body['event']['item']}")
+        complete_event(event_id)
 
         return {
             'statusCode': 200,
@@ -102,6 +266,7 @@ def lambda_handler(event: dict, context: LambdaContext):
             resolution=MetricResolution.High
         )
         metrics.add_metadata(key="execution_id", value=execution_id)
+        complete_event(event_id)
 
         return {
             'statusCode': 200,
@@ -119,27 +284,70 @@ def lambda_handler(event: dict, context: LambdaContext):
         )
         metrics.add_metadata(key="execution_id", value=execution_id)
 
-        slack_text = event.get('text')
-        user_prompt = slack_text.replace('<@U06D5B8AR8R>', '').replace("<@SpackChatbot>", "")
-
-        passage_str = ""
-        passage_w_links_str = ""
-        for passages in kendra_retrieve(user_prompt)['ResultItems']:
-            logger.info(f"passage: {passages['Content']}")
-            passage_str += "\n\n\n" + passages['Content']
-            passage_w_links_str += "\nSource Link: " + passages['DocumentURI']
-            passage_w_links_str += "\n\n\n" + passages['Content'] + "---------------------------------------------"
+        # Greetings, thanks and the like get a canned reply or none, without retrieval or a model call
+        route = router.route(event.get('text'))
+        metrics.add_metric(name=f"Route{route.name}", unit=MetricUnit.Count, value=1, resolution=MetricResolution.High)
+        if route.fast_path:
+            logger.info(f"Fast path: {route.name}")
+            metrics.add_metric(
+                name="FastPathMessage",
+                unit=MetricUnit.Count,
+                value=1,
+                resolution=MetricResolution.High
+            )
+            if route.reply is not None:
+                try:
+                    post_reply(
+                        channel=event.get('channel'),
+                        slack_user=event.get('user'),
+                        ts=event.get('thread_ts') or event.get('ts'),
+                        text=route.reply,
+                    )
+                except Exception:
+                    if event_id is not None:
+                        idempotency_store.release(event_id)
+                    raise
+            complete_event(event_id)
+            return {
+                'statusCode': 200,
+                'body': json.dumps({'msg': f"fast path: {route.name}"})
+            }
 
-        question_prompt = get_question_prompt(user_prompt, passage_str)
-        source_prompt = get_source_prompt(user_prompt, passage_w_links_str)
+        if work_queue is not None:
+            try:
+                work_queue.send({
+                    'execution_id': execution_id,
+                    'event_id': event_id,
+                    'channel': event.get('channel'),
+                    'user': event.get('user'),
+                    'ts': event.get('ts'),
+                    'text': event.get('text'),
+                    'thread_ts': event.get('thread_ts'),
+                })
+            except Exception:
+                if event_id is not None:
+                    idempotency_store.release(event_id)
+                raise
+            metrics.add_metric(
+                name="QueuedMessage",
+                unit=MetricUnit.Count,
+                value=1,
+                resolution=MetricResolution.High
+            )
+            return {
+                'statusCode': 200,
+                'body': json.dumps({'msg': "message queued"})
+            }
 
-        respond_to_question(
-            channel=event.get('channel'),
-            slack_user=event.get('user'),
-            ts=event.get('ts'),
-            msg=call_bedrock(question_prompt),
-            sources=call_bedrock(source_prompt),
-        )
+        process_answer_request({
+            'execution_id': execution_id,
+            'event_id': event_id,
+            'channel': event.get('channel'),
+            'user': event.get('user'),
+            'ts': event.get('ts'),
+            'text': event.get('text'),
+            'thread_ts': event.get('thread_ts'),
+        })
 
         return {
             'statusCode': 200,
@@ -155,8 +363,33 @@ def lambda_handler(event: dict, context: LambdaContext):
     )
 
     metrics.add_metadata(key="execution_id", value=execution_id)
+    complete_event(event_id)
 
     return {
         'statusCode': 200,
         'body': json.dumps({'msg': "Unknown Criteria"})
     }
+
+
+@logger.inject_lambda_context(log_event=True)
+@metrics.log_metrics(capture_cold_start_metric=True)
+@tracer.capture_lambda_handler
+def worker_handler(event: dict, context: LambdaContext):
+    metrics.add_dimension(name="Application", value="Radiuss")
+
+    batch_item_failures = []
+    for record in event['Records']:
+        try:
+            process_answer_request(json.loads(record['body']), lease=worker_lease)
+            metrics.add_metric(name="AnsweredQueuedMessage", unit=MetricUnit.Count, value=1, resolution=MetricResolution.High)
+        except LeaseHeldError as e:
+            # A duplicate delivery; once its twin completes the event, the redelivery is skipped
+            logger.info(f"Deferring queued message {record['messageId']}: {e}")
+            metrics.add_metric(name="DeferredQueuedMessage", unit=MetricUnit.Count, value=1, resolution=MetricResolution.High)
+            batch_item_failures.append({'itemIdentifier': record['messageId']})
+        except Exception as e:
+            logger.exception(f"Failed to answer queued message {record['messageId']}: {e}")
+            metrics.add_metric(name="FailedQueuedMessage", unit=MetricUnit.Count, value=1, resolution=MetricResolution.High)
+            batch_item_failures.append({'itemIdentifier': record['messageId']})
+
+    return {'batchItemFailures': batch_item_failures}
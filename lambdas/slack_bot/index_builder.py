@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricUnit, MetricResolution
+from aws_lambda_powertools import Tracer
+
+from lexical_index import build_index, document_passages
+from dense_index import DenseIndex, build_dense_index, create_embedder
+import clients
+
+logger = Logger()
+metrics = Metrics()
+tracer = Tracer(service="Radiuss")
+
+processed_bucket_names = [name for name in os.environ.get('processed_bucket_names', '').split(',') if name]
+lexical_index_bucket = os.environ.get('lexical_index_bucket')
+lexical_index_key = os.environ.get('lexical_index_key', 'lexical/index.bin')
+# Optional vector index, rebuilt incrementally from the previous one when set
+dense_index_key = os.environ.get('dense_index_key')
+dense_quantized = os.environ.get('dense_quantized', 'false').lower() == 'true'
+download_workers = int(os.environ.get('index_download_workers', 16))
+index_version_param_name = os.environ.get('index_version_param_name')
+# The backend the bot retrieves from; with "kendra" the self-hosted indexes do not affect answers
+retriever_backend = os.environ.get('retriever_backend', 'kendra')
+
+METADATA_SUFFIX = ".metadata.json"
+# User metadata on an uploaded index holding the SHA-256 of the file
+CONTENT_HASH_METADATA = 'content-sha256'
+
+
+def list_documents(bucket):
+    """Keys of the chunks in a processed bucket, each of which has a `<key>.metadata.json` beside it."""
+    paginator = clients.s3().get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket):
+        for item in page.get('Contents', []):
+            if not item['Key'].endswith(METADATA_SUFFIX) and not item['Key'].endswith('/'):
+                yield bucket, item['Key']
+
+
+def read_document(location):
+    bucket, key = location
+    s3_client = clients.s3()
+    text = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8')
+    try:
+        metadata = json.loads(s3_client.get_object(Bucket=bucket, Key=key + METADATA_SUFFIX)['Body'].read())
+    except s3_client.exceptions.NoSuchKey:
+        logger.warning(f"No metadata for s3://{bucket}/{key}, indexing it without a source link")
+        metadata = {}
+    uri = metadata.get('Attributes', {}).get('_source_uri', f"s3://{bucket}/{key}")
+    return f"{bucket}/{key}", metadata.get('Title', key), uri, text
+
+
+def previous_dense_index(path):
+    """The last dense index, whose vectors are reused for unchanged passages, or None on the first build."""
+    try:
+        clients.s3().download_file(lexical_index_bucket, dense_index_key, path)
+    except clients.s3().exceptions.ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+            raise
+        return None
+    return DenseIndex.open(path)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def stored_hash(key):
+    try:
+        response = clients.s3().head_object(Bucket=lexical_index_bucket, Key=key)
+    except clients.s3().exceptions.ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+            raise
+        return None
+    return response.get('Metadata', {}).get(CONTENT_HASH_METADATA)
+
+
+def upload_index(path, key, metric_name):
+    """
+    Upload the index at `path` unless the stored one has the same content hash. Builds are
+    deterministic, so an unchanged corpus leaves the index, and the bots' copies of it, as they
+    are. Returns the hash and whether it changed.
+    """
+    digest = file_hash(path)
+    if stored_hash(key) == digest:
+        logger.info(f"s3://{lexical_index_bucket}/{key} is unchanged")
+        return digest, False
+
+    size = os.path.getsize(path)
+    clients.s3().upload_file(path, lexical_index_bucket, key, ExtraArgs={'Metadata': {CONTENT_HASH_METADATA: digest}})
+    logger.info(f"Uploaded {size} bytes to s3://{lexical_index_bucket}/{key}")
+    metrics.add_metric(name=metric_name, unit=MetricUnit.Bytes, value=size, resolution=MetricResolution.High)
+    return digest, True
+
+
+def publish_index_version(uploads):
+    """
+    Publish the build as the new index version when an index the bot retrieves from changed,
+    invalidating answers and retrievals cached against the old one. Kendra's own syncs are
+    published by the index_version Lambda. `uploads` are `upload_index` results; returns the
+    version published, or None.
+    """
+    if not index_version_param_name or retriever_backend == 'kendra':
+        return None
+    if not any(changed for _, changed in uploads):
+        logger.info("Indexes unchanged, keeping the index version")
+        return None
+    content_hash = hashlib.sha256("".join(digest for digest, _ in uploads).encode('utf-8')).hexdigest()
+    version = f"index-build:{content_hash[:16]}"
+    clients.ssm().put_parameter(Name=index_version_param_name, Value=version, Overwrite=True)
+    logger.info(f"Index version is now {version}")
+    return version
+
+
+@logger.inject_lambda_context(log_event=True)
+@metrics.log_metrics(capture_cold_start_metric=True)
+@tracer.capture_lambda_handler
+def lambda_handler(event: dict, context: LambdaContext):
+    metrics.add_dimension(name="Application", value="Radiuss")
+
+    locations = [location for bucket in processed_bucket_names for location in list_documents(bucket)]
+    logger.info(f"Indexing {len(locations)} documents from {processed_bucket_names}")
+
+    with ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix="index-download") as executor:
+        documents = list(executor.map(read_document, locations))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "index.bin")
+        passages = build_index(documents, path)
+        uploads = [upload_index(path, lexical_index_key, "LexicalIndexBytes")]
+        metrics.add_metric(name="LexicalIndexPassages", unit=MetricUnit.Count, value=passages, resolution=MetricResolution.High)
+
+        if dense_index_key:
+            dense_path = os.path.join(directory, "dense.bin")
+            previous = previous_dense_index(os.path.join(directory, "previous.bin"))
+            passages, embedded = build_dense_index(
+                document_passages(documents), dense_path, create_embedder(), quantized=dense_quantized, previous=previous,
+            )
+            uploads.append(upload_index(dense_path, dense_index_key, "DenseIndexBytes"))
+            logger.info(f"Embedded {embedded} new or changed passages of {passages}")
+            metrics.add_metric(name="DenseIndexPassages", unit=MetricUnit.Count, value=passages, resolution=MetricResolution.High)
+            metrics.add_metric(name="DenseIndexEmbeddedPassages", unit=MetricUnit.Count, value=embedded, resolution=MetricResolution.High)
+
+    publish_index_version(uploads)
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'msg': "Index built", 'documents': len(locations), 'passages': passages})
+    }
@@ -0,0 +1,254 @@
+import bisect
+import json
+import mmap
+import re
+import uuid
+
+import numpy as np
+
+import bm25
+from citations import relative_confidence
+
+MAGIC = b"RADBM25\x01"
+ALIGNMENT = 8
+
+# Roughly the size of a Kendra Retrieve passage
+PASSAGE_WORDS = 200
+PARAGRAPH_PATTERN = re.compile(r"\n\s*\n")
+
+
+def split_passages(text, passage_words=PASSAGE_WORDS):
+    """Split a chunk into passages of about `passage_words` words, on paragraph boundaries where possible."""
+    passages = []
+    current = []
+    current_words = 0
+    for paragraph in PARAGRAPH_PATTERN.split(text):
+        words = paragraph.split()
+        if not words:
+            continue
+        if current and current_words + len(words) > passage_words:
+            passages.append("\n\n".join(current))
+            current, current_words = [], 0
+        # Paragraphs longer than a passage are cut on word boundaries
+        while len(words) > passage_words:
+            passages.append(" ".join(words[:passage_words]))
+            words = words[passage_words:]
+            paragraph = " ".join(words)
+        current.append(paragraph)
+        current_words += len(words)
+    if current:
+        passages.append("\n\n".join(current))
+    return passages
+
+
+def document_passages(documents):
+    """(passage text, metadata) for every passage of (document_id, title, uri, text) `documents`."""
+    for document_id, title, uri, text in documents:
+        for passage in split_passages(text):
+            yield passage, {'document_id': document_id, 'title': title, 'uri': uri}
+
+
+def build_index(documents, path, k1=bm25.K1, b=bm25.B):
+    """
+    Build a BM25 index over `documents` and write it to `path` as a single file.
+
+    `documents` yields (document_id, title, uri, text) tuples, e.g. a processed-bucket chunk and
+    its .metadata.json. Each is split into passages, which are what a search returns. Returns
+    the number of passages indexed.
+
+    The file is a fixed header, a JSON table of contents and a run of aligned arrays: the sorted
+    vocabulary, per-term IDF and posting lists (passage ids and term frequencies), per-passage
+    length norms, and the passage texts and metadata. `LexicalIndex.open` maps it without
+    copying any of them.
+    """
+    postings = {}
+    lengths = []
+    texts = []
+    metadata = []
+    for passage, passage_metadata in document_passages(documents):
+        passage_id = len(texts)
+        counts = bm25.count_terms(passage, passage_metadata['title'])
+        for term, frequency in counts.items():
+            postings.setdefault(term, []).append((passage_id, frequency))
+        lengths.append(sum(counts.values()))
+        texts.append(passage)
+        metadata.append(passage_metadata)
+
+    passage_count = len(texts)
+    average_length = sum(lengths) / passage_count if passage_count else 1.0
+    terms = sorted(postings)
+    term_bytes = [term.encode('utf-8') for term in terms]
+
+    posting_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    posting_offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+    posting_passages = np.empty(posting_offsets[-1], dtype=np.uint32)
+    posting_frequencies = np.empty(posting_offsets[-1], dtype=np.uint16)
+    for i, term in enumerate(terms):
+        entries = postings[term]
+        posting_passages[posting_offsets[i]:posting_offsets[i + 1]] = [passage_id for passage_id, _ in entries]
+        posting_frequencies[posting_offsets[i]:posting_offsets[i + 1]] = [
+            min(frequency, np.iinfo(np.uint16).max) for _, frequency in entries
+        ]
+
+    arrays = {
+        'term_bytes': np.frombuffer(b"".join(term_bytes), dtype=np.uint8),
+        'term_offsets': offsets([len(term) for term in term_bytes]),
+        'idf': np.array([bm25.idf(len(postings[term]), passage_count) for term in terms], dtype=np.float32),
+        'posting_offsets': posting_offsets,
+        'posting_passages': posting_passages,
+        'posting_frequencies': posting_frequencies,
+        'norms': (k1 * (1 - b + b * np.array(lengths, dtype=np.float32) / average_length)).astype(np.float32),
+    }
+    arrays.update(passage_arrays(texts, metadata))
+
+    write_arrays(path, arrays, {'k1': k1, 'passage_count': passage_count, 'term_count': len(terms)})
+    return passage_count
+
+
+def passage_arrays(texts, metadata):
+    """Passage texts and metadata dicts as byte arrays with offsets, as read by `PassageIndex`."""
+    arrays = {}
+    for name, values in [('text', texts), ('metadata', [json.dumps(m) for m in metadata])]:
+        encoded = [value.encode('utf-8') for value in values]
+        arrays[f'{name}_bytes'] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        arrays[f'{name}_offsets'] = offsets([len(value) for value in encoded])
+    return arrays
+
+
+def offsets(sizes):
+    result = np.zeros(len(sizes) + 1, dtype=np.int64)
+    result[1:] = np.cumsum(sizes)
+    return result
+
+
+def write_arrays(path, arrays, header, magic=MAGIC):
+    # Array data starts after the header, at offsets relative to that start
+    table = {}
+    position = 0
+    for name, values in arrays.items():
+        position = -(-position // ALIGNMENT) * ALIGNMENT
+        table[name] = [values.dtype.str, position, len(values)]
+        position += values.nbytes
+    contents = json.dumps(dict(header, arrays=table)).encode('utf-8')
+    data_start = -(-(len(magic) + 8 + len(contents)) // ALIGNMENT) * ALIGNMENT
+
+    with open(path, 'wb') as f:
+        f.write(magic)
+        f.write(len(contents).to_bytes(8, 'little'))
+        f.write(contents)
+        for name, values in arrays.items():
+            f.write(b"\0" * (data_start + table[name][1] - f.tell()))
+            f.write(values.tobytes())
+
+
+def map_arrays(path, magic=MAGIC):
+    """Map a file written by `write_arrays`, returning its header and read-only views of its arrays."""
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(magic)] != magic:
+        raise ValueError(f"{path} does not start with {magic!r}")
+    header_length = int.from_bytes(buffer[len(magic):len(magic) + 8], 'little')
+    header_end = len(magic) + 8 + header_length
+    header = json.loads(buffer[len(magic) + 8:header_end])
+    data_start = -(-header_end // ALIGNMENT) * ALIGNMENT
+    arrays = {
+        name: np.frombuffer(buffer, dtype=np.dtype(dtype), count=count, offset=data_start + offset)
+        for name, (dtype, offset, count) in header['arrays'].items()
+    }
+    return header, arrays
+
+
+class PassageIndex:
+    """
+    Passages and their metadata over arrays mapped by `map_arrays`.
+
+    Subclasses implement `search`, returning (passage id, score) pairs best first, and
+    `retrieve` turns those into the same shape as Kendra's Retrieve API.
+    """
+
+    magic = MAGIC
+
+    def __init__(self, header, arrays):
+        self.passage_count = header['passage_count']
+        for name, values in arrays.items():
+            setattr(self, name, values)
+
+    @classmethod
+    def open(cls, path):
+        return cls(*map_arrays(path, cls.magic))
+
+    def _string(self, name, i):
+        offsets = getattr(self, f'{name}_offsets')
+        return getattr(self, f'{name}_bytes')[offsets[i]:offsets[i + 1]].tobytes().decode('utf-8')
+
+    def metadata(self, passage_id):
+        return json.loads(self._string('metadata', passage_id))
+
+    def text(self, passage_id):
+        return self._string('text', passage_id)
+
+    def search(self, query, top_k=10):
+        raise NotImplementedError
+
+    def retrieve(self, query, page_size=10):
+        return result_page(self, self.search(query, top_k=page_size))
+
+
+def result_page(index, results):
+    """Kendra Retrieve response for (passage id, score) pairs, confidence bucketed relative to the best score."""
+    best = results[0][1] if results else 1.0
+    items = []
+    for passage_id, score in results:
+        metadata = index.metadata(passage_id)
+        items.append({
+            'Id': f"{metadata['document_id']}-{passage_id}",
+            'DocumentId': metadata['document_id'],
+            'DocumentTitle': metadata['title'],
+            'DocumentURI': metadata['uri'],
+            'Content': index.text(passage_id),
+            'Score': score,
+            'ScoreAttributes': {'ScoreConfidence': relative_confidence(score / best if best > 0 else 0.0)},
+        })
+    return {'QueryId': str(uuid.uuid4()), 'ResultItems': items}
+
+
+class LexicalIndex(PassageIndex):
+    """
+    Read-only BM25 index over a memory-mapped file written by `build_index`.
+
+    Only the pages a query touches are read, so opening is cheap regardless of corpus size.
+    `retrieve` returns the same shape as Kendra's Retrieve API.
+    """
+
+    def __init__(self, header, arrays):
+        super().__init__(header, arrays)
+        self.k1 = header['k1']
+        self.term_count = header['term_count']
+
+    def term_id(self, term):
+        target = term.encode('utf-8')
+        i = bisect.bisect_left(range(self.term_count), target, key=self._term)
+        return i if i < self.term_count and self._term(i) == target else None
+
+    def _term(self, i):
+        return self.term_bytes[self.term_offsets[i]:self.term_offsets[i + 1]].tobytes()
+
+    def search(self, query, top_k=10):
+        """Return (passage id, BM25 score) pairs for the best `top_k` passages, best first."""
+        scores = np.zeros(self.passage_count, dtype=np.float32)
+        for term in set(bm25.terms(query)):
+            i = self.term_id(term)
+            if i is None:
+                continue
+            start, end = self.posting_offsets[i], self.posting_offsets[i + 1]
+            passages = self.posting_passages[start:end]
+            frequencies = self.posting_frequencies[start:end].astype(np.float32)
+            # A term appears once per posting list, so plain fancy-index assignment accumulates correctly
+            scores[passages] += self.idf[i] * frequencies * (self.k1 + 1) / (frequencies + self.norms[passages])
+
+        matches = np.flatnonzero(scores)
+        if len(matches) > top_k:
+            matches = matches[np.argpartition(-scores[matches], top_k - 1)[:top_k]]
+        matches = matches[np.argsort(-scores[matches], kind='stable')]
+        return [(int(i), float(scores[i])) for i in matches]
+
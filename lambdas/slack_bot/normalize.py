@@ -0,0 +1,24 @@
+import re
+
+MENTION_PATTERN = re.compile(r"<[@#!][^>]*>")
+# Spec sigils are always kept; `.-/@` only when a token follows, as in `.spack`, `@12.1` or `py-numpy`
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s+~^%.\-/@]|[.\-/@](?!\w)")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def strip_mentions(text):
+    """Remove Slack mention tokens such as <@U06D5B8AR8R> or <@SpackChatbot>."""
+    return MENTION_PATTERN.sub(" ", text)
+
+
+def normalize_query(text):
+    """
+    Reduce a question to a canonical form for cache keys.
+
+    Mentions, case, punctuation and whitespace differences are dropped, while characters that
+    matter in Spack specs and commands (e.g. `py-numpy`, `gcc@12.1`, `+cuda`, `~mpi`, `^openmpi`,
+    `%gcc`) are kept.
+    """
+    text = strip_mentions(text).lower()
+    text = PUNCTUATION_PATTERN.sub(" ", text)
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
@@ -0,0 +1,96 @@
+import os
+import re
+from typing import NamedTuple
+
+from aws_lambda_powertools import Tracer
+
+from citations import SCORE_CONFIDENCE_RANK, rank_results, result_score
+
+context_token_budget = int(os.environ.get('context_token_budget', 3000))
+context_top_k = int(os.environ.get('context_top_k', 8))
+context_min_confidence = os.environ.get('context_min_confidence', "NOT_AVAILABLE")
+near_duplicate_threshold = float(os.environ.get('near_duplicate_threshold', 0.8))
+
+# Rough English average for Anthropic tokenizers, good enough for budgeting
+CHARS_PER_TOKEN = 4
+SHINGLE_SIZE = 3
+WORD_PATTERN = re.compile(r"\w+")
+PASSAGE_SEPARATOR = "\n\n\n"
+
+tracer = Tracer(service="Radiuss")
+
+
+class PackedContext(NamedTuple):
+    items: list
+    passage_str: str
+    tokens: int
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def shingles(text):
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def is_near_duplicate(candidate, kept, threshold):
+    for other in kept:
+        union = len(candidate | other)
+        if union and len(candidate & other) / union >= threshold:
+            return True
+    return False
+
+
+@tracer.capture_method(capture_response=False)
+def pack_passages(
+        result_items,
+        token_budget=context_token_budget,
+        top_k=context_top_k,
+        min_confidence=context_min_confidence,
+        duplicate_threshold=near_duplicate_threshold,
+        ranked=False,
+):
+    """
+    Select retrieve results for the prompt within a token budget.
+
+    Results are taken in score order, or as given when `ranked` (e.g. after `rag.rerank`),
+    skipping those below `min_confidence` and near-duplicates (word 3-gram Jaccard similarity of
+    at least `duplicate_threshold`) of passages already kept. Packing stops at `top_k` passages;
+    a passage that no longer fits the budget is skipped in favour of smaller ones further down,
+    except the first, which is truncated to fit.
+    """
+    min_score = SCORE_CONFIDENCE_RANK[min_confidence]
+    items = []
+    contents = []
+    kept_shingles = []
+    tokens = 0
+
+    for item in (result_items if ranked else rank_results(result_items)):
+        if len(items) >= top_k:
+            break
+        if result_score(item) < min_score:
+            continue
+
+        content = item['Content']
+        content_shingles = shingles(content)
+        if is_near_duplicate(content_shingles, kept_shingles, duplicate_threshold):
+            continue
+
+        content_tokens = estimate_tokens(PASSAGE_SEPARATOR + content)
+        if tokens + content_tokens > token_budget:
+            if items:
+                continue
+            content = content[:token_budget * CHARS_PER_TOKEN - len(PASSAGE_SEPARATOR)]
+            content_tokens = estimate_tokens(PASSAGE_SEPARATOR + content)
+
+        items.append(item)
+        contents.append(content)
+        kept_shingles.append(content_shingles)
+        tokens += content_tokens
+
+    passage_str = "".join(PASSAGE_SEPARATOR + content for content in contents)
+    return PackedContext(items=items, passage_str=passage_str, tokens=tokens)
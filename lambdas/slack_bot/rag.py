@@ -1,17 +1,50 @@
-import boto3
 import json
 import os
+import tempfile
+import threading
+import time
 
 from aws_lambda_powertools import Logger
+from aws_lambda_powertools import Tracer
+
+import bm25
+from fusion import reciprocal_rank_fusion
+from bedrock_client import ResilientBedrock
+from citations import result_score, SCORE_CONFIDENCE_RANK
+from ttl_cache import LruCache
+from timing import timed, record_latency, record_tokens, MODEL, MODEL_FIRST_TOKEN
+import clients
+
 logger = Logger()
+tracer = Tracer(service="Radiuss")
 
-bedrock = boto3.client("bedrock-runtime", region_name=os.environ['AWS_REGION'])
-kendra = boto3.client("kendra")
 kendra_index_id = os.environ['kendra_index_id']
 model_id = os.environ['model_id']
+fallback_model_ids = [m for m in os.environ.get('fallback_model_ids', '').split(',') if m]
+# "kendra", "lexical" or "dense" for the indexes built by index_builder.py, or "hybrid" to fuse those two
+retriever_backend = os.environ.get('retriever_backend', 'kendra')
+lexical_index_uri = os.environ.get('lexical_index_uri')
+dense_index_uri = os.environ.get('dense_index_uri')
+# How often a warm container checks the self-hosted indexes on S3 for a rebuild
+index_refresh_interval = float(os.environ.get('index_refresh_interval', 300))
+retrieve_page_size = int(os.environ.get('retrieve_page_size', 10))
+rerank_top_n = int(os.environ.get('rerank_top_n', 5))
+# Share of the re-rank score given to Kendra's own confidence, the rest is lexical
+rerank_kendra_weight = float(os.environ.get('rerank_kendra_weight', 0.3))
+# Only the first results in retrieve order are re-ranked. Tokenizing a ~200 word passage not yet in
+# passage_terms_cache takes ~0.1 ms, so 8 keeps a re-rank under 1 ms where 100 results took ~11 ms
+rerank_max_candidates = int(os.environ.get('rerank_max_candidates', 8))
 
+# Popular passages come back for many questions, so their term counts are kept per container
+passage_terms_cache = LruCache(max_size=int(os.environ.get('passage_terms_cache_size', 2048)), ttl=24 * 60 * 60)
 
-def call_bedrock(prompt):
+
+@clients.memoized
+def bedrock():
+    return ResilientBedrock(client=clients.bedrock_runtime(), model_ids=[model_id] + fallback_model_ids)
+
+
+def build_request(prompt):
     native_request = {
         "anthropic_version": "bedrock-2023-05-31",
         "max_tokens": 1024,
@@ -24,24 +57,227 @@ def call_bedrock(prompt):
         ],
     }
 
-    request = json.dumps(native_request)
+    return json.dumps(native_request)
+
+
+@tracer.capture_method(capture_response=False)
+def call_bedrock(prompt):
+    request = build_request(prompt)
 
     try:
-        response = bedrock.invoke_model(modelId=model_id, body=request)
+        with timed(MODEL):
+            response = bedrock().invoke_model(body=request)
+            model_response = json.loads(response["body"].read())
 
     except Exception as e:
         logger.error(f"ERROR: Can't invoke '{model_id}'. Reason: {e}")
         raise e
 
-    model_response = json.loads(response["body"].read())
+    usage = model_response.get("usage", {})
+    record_tokens(usage.get("input_tokens"), usage.get("output_tokens"))
 
     response_text = model_response["content"][0]["text"]
     logger.info({"response_text": response_text})
     return response_text.replace("<template>", "").replace("</template>", "")
 
 
+@tracer.capture_method(capture_response=False)
+def stream_bedrock(prompt):
+    """
+    Invoke the model with a response stream, yielding text deltas as they arrive.
+
+    Records the time to the first delta as well as the whole call, which includes the time the
+    caller spends between deltas.
+    """
+    request = build_request(prompt)
+
+    with timed(MODEL):
+        start = time.perf_counter()
+        try:
+            response = bedrock().invoke_model_with_response_stream(body=request)
+
+        except Exception as e:
+            logger.error(f"ERROR: Can't invoke '{model_id}' with response stream. Reason: {e}")
+            raise e
+
+        first_token = True
+        for event in response["body"]:
+            chunk = json.loads(event["chunk"]["bytes"])
+            # Prompt tokens arrive with message_start, the final output count with message_delta
+            if chunk["type"] == "message_start":
+                record_tokens(prompt_tokens=chunk["message"].get("usage", {}).get("input_tokens"))
+            elif chunk["type"] == "message_delta":
+                record_tokens(output_tokens=chunk.get("usage", {}).get("output_tokens"))
+            elif chunk["type"] == "content_block_delta" and chunk["delta"]["type"] == "text_delta":
+                if first_token:
+                    record_latency(MODEL_FIRST_TOKEN, (time.perf_counter() - start) * 1000)
+                    first_token = False
+                yield chunk["delta"]["text"]
+
+
+@tracer.capture_method(capture_response=False)
 def kendra_retrieve(query):
-    return kendra.retrieve(
+    return clients.kendra().retrieve(
         IndexId=kendra_index_id,
         QueryText=query[:999]
     )
+
+
+class RefreshingIndex:
+    """
+    An index opened from a local copy of `uri`, and reopened once the file behind it changes.
+
+    s3://bucket/key URIs are downloaded to /tmp and their ETag is checked at most every
+    `refresh_interval` seconds, so warm containers pick up the nightly rebuild. If a check fails,
+    the index already open keeps serving. Local paths are opened once.
+    """
+
+    def __init__(self, uri, open_index, refresh_interval=None):
+        self.uri = uri
+        self.open_index = open_index
+        self.refresh_interval = index_refresh_interval if refresh_interval is None else refresh_interval
+        self._index = None
+        self._etag = None
+        self._path = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _stale(self):
+        if self._index is None:
+            return True
+        return self._checked_at is not None and time.monotonic() - self._checked_at >= self.refresh_interval
+
+    def get(self):
+        if self._stale():
+            with self._lock:
+                if self._stale():
+                    self._refresh()
+        return self._index
+
+    def _refresh(self):
+        if not self.uri.startswith("s3://"):
+            self._index = self.open_index(self.uri)
+            return
+        bucket, key = self.uri[len("s3://"):].split("/", 1)
+        try:
+            etag = clients.s3().head_object(Bucket=bucket, Key=key)['ETag'].strip('"')
+        except Exception as e:
+            if self._index is None:
+                raise
+            logger.warning(f"Could not check {self.uri} for changes, keeping the open index: {e}")
+            self._checked_at = time.monotonic()
+            return
+        self._checked_at = time.monotonic()
+        if etag == self._etag:
+            return
+
+        path = os.path.join(tempfile.gettempdir(), f"{key.replace('/', '_')}.{etag}")
+        clients.s3().download_file(bucket, key, path + ".part")
+        os.replace(path + ".part", path)
+        self._index = self.open_index(path)
+        logger.info(f"Opened {self.uri} at ETag {etag}")
+        previous, self._etag, self._path = self._path, etag, path
+        if previous is not None:
+            # Requests still holding the old index keep their mapping of it after the unlink
+            os.remove(previous)
+
+
+def open_lexical_index(path):
+    # Imported here so NumPy only loads when this backend is in use
+    from lexical_index import LexicalIndex
+    return LexicalIndex.open(path)
+
+
+def open_dense_index(path):
+    from dense_index import DenseIndex, create_embedder
+    return DenseIndex.open(path, create_embedder())
+
+
+@clients.memoized
+def lexical_index_file():
+    return RefreshingIndex(lexical_index_uri, open_lexical_index)
+
+
+@clients.memoized
+def dense_index_file():
+    return RefreshingIndex(dense_index_uri, open_dense_index)
+
+
+def lexical_index():
+    return lexical_index_file().get()
+
+
+@tracer.capture_method(capture_response=False)
+def lexical_retrieve(query):
+    return lexical_index().retrieve(query[:999], page_size=retrieve_page_size)
+
+
+def dense_index():
+    return dense_index_file().get()
+
+
+@tracer.capture_method(capture_response=False)
+def dense_retrieve(query):
+    return dense_index().retrieve(query[:999], page_size=retrieve_page_size)
+
+
+def hybrid_retrieve(query):
+    """Lexical and dense results fused by reciprocal rank, so paraphrases and exact names both find passages."""
+    return reciprocal_rank_fusion([lexical_retrieve(query), dense_retrieve(query)], page_size=retrieve_page_size)
+
+
+def retriever():
+    """The configured backend's client or indexes, built on first use."""
+    if retriever_backend == 'lexical':
+        return lexical_index()
+    if retriever_backend == 'dense':
+        return dense_index()
+    if retriever_backend == 'hybrid':
+        return lexical_index(), dense_index()
+    return clients.kendra()
+
+
+def retrieve(query):
+    """Retrieve passages for `query` from the configured backend, in Kendra Retrieve's response shape."""
+    if retriever_backend == 'lexical':
+        return lexical_retrieve(query)
+    if retriever_backend == 'dense':
+        return dense_retrieve(query)
+    if retriever_backend == 'hybrid':
+        return hybrid_retrieve(query)
+    return kendra_retrieve(query)
+
+
+def passage_terms(item):
+    key = (item.get('DocumentTitle', ""), item['Content'])
+    counts = passage_terms_cache.get(key)
+    if counts is None:
+        counts = bm25.count_terms(item['Content'], item.get('DocumentTitle', ""))
+        passage_terms_cache.put(key, counts)
+    return counts
+
+
+def rerank(question, result_items, top_n=rerank_top_n, kendra_weight=rerank_kendra_weight,
+           max_candidates=rerank_max_candidates):
+    """
+    Re-order the first `max_candidates` retrieve results by BM25 against the question and keep
+    the best `top_n`.
+
+    Titles count twice, and the normalized BM25 score is blended with Kendra's confidence
+    bucket by `kendra_weight`, so a confident semantic match is not dropped for sharing few
+    words with the question. Ties keep Kendra's order.
+    """
+    result_items = result_items[:max_candidates]
+    if len(result_items) <= 1:
+        return list(result_items)
+
+    documents = [passage_terms(item) for item in result_items]
+    lexical = bm25.score(bm25.terms(question), documents)
+    top_lexical = max(lexical) or 1
+    top_confidence = max(SCORE_CONFIDENCE_RANK.values())
+    scores = [
+        (1 - kendra_weight) * lexical_score / top_lexical + kendra_weight * result_score(item) / top_confidence
+        for item, lexical_score in zip(result_items, lexical)
+    ]
+    order = sorted(range(len(result_items)), key=lambda i: -scores[i])
+    return [result_items[i] for i in order[:top_n]]
@@ -0,0 +1,75 @@
+import os
+import time
+
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricUnit, MetricResolution
+
+from normalize import normalize_query
+from ttl_cache import LruCache
+
+logger = Logger()
+metrics = Metrics()
+
+retrieval_cache_ttl = float(os.environ.get('retrieval_cache_ttl', 60 * 60))
+retrieval_cache_size = int(os.environ.get('retrieval_cache_size', 512))
+
+# Weight of the newest sample in the moving average of retrieve latency
+LATENCY_SMOOTHING = 0.2
+
+
+class RetrievalCache:
+    """
+    Caches retrieve results by normalized query text.
+
+    Entries are stamped with the index version current when they were fetched, so a re-index
+    invalidates them without an explicit purge. Each hit reports the retrieve latency it saved,
+    estimated from a moving average of the misses.
+    """
+
+    def __init__(self, retrieve, max_size=retrieval_cache_size, ttl=retrieval_cache_ttl):
+        self._retrieve = retrieve
+        self.entries = LruCache(max_size=max_size, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self.average_latency_ms = None
+
+    def retrieve(self, query, index_version=None):
+        key = normalize_query(query)
+        entry = self.entries.get(key)
+
+        if entry is not None and entry['index_version'] == index_version:
+            self.hits += 1
+            metrics.add_metric(name="RetrieveCacheHit", unit=MetricUnit.Count, value=1, resolution=MetricResolution.High)
+            if self.average_latency_ms is not None:
+                metrics.add_metric(
+                    name="RetrieveLatencySaved",
+                    unit=MetricUnit.Milliseconds,
+                    value=self.average_latency_ms,
+                    resolution=MetricResolution.High
+                )
+            self._report_hit_rate()
+            return entry['result']
+
+        self.misses += 1
+        metrics.add_metric(name="RetrieveCacheMiss", unit=MetricUnit.Count, value=1, resolution=MetricResolution.High)
+        self._report_hit_rate()
+
+        start = time.perf_counter()
+        result = self._retrieve(query)
+        latency_ms = (time.perf_counter() - start) * 1000
+        if self.average_latency_ms is None:
+            self.average_latency_ms = latency_ms
+        else:
+            self.average_latency_ms += LATENCY_SMOOTHING * (latency_ms - self.average_latency_ms)
+
+        self.entries.put(key, {'index_version': index_version, 'result': result})
+        return result
+
+    def _report_hit_rate(self):
+        metrics.add_metric(
+            name="RetrieveCacheHitRate",
+            unit=MetricUnit.Percent,
+            value=100 * self.hits / (self.hits + self.misses),
+            resolution=MetricResolution.High
+        )
@@ -0,0 +1,100 @@
+import os
+import re
+from typing import NamedTuple
+
+from constants import greeting_reply_text, bare_mention_reply_text
+from normalize import strip_mentions, normalize_query
+
+# Optional classifier for messages the rules leave undecided; see Router
+router_model_threshold = float(os.environ.get('router_model_threshold', 0.9))
+
+RAG = "Rag"
+GREETING = "Greeting"
+THANKS = "Thanks"
+BARE_MENTION = "BareMention"
+EMOJI_ONLY = "EmojiOnly"
+
+EMOJI_SHORTCODE_PATTERN = re.compile(r":[a-z0-9_+\-']+:")
+EMOJI_PATTERN = re.compile(
+    "[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\u2190-\u21FF\u2300-\u23FF\uFE0F\u200D\u20E3]"
+)
+WORD_PATTERN = re.compile(r"\w")
+
+# Longer messages always go to retrieval, however they start
+MAX_FAST_PATH_WORDS = 8
+
+GREETING_WORDS = {'hi', 'hello', 'hey', 'heya', 'hiya', 'howdy', 'yo', 'greetings', 'morning', 'afternoon', 'evening'}
+THANKS_WORDS = {'thanks', 'thank', 'thx', 'ty', 'tysm', 'cheers', 'appreciated', 'appreciate', 'kudos'}
+ACKNOWLEDGEMENT_WORDS = {'ok', 'okay', 'got', 'it', 'perfect', 'great', 'awesome', 'cool', 'nice', 'works', 'worked'}
+# Words that may accompany a greeting or thanks without making it a question
+FILLER_WORDS = {
+    'good', 'there', 'all', 'everyone', 'folks', 'team', 'bot', 'spackbot', 'you', 'so', 'much', 'very', 'a', 'lot',
+    'again', 'for', 'the', 'help', 'that', 'this', 'man', 'mate', 'buddy', 'i', 'really', 'oh', 'ah',
+}
+
+
+class Route(NamedTuple):
+    name: str
+    # Text to post in the thread, or None to leave the message unanswered
+    reply: str = None
+
+    @property
+    def fast_path(self):
+        return self.name != RAG
+
+
+def rule_route(text):
+    """Classify with local rules only. Returns None when the message is not obviously trivial."""
+    text = strip_mentions(text)
+    if '?' in text:
+        return None
+
+    without_emoji = EMOJI_PATTERN.sub(" ", EMOJI_SHORTCODE_PATTERN.sub(" ", text))
+    if not WORD_PATTERN.search(without_emoji):
+        return EMOJI_ONLY if without_emoji.strip() != text.strip() else BARE_MENTION
+
+    words = normalize_query(without_emoji).split()
+    if len(words) > MAX_FAST_PATH_WORDS:
+        return None
+    words = set(words)
+    if words & GREETING_WORDS and words <= GREETING_WORDS | FILLER_WORDS:
+        return GREETING
+    closing_words = THANKS_WORDS | ACKNOWLEDGEMENT_WORDS
+    if words & closing_words and words <= closing_words | FILLER_WORDS:
+        return THANKS
+    return None
+
+
+class Router:
+    """
+    Decides whether a message needs retrieval and a model call, or a canned reply or none at all.
+
+    Local rules catch greetings, thanks, bare mentions and emoji-only messages. Messages the
+    rules leave undecided may be given to `model`, a callable returning (route name, probability)
+    for short texts; its decision is only taken at `threshold` or above. Anything else goes to
+    the full RAG path, so a miss costs an answer, never a question going unanswered.
+    """
+
+    def __init__(self, replies, model=None, threshold=router_model_threshold):
+        self.replies = replies
+        self.model = model
+        self.threshold = threshold
+
+    def route(self, text):
+        name = rule_route(text or "")
+        if name is None and self.model is not None and len((text or "").split()) <= MAX_FAST_PATH_WORDS:
+            predicted, probability = self.model(text)
+            if predicted in self.replies and probability >= self.threshold:
+                name = predicted
+        if name is None:
+            return Route(RAG)
+        return Route(name, self.replies[name])
+
+
+def create_router():
+    return Router(replies={
+        GREETING: greeting_reply_text,
+        BARE_MENTION: bare_mention_reply_text,
+        THANKS: None,
+        EMOJI_ONLY: None,
+    })
@@ -1,54 +1,116 @@
-import boto3
 import os
-import json
-import urllib3
-from constants import slack_post_channel_url, feedback_text
+import time
+import clients
+from timing import timed, SLACK_POST
+from constants import feedback_text, streaming_placeholder_text
+from slack_client import SlackClient, SlackAuthError, SlackError
 
 from aws_lambda_powertools import Logger
+from aws_lambda_powertools import Tracer
 
 logger = Logger()
+tracer = Tracer(service="Radiuss")
 
-http = urllib3.PoolManager()
+# SlackPostLatency covers each HTTP request, not rate-limiter waits or skipped streaming updates
+client = SlackClient(token=clients.slack_token, request_timer=lambda method: timed(SLACK_POST))
 
-secretsmanager_client = boto3.client('secretsmanager')
-slack_token = json.loads(
-    secretsmanager_client.get_secret_value(
-        SecretId=os.environ.get('slack_token_arn')
-    )['SecretString']
-)['token']
+# Validate the token once per container, or every slack_token_validation_ttl seconds when set
+slack_token_validation_ttl = os.environ.get('slack_token_validation_ttl')
+token_validated_at = None
 
-headers = {
-    'Authorization': f'Bearer {slack_token}',
-    'Content-Type': 'application/json',
-}
+# Minimum seconds between chat.update calls while streaming, chat.update is a Tier 3 method
+stream_update_interval = float(os.environ.get('stream_update_interval', 1.5))
 
 
-def verify_slack_token(slack_token):
-    test_url = "https://slack.com/api/auth.test"
-    headers = {"Authorization": f"Bearer {slack_token}"}
-    response = http.request('POST', test_url, headers=headers)
-    data = json.loads(response.data.decode('utf-8'))
-    if data['ok']:
-        logger.info(f"Token is valid for workspace: {data['team']}")
-        logger.info(f"Associated with user: {data['user']}")
-        return True
-    else:
-        logger.error(f"Token validation failed: {data['error']}")
-        return False
+def ensure_valid_token():
+    global token_validated_at
 
+    if token_validated_at is not None and (
+            slack_token_validation_ttl is None
+            or time.monotonic() - token_validated_at < float(slack_token_validation_ttl)
+    ):
+        return
 
-def respond_to_question(channel, slack_user, ts, msg, sources):
+    if not client.verify_token():
+        token_validated_at = None
+        raise Exception("Invalid Slack token or wrong workspace.")
+    token_validated_at = time.monotonic()
+
+
+def call_slack(method, optional=False, **params):
+    """
+    Call a Slack method through the shared client. `optional` calls are skipped, returning None,
+    when the method's rate-limit bucket is empty rather than waiting for it.
+    """
+    global token_validated_at
+
+    try:
+        return client.try_call(method, **params) if optional else client.call(method, **params)
+    except SlackAuthError as e:
+        logger.error(f"Slack rejected the token: {e.error}")
+        # The secret may have been rotated, so fetch it again before re-validating
+        clients.slack_token.reset()
+        token_validated_at = None
+        ensure_valid_token()
+        raise
 
-    if not verify_slack_token(slack_token):
-        Exception("Invalid Slack token or wrong workspace.")
+
+@tracer.capture_method(capture_response=False)
+def post_reply(channel, slack_user, ts, text):
+    """Post a short reply in the message's thread, without sources or the feedback prompt."""
+    ensure_valid_token()
+    call_slack('chat.postMessage', channel=channel, text=f"<@{slack_user}>" + text, thread_ts=ts)
+
+
+@tracer.capture_method(capture_response=False)
+def respond_to_question(channel, slack_user, ts, msg, sources):
+    ensure_valid_token()
 
     # Respond in message thread
     chatbot_response = msg + '\n' + sources + feedback_text
-    data = {
-        'channel': channel,
-        'text': f"<@{slack_user}>" + chatbot_response,
-        'thread_ts': ts,
-    }
-    response = http.request('POST', slack_post_channel_url, headers=headers, body=json.dumps(data))
-    response = json.loads(response.data.decode('utf-8'))
+    response = call_slack('chat.postMessage', channel=channel, text=f"<@{slack_user}>" + chatbot_response, thread_ts=ts)
+    logger.info(f"Chatbot response: {response}")
+
+
+@tracer.capture_method(capture_response=False)
+def stream_response_to_question(channel, slack_user, ts, chunks, get_sources):
+    """
+    Post a placeholder in the thread and edit it in place as answer chunks arrive.
+
+    Updates are throttled to one per `stream_update_interval` seconds. Once the stream ends the
+    message is replaced with the full answer and the sources built from it by `get_sources`.
+    Returns the answer and sources.
+
+    If the stream or the final edit fails, the partial message is deleted before the error is
+    re-raised, so a retry starts from a clean thread.
+    """
+    ensure_valid_token()
+
+    mention = f"<@{slack_user}>"
+    response = call_slack('chat.postMessage', channel=channel, text=mention + streaming_placeholder_text, thread_ts=ts)
+    message_ts = response['ts']
+
+    try:
+        answer = ""
+        last_update = time.monotonic()
+        for chunk in chunks:
+            answer += chunk
+            if time.monotonic() - last_update >= stream_update_interval:
+                try:
+                    call_slack('chat.update', optional=True, channel=channel, ts=message_ts,
+                               text=mention + answer + streaming_placeholder_text)
+                except SlackError as e:
+                    # A missed progress update is replaced by the next one, only the final edit must land
+                    logger.warning(f"Skipped a streaming update: {e}")
+                last_update = time.monotonic()
+
+        sources = get_sources(answer)
+        response = call_slack('chat.update', channel=channel, ts=message_ts, text=mention + answer + '\n' + sources + feedback_text)
+    except Exception:
+        try:
+            call_slack('chat.delete', channel=channel, ts=message_ts)
+        except SlackError as e:
+            logger.warning(f"Could not delete the partial answer {message_ts}: {e}")
+        raise
     logger.info(f"Chatbot response: {response}")
+    return answer, sources
@@ -0,0 +1,47 @@
+import time
+from contextlib import contextmanager
+
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricUnit, MetricResolution
+
+metrics = Metrics()
+
+# Answer pipeline stages, each reported as a `<stage>Latency` metric in milliseconds
+PARAMETER_LOAD = "ParameterLoad"
+RETRIEVE = "Retrieve"
+RERANK = "Rerank"
+CONTEXT_PACK = "ContextPack"
+MODEL = "Model"
+MODEL_FIRST_TOKEN = "ModelFirstToken"
+SLACK_POST = "SlackPost"
+
+
+def record_latency(stage, milliseconds):
+    metrics.add_metric(
+        name=f"{stage}Latency",
+        unit=MetricUnit.Milliseconds,
+        value=milliseconds,
+        resolution=MetricResolution.High
+    )
+
+
+def record_count(name, value):
+    metrics.add_metric(name=name, unit=MetricUnit.Count, value=value, resolution=MetricResolution.High)
+
+
+@contextmanager
+def timed(stage):
+    """Record how long the block takes as the `stage` latency, whether or not it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_latency(stage, (time.perf_counter() - start) * 1000)
+
+
+def record_tokens(prompt_tokens=None, output_tokens=None):
+    """Record the token counts of a model call, as reported in the Anthropic `usage` block."""
+    if prompt_tokens is not None:
+        record_count("PromptTokens", prompt_tokens)
+    if output_tokens is not None:
+        record_count("OutputTokens", output_tokens)
@@ -0,0 +1,78 @@
+import json
+import queue
+import threading
+import uuid
+
+from aws_lambda_powertools import Logger
+
+import clients
+
+logger = Logger()
+
+
+class SqsWorkQueue:
+    """Hands answer requests over to the worker Lambda through an SQS queue."""
+
+    def __init__(self, queue_url, client=None):
+        self.queue_url = queue_url
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or clients.sqs()
+
+    def send(self, message: dict):
+        response = self.client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(message))
+        logger.info(f"Queued answer request: {response['MessageId']}")
+        return response['MessageId']
+
+
+class InMemoryWorkQueue:
+    """
+    In-process stand-in for SqsWorkQueue.
+
+    Messages go through the same JSON round trip as SQS and are consumed by a pool of daemon
+    threads, so the fast-ack handler and the answer worker can be driven together locally.
+    """
+
+    def __init__(self, consumer, workers=4):
+        self.consumer = consumer
+        self.failed = []
+        self._queue = queue.Queue()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"answer-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def send(self, message: dict):
+        message_id = str(uuid.uuid4())
+        self._queue.put((message_id, json.dumps(message)))
+        return message_id
+
+    def join(self):
+        """Block until every queued message has been consumed."""
+        self._queue.join()
+
+    def close(self):
+        self.join()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                message_id, body = item
+                try:
+                    self.consumer(json.loads(body))
+                except Exception as e:
+                    logger.error(f"Answer request {message_id} failed: {e}")
+                    self.failed.append(message_id)
+            finally:
+                self._queue.task_done()
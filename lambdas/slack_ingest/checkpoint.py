@@ -0,0 +1,119 @@
+import json
+from typing import NamedTuple
+
+from botocore.exceptions import ClientError
+
+
+class Checkpoint(NamedTuple):
+	# ts of the newest message ingested so far
+	watermark: str
+	# Parent ts -> latest_reply ts, for threads that had replies within the active window
+	threads: dict
+
+	def to_dict(self):
+		return {'watermark': self.watermark, 'threads': self.threads}
+
+	@classmethod
+	def from_dict(cls, value):
+		return cls(watermark=value['watermark'], threads=value.get('threads', {}))
+
+
+class CheckpointStore:
+	"""Per-channel ingestion checkpoints. Values are Checkpoint.to_dict() dicts."""
+
+	def get(self, channel_id):
+		raise NotImplementedError
+
+	def put(self, channel_id, value):
+		raise NotImplementedError
+
+
+class S3CheckpointStore(CheckpointStore):
+	"""
+	One JSON object per channel under `prefix`. S3 rather than SSM, whose 4 KB parameters would
+	cap the number of tracked threads.
+	"""
+
+	def __init__(self, bucket, prefix, client):
+		self.bucket = bucket
+		self.prefix = prefix
+		self.client = client
+
+	def key(self, channel_id):
+		return f"{self.prefix}{channel_id}.json"
+
+	def get(self, channel_id):
+		try:
+			response = self.client.get_object(Bucket=self.bucket, Key=self.key(channel_id))
+		except ClientError as e:
+			if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+				return None
+			raise
+		return json.loads(response['Body'].read())
+
+	def put(self, channel_id, value):
+		self.client.put_object(
+			Bucket=self.bucket,
+			Key=self.key(channel_id),
+			Body=json.dumps(value),
+			ContentType='application/json',
+		)
+
+
+class InMemoryCheckpointStore(CheckpointStore):
+	"""Local stand-in for S3CheckpointStore, e.g. for runs without a checkpoint bucket."""
+
+	def __init__(self):
+		self.values = {}
+
+	def get(self, channel_id):
+		return self.values.get(channel_id)
+
+	def put(self, channel_id, value):
+		self.values[channel_id] = json.loads(json.dumps(value))
+
+
+class IncrementalScan:
+	"""
+	Narrows a channel's history down to what changed since `checkpoint`: messages newer than its
+	watermark, and older thread parents whose `latest_reply` moved past the one recorded for them
+	(or past the watermark, for threads not tracked yet, such as a message's first reply).
+
+	Feed the history through `select`, followed by the parents of `threads_before` the start of the
+	history read, and once everything it yielded has been saved, store `checkpoint()`. Threads whose
+	last reply is older than `active_since` stop being tracked.
+	"""
+
+	def __init__(self, checkpoint, active_since):
+		self.previous = checkpoint
+		self.active_since = active_since
+		self.watermark = checkpoint.watermark
+		self.threads = {ts: latest for ts, latest in checkpoint.threads.items() if float(latest) >= active_since}
+		self.new_messages = 0
+		self.updated_threads = 0
+
+	def select(self, messages):
+		watermark = float(self.previous.watermark)
+		for message in messages:
+			ts = message['ts']
+			latest_reply = message.get('latest_reply') if message.get('reply_count', 0) > 0 else None
+
+			if float(ts) > watermark:
+				self.new_messages += 1
+				if float(ts) > float(self.watermark):
+					self.watermark = ts
+			elif latest_reply and float(latest_reply) > float(self.previous.threads.get(ts, watermark)):
+				self.updated_threads += 1
+			else:
+				continue
+
+			if latest_reply and float(latest_reply) >= self.active_since:
+				self.threads[ts] = latest_reply
+			yield message
+
+	def threads_before(self, oldest):
+		"""Tracked threads whose parent is older than `oldest`, newest first, which a history scan from there misses."""
+		return sorted((ts for ts in self.threads if float(ts) < oldest), key=float, reverse=True)
+
+	def checkpoint(self):
+		return Checkpoint(watermark=self.watermark, threads=self.threads)
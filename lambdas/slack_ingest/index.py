@@ -1,10 +1,11 @@
 import os
 import boto3
+import itertools
 import json
-import urllib3
 from botocore.exceptions import ClientError
-from datetime import datetime, timedelta
-import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import time
 
 from aws_lambda_powertools import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
@@ -12,6 +13,11 @@ from aws_lambda_powertools import Metrics
 from aws_lambda_powertools.metrics import MetricUnit, MetricResolution
 from aws_lambda_powertools import Tracer
 
+from checkpoint import Checkpoint, IncrementalScan, InMemoryCheckpointStore, S3CheckpointStore
+from config_loader import ParameterLoader
+from slack_client import SlackClient, SlackError
+from upload_pipeline import UploadPipeline
+
 logger = Logger()
 metrics = Metrics()
 tracer = Tracer(service="Radiuss")
@@ -21,7 +27,6 @@ tracer = Tracer(service="Radiuss")
 kendra = boto3.client("kendra")
 s3_client = boto3.client('s3')
 secretsmanager_client = boto3.client('secretsmanager')
-ssm_client = boto3.client('ssm')
 
 # Get the environment variables
 secret_name = os.environ.get("slack_token_arn")
@@ -31,12 +36,28 @@ kendra_index_id = os.environ['kendra_index_id']
 kendra_data_source_id = os.environ['kendra_data_source_id']
 cloudfront_distribution_prefix = os.environ['cloudfront_distribution_prefix']
 parent_channel_param_name = os.environ.get('parent_channel_param_name')
-
-
-# Channel ID
-channel_id = ssm_client.get_parameter(Name=parent_channel_param_name)['Parameter']['Value']
-
-http = urllib3.PoolManager()
+# Slack recommends no more than 200 messages per conversations.history page
+history_page_size = int(os.environ.get('history_page_size', 200))
+# Threads fetched at once; conversations.replies calls still share the client's Tier 3 bucket
+thread_fetch_workers = int(os.environ.get('thread_fetch_workers', 8))
+# Documents written to S3 at once, each a PUT, a server-side copy and a metadata PUT. botocore
+# keeps 10 connections per client, so more workers than that would queue for one
+upload_workers = int(os.environ.get('upload_workers', 8))
+# Per-channel watermark and active threads; kept in memory only when no bucket is configured
+checkpoint_bucket_name = os.environ.get('checkpoint_bucket_name')
+checkpoint_prefix = os.environ.get('checkpoint_prefix', 'checkpoints/')
+# Threads are re-checked for new replies until they have been quiet this long
+active_thread_days = float(os.environ.get('active_thread_days', 14))
+# How far back the first run for a channel, with no checkpoint yet, reads
+initial_lookback_days = float(os.environ.get('initial_lookback_days', 1))
+
+
+parameters = ParameterLoader([parent_channel_param_name])
+
+if checkpoint_bucket_name:
+	checkpoints = S3CheckpointStore(checkpoint_bucket_name, checkpoint_prefix, s3_client)
+else:
+	checkpoints = InMemoryCheckpointStore()
 
 # Get token
 slack_token = json.loads(
@@ -45,6 +66,8 @@ slack_token = json.loads(
 	)['SecretString']
 )['token']
 
+slack = SlackClient(token=slack_token)
+
 import re
 CLEANR = re.compile('<.*?>')
 
@@ -54,64 +77,48 @@ def remove_tags(raw):
 	return cleantext
 
 
-# Verify slack token works and correct workspace
-def verify_slack_token(slack_token):
-	test_url = "https://slack.com/api/auth.test"
-	headers = {"Authorization": f"Bearer {slack_token}"}
-	response = http.request('POST', test_url, headers=headers)
-	data = json.loads(response.data.decode('utf-8'))
-	if data['ok']:
-		logger.info(f"Token is valid for workspace: {data['team']}")
-		logger.info(f"Associated with user: {data['user']}")
-		return True
-	else:
-		logger.error(f"Token validation failed: {data['error']}")
-		return False
-
-
 # Verify channel exists
-def verify_channel(slack_token, channel_id):
-	url = f"https://slack.com/api/conversations.info?channel={channel_id}"
-	headers = {"Authorization": f"Bearer {slack_token}"}
-	response = http.request('GET', url, headers=headers)
-	data = json.loads(response.data.decode('utf-8'))
-	if data['ok']:
-		logger.info(f"Channel verified: {data['channel']['name']}")
-		return True
-	else:
-		logger.error(f"Channel verification failed: {data.get('error')}")
+def verify_channel(channel_id):
+	try:
+		data = slack.call('conversations.info', channel=channel_id)
+	except SlackError as e:
+		logger.error(f"Channel verification failed: {e.error}")
 		return False
+	logger.info(f"Channel verified: {data['channel']['name']}")
+	return True
 
 
 # Lambda function for slack ingestion
-def fetch_channel_history(slack_token, channel_id, oldest_timestamp, limit):
-	url = "https://slack.com/api/conversations.history"
-	headers = {
-		"Authorization": f"Bearer {slack_token}"
-	}
-	params = {
-		"channel": channel_id,
-		"oldest": oldest_timestamp,
-		"limit": limit
-	}
+def fetch_channel_history(channel_id, oldest_timestamp, page_size=history_page_size):
+	"""
+	Yield the channel's messages since `oldest_timestamp`, newest first, one page at a time.
+
+	The next page is only requested once the caller has consumed the current one, so memory
+	stays at one page however busy the channel was. Rate limits and retries are handled by the
+	Slack client.
+	"""
+	yield from slack.paginate(
+		'conversations.history', 'messages',
+		limit=page_size,
+		channel=channel_id,
+		oldest=oldest_timestamp,
+	)
 
-	try:
-		# urllib3 HTTP request
-		response = http.request('GET', url, fields=params, headers=headers)
-
-		if response.status == 200:
-			data = json.loads(response.data.decode('utf-8'))
-			if data['ok']:
-				logger.info(f"Slack data retrieved.")
-				return data['messages']
-			else:
-				raise Exception(f"Error fetching Slack data: {data.get('error')}")
-		else:
-			raise Exception(f"Error fetching Slack data: HTTP {response.status}")
 
-	except Exception as e:
-		logger.error(f"Failed to fetch channel history. An error occured: {e}")
-		return None
+def fetch_thread_parents(channel_id, thread_timestamps):
+	"""
+	Yield the parent message, with its current reply_count and latest_reply, of each thread in
+	`thread_timestamps`. Used for tracked threads that started before the history being read.
+	"""
+	for ts in thread_timestamps:
+		try:
+			data = slack.call('conversations.replies', channel=channel_id, ts=ts, limit=1)
+		except SlackError as e:
+			if e.error != 'thread_not_found':
+				raise
+			logger.info(f"Thread {ts} no longer exists")
+			continue
+		yield from data.get('messages', [])[:1]
 
 
 def upload_metadata_to_s3(data, bucket_name, object_key):
@@ -136,69 +143,88 @@ def create_metadata(title, source_uri):
 	)
 
 
-def get_thread(slack_token, ts, channel_id):
-	url = "https://slack.com/api/conversations.replies"
-	headers = {
-		"Content-Type": "application/x-www-form-urlencoded",
-		"Authorization": f"Bearer {slack_token}"
-	}
-	data = {
-		"channel": channel_id,
-		"ts": ts
-	}
+def document_name(channel_id, ts):
+	"""
+	Name of the document for the message, or thread, at `ts`. It is the same on every run, so an
+	updated thread overwrites its earlier version rather than adding a duplicate.
+	"""
+	return f"{channel_id}-{ts}"
+
+
+def get_thread(ts, channel_id):
 	output = ""
 
-	response = http.request("GET", url, fields=data, headers=headers)
-	data = json.loads(response.data.decode('utf-8'))
-	logger.info(f"data: {data}")
-	messages = data['messages']
-	for message in messages:
+	for message in slack.paginate('conversations.replies', 'messages', channel=channel_id, ts=ts):
 		if "bot_id" not in message:
 			output += remove_tags(message['text']) + "\n"
 	logger.info(f"get_thread output: {output}")
 	return output
 
 
-def save_message_to_s3(messages, timestamp):
-	for message in messages:
-		file_name = f"{channel_id}-{timestamp}-{str(uuid.uuid4())}"
-		source_uri_modified = f"https://{cloudfront_distribution_prefix}/{file_name}.txt"
-		save_text = ""
-
-		if "reply_count" in message and message["reply_count"] > 0:
-			# Retrieve the thread for the current message
-			save_text += get_thread(
-				slack_token=slack_token,
-				ts=message["ts"],
-				channel_id=channel_id,
-			)
-		else:
-			save_text += message['text'] + "\n"
-		save_text += "\n"
-
-		logger.info(f"save_text: {save_text}")
-		s3_client.put_object(
-			Body=save_text,
-			Bucket=raw_bucket_name,
-			Key=file_name + ".txt"
-		)
+def expand_threads(messages, channel_id, workers=thread_fetch_workers):
+	"""
+	Yield (message, text) for each message in order, where text is the whole thread for messages
+	with replies and the message itself otherwise.
 
-		logger.info(f"Uploading text to {processed_bucket_name}")
-		s3_client.put_object(
-			Body=save_text,
-			Bucket=processed_bucket_name,
-			Key=file_name + ".txt"
-		)
+	Threads are fetched by a pool of `workers`, at most twice that many ahead of the consumer, so
+	reading history still waits on the S3 writer. Every fetch draws from the shared Slack client,
+	whose per-method token bucket keeps the pool within Slack's Tier 3 limit.
+	"""
+	pending = deque()
 
-		logger.info(f"Uploading metadata to {processed_bucket_name}")
-		s3_client.put_object(
-			Body=create_metadata(
-				title=file_name,
-				source_uri=source_uri_modified
-			),
-			Bucket=processed_bucket_name,
-			Key=file_name + ".txt.metadata.json"
-		)
+	def next_result():
+		message, thread = pending.popleft()
+		return message, thread.result() if thread else message['text'] + "\n"
+
+	with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thread-fetch") as executor:
+		for message in messages:
+			if message.get("reply_count", 0) > 0:
+				pending.append((message, executor.submit(get_thread, ts=message["ts"], channel_id=channel_id)))
+			else:
+				pending.append((message, None))
+			# Hand back finished messages in order, and block on the oldest once the window is full
+			while pending and (len(pending) > 2 * workers or pending[0][1] is None or pending[0][1].done()):
+				yield next_result()
+		while pending:
+			yield next_result()
+
+
+def record_upload_metrics(stats):
+	logger.info(f"{stats.saved} documents saved and {stats.unchanged} unchanged in {stats.seconds:.1f}s, "
+				f"{stats.errors} failed")
+	metrics.add_metric(name="SlackDocumentsSaved", unit=MetricUnit.Count, value=stats.saved,
+					   resolution=MetricResolution.High)
+	metrics.add_metric(name="SlackUnchangedDocuments", unit=MetricUnit.Count, value=stats.unchanged,
+					   resolution=MetricResolution.High)
+	metrics.add_metric(name="SlackDocumentWriteErrors", unit=MetricUnit.Count, value=stats.errors,
+					   resolution=MetricResolution.High)
+	metrics.add_metric(name="SlackUploadedBytes", unit=MetricUnit.Bytes, value=stats.bytes_uploaded,
+					   resolution=MetricResolution.High)
+	metrics.add_metric(name="SlackDocumentsPerSecond", unit=MetricUnit.CountPerSecond,
+					   value=stats.documents_per_second, resolution=MetricResolution.High)
+
+
+def save_message_to_s3(messages, channel_id):
+	"""
+	Save each message, or its whole thread, as it is read. Returns the number saved.
+
+	Documents are keyed by channel and thread ts, and written by an UploadPipeline, which skips
+	those whose content is unchanged since they were last saved.
+	"""
+	uploads = UploadPipeline(s3_client, raw_bucket_name, processed_bucket_name, workers=upload_workers,
+							 prefix=document_name(channel_id, ""))
+	try:
+		with uploads:
+			for message, text in expand_threads(messages, channel_id):
+				file_name = document_name(channel_id, message['ts'])
+				source_uri_modified = f"https://{cloudfront_distribution_prefix}/{file_name}.txt"
+				save_text = text + "\n"
+
+				logger.info(f"save_text: {save_text}")
+				uploads.submit(file_name, save_text, create_metadata(title=file_name, source_uri=source_uri_modified))
+	finally:
+		record_upload_metrics(uploads.stats)
+	return uploads.stats.saved
 
 
 @logger.inject_lambda_context(log_event=True)
@@ -217,34 +243,71 @@ def lambda_handler(event, context: LambdaContext):
 		resolution=MetricResolution.High
 	)
 
+	channel_id = parameters.get(parent_channel_param_name)
+
 	# Verify workspace
-	if not verify_slack_token(slack_token):
+	if not slack.verify_token():
 		raise Exception("Invalid Slack token or wrong workspace.")
 
 	# Verify channel
-	if not verify_channel(slack_token, channel_id):
+	if not verify_channel(channel_id):
 		raise Exception("Channel not found or not accessible.")
 
-	# Calc 24-hour timestamp
-	current_time = datetime.now()
-	oldest_time = current_time - timedelta(days=1)
-	oldest_timestamp = oldest_time.timestamp()  # Unix
-
-	limit = 1000
-
-	history_data = fetch_channel_history(slack_token, channel_id, oldest_timestamp, limit)
-
-	if history_data:
-		# Save messages to S3
-		save_message_to_s3(history_data, timestamp=datetime.now().strftime('%Y-%m-%d'))
-		logger.info("Channel messages uploaded to S3")
+	# Read from the checkpoint, or the initial lookback on a channel's first run
+	now = time.time()
+	stored = checkpoints.get(channel_id)
+	if stored is None:
+		checkpoint = Checkpoint(watermark=f"{now - initial_lookback_days * 86400:.6f}", threads={})
 	else:
-		logger.info("No data retrieved from Slack API.")
+		checkpoint = Checkpoint.from_dict(stored)
+	active_since = now - active_thread_days * 86400
+	scan = IncrementalScan(checkpoint, active_since=active_since)
+
+	# History back to the active window is scanned for parents with new replies, which costs a
+	# page per 200 messages; only new messages and updated threads are fetched in full and saved
+	oldest_timestamp = min(float(checkpoint.watermark), active_since)
+	# Tracked threads can have started before that, so their parents are read one by one
+	messages = itertools.chain(
+		fetch_channel_history(channel_id, oldest_timestamp),
+		fetch_thread_parents(channel_id, scan.threads_before(oldest_timestamp)),
+	)
+
+	# Messages are saved as pages arrive; a failure part way keeps what was already saved
+	try:
+		saved = save_message_to_s3(
+			scan.select(messages),
+			channel_id=channel_id,
+		)
+	except SlackError as e:
+		logger.error(f"Failed to fetch channel history. An error occured: {e}")
+		saved = None
+
+	logger.info(f"{scan.new_messages} new messages and {scan.updated_threads} threads with new replies")
+	metrics.add_metric(name="SlackNewMessages", unit=MetricUnit.Count, value=scan.new_messages,
+					   resolution=MetricResolution.High)
+	metrics.add_metric(name="SlackUpdatedThreads", unit=MetricUnit.Count, value=scan.updated_threads,
+					   resolution=MetricResolution.High)
+
+	if saved == 0:
+		# Nothing changed, so the index and the answers cached against it stay as they are
+		logger.info("No new Slack activity since the last run.")
+		checkpoints.put(channel_id, scan.checkpoint().to_dict())
+		return {
+			'statusCode': 200,
+			'body': json.dumps({'msg': "No new activity"})
+		}
+	if saved:
+		logger.info(f"{saved} channel messages uploaded to S3")
 
 	logger.info(f"Start data source sync index id: {kendra_index_id} data source id: {kendra_data_source_id}")
 	response = kendra.start_data_source_sync_job(Id=kendra_data_source_id, IndexId=kendra_index_id)
 	logger.info("response:" + json.dumps(response))
 
+	# Only advance once everything was saved and synced. History is read newest first, so after a
+	# partial failure the next run must start from the old watermark again
+	if saved is not None:
+		checkpoints.put(channel_id, scan.checkpoint().to_dict())
+
 	return {
 		'statusCode': 200,
 		'body': json.dumps({'msg': "Success!"})
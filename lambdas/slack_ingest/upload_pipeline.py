@@ -0,0 +1,138 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from botocore.exceptions import ClientError
+
+# User metadata on a document's .metadata.json object holding the SHA-256 of its content
+CONTENT_HASH_METADATA = 'content-sha256'
+METADATA_SUFFIX = '.metadata.json'
+
+
+def content_hash(text):
+	return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class UploadStats:
+	"""Counters for an UploadPipeline, safe to update from its worker threads."""
+
+	def __init__(self):
+		self.saved = 0
+		self.unchanged = 0
+		self.errors = 0
+		self.bytes_uploaded = 0
+		self.started = time.perf_counter()
+		self.seconds = 0.0
+		self._lock = threading.Lock()
+
+	def add(self, **counts):
+		with self._lock:
+			for name, value in counts.items():
+				setattr(self, name, getattr(self, name) + value)
+
+	@property
+	def documents_per_second(self):
+		return (self.saved + self.unchanged) / self.seconds if self.seconds else 0.0
+
+
+class UploadPipeline:
+	"""
+	Writes Slack documents to the raw and processed buckets from a pool of `workers`.
+
+	Each document is uploaded once, to the raw bucket, and copied server side into the processed
+	bucket, so its text only crosses the network once. The metadata object goes last and records
+	the content hash: a document whose hash matches is skipped after a single HEAD, and one that
+	failed part way through has no matching hash and is written again on the next run. When every
+	document name starts with `prefix`, the processed bucket is listed once under it and documents
+	without a metadata object are written straight away, without a HEAD.
+
+	At most twice `workers` documents are in flight, so the producer still waits on S3. Failures are
+	counted and the first one is raised when the pipeline closes, after the rest have been written.
+	"""
+
+	def __init__(self, client, raw_bucket, processed_bucket, workers=8, prefix=None):
+		self.client = client
+		self.raw_bucket = raw_bucket
+		self.processed_bucket = processed_bucket
+		self.workers = workers
+		self.prefix = prefix
+		self.stats = UploadStats()
+		self.error = None
+		# Metadata keys under `prefix`, listed on the first submit
+		self._stored_keys = None
+		self._pending = set()
+		self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="s3-upload")
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close()
+		if exc is None and self.error is not None:
+			raise self.error
+
+	def submit(self, name, text, metadata):
+		"""Queue `text` as `{name}.txt`, with `metadata` as its Kendra `.metadata.json`."""
+		if self.prefix is not None and self._stored_keys is None:
+			self._stored_keys = self._list_metadata_keys()
+		while len(self._pending) >= 2 * self.workers:
+			self._collect(wait(self._pending, return_when=FIRST_COMPLETED).done)
+		self._pending.add(self._executor.submit(self._save, name, text, metadata))
+
+	def close(self):
+		self._collect(wait(self._pending).done)
+		self._executor.shutdown()
+		self.stats.seconds = time.perf_counter() - self.stats.started
+
+	def _collect(self, done):
+		for future in done:
+			self._pending.discard(future)
+			error = future.exception()
+			if error is not None:
+				self.stats.add(errors=1)
+				self.error = self.error or error
+
+	def _list_metadata_keys(self):
+		paginator = self.client.get_paginator('list_objects_v2')
+		return {
+			item['Key']
+			for page in paginator.paginate(Bucket=self.processed_bucket, Prefix=self.prefix)
+			for item in page.get('Contents', [])
+			if item['Key'].endswith(METADATA_SUFFIX)
+		}
+
+	def _stored_hash(self, key):
+		if self._stored_keys is not None and key not in self._stored_keys:
+			return None
+		try:
+			response = self.client.head_object(Bucket=self.processed_bucket, Key=key)
+		except ClientError as e:
+			if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+				return None
+			raise
+		return response.get('Metadata', {}).get(CONTENT_HASH_METADATA)
+
+	def _save(self, name, text, metadata):
+		key = name + ".txt"
+		metadata_key = key + METADATA_SUFFIX
+		digest = content_hash(text)
+		if self._stored_hash(metadata_key) == digest:
+			self.stats.add(unchanged=1)
+			return
+
+		body = text.encode('utf-8')
+		self.client.put_object(Body=body, Bucket=self.raw_bucket, Key=key)
+		self.client.copy_object(
+			CopySource={'Bucket': self.raw_bucket, 'Key': key},
+			Bucket=self.processed_bucket,
+			Key=key,
+		)
+		metadata_body = metadata.encode('utf-8')
+		self.client.put_object(
+			Body=metadata_body,
+			Bucket=self.processed_bucket,
+			Key=metadata_key,
+			Metadata={CONTENT_HASH_METADATA: digest},
+		)
+		self.stats.add(saved=1, bytes_uploaded=len(body) + len(metadata_body))
@@ -12,7 +12,10 @@ from aws_cdk import (
     aws_kendra as kendra,
     aws_lambda as lambda_,
     custom_resources as cr,
-    aws_ec2 as ec2
+    aws_ec2 as ec2,
+    aws_ssm as ssm,
+    aws_events as events,
+    aws_events_targets as targets,
 )
 from cdk_nag import NagSuppressions
 
@@ -97,6 +100,8 @@ class DataStack(Stack):
             self, "SlackDeployDocuments",
             sources=[s3_deploy.Source.asset("documents/slack")],
             destination_bucket=self.raw_slack_document_ingestion_bucket,
+            # The Slack ingest Lambda writes its documents here too, which a deploy must not delete
+            prune=False,
         )
 
         self.processed_slack_document_ingestion_bucket = s3.Bucket(
@@ -284,6 +289,77 @@ class DataStack(Stack):
         )
         self.documentation_kendra_data_source.node.add_dependency(self.kendra_index)
 
+        # Bumped after every finished Kendra sync so the Slack bot can drop answers cached against older data
+        self.index_version_param_name = "/Radiuss/Spack/IndexVersion"
+        self.index_version_param = ssm.StringParameter(
+            self, "IndexVersionStringParameter",
+            allowed_pattern=".*",
+            description="Execution ID of the latest finished Kendra data source sync",
+            parameter_name=self.index_version_param_name,
+            string_value="initial",
+            tier=ssm.ParameterTier.STANDARD
+        )
+
+        self.index_version_lambda_role = iam.Role(
+            self, "IndexVersionLambdaRole",
+            role_name="Radiuss_Index_Version_Lambda_Role",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com")
+        )
+        self.index_version_lambda_role.add_managed_policy(
+            iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole")
+        )
+        self.index_version_param.grant_read(self.index_version_lambda_role)
+        self.index_version_param.grant_write(self.index_version_lambda_role)
+        self.index_version_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["kendra:ListDataSourceSyncJobs"],
+                resources=[
+                    f'{self.kendra_index.attr_arn}',
+                    f'{self.slack_kendra_data_source.attr_arn}',
+                    f'{self.documentation_kendra_data_source.attr_arn}'
+                ]
+            ),
+        )
+
+        # Kendra emits no event when a sync finishes, so the index version is published by polling
+        self.index_version_lambda = lambda_.Function(
+            self, "IndexVersionLambda",
+            function_name="index_version_lambda",
+            code=lambda_.Code.from_asset(
+                "lambdas/index_version",
+                bundling=cdk.BundlingOptions(
+                    image=lambda_.Runtime.PYTHON_3_12.bundling_image,
+                    command=[
+                        "bash",
+                        "-c",
+                        "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output"
+                    ]
+                )
+            ),
+            handler="index.lambda_handler",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            architecture=lambda_.Architecture.X86_64,
+            timeout=Duration.minutes(1),
+            role=self.index_version_lambda_role,
+            environment={
+                "POWERTOOLS_METRICS_NAMESPACE": "radiuss",
+                "POWERTOOLS_SERVICE_NAME": "radiuss",
+                "kendra_index_id": self.kendra_index.attr_id,
+                "kendra_data_source_ids": ",".join([
+                    self.slack_kendra_data_source.attr_id,
+                    self.documentation_kendra_data_source.attr_id,
+                ]),
+                "index_version_param_name": self.index_version_param_name,
+            },
+        )
+
+        events.Rule(
+            self, "IndexVersionScheduleRule",
+            schedule=events.Schedule.rate(Duration.minutes(5)),
+            targets=[targets.LambdaFunction(self.index_version_lambda)]
+        )
+
         self.documentation_processing_lambda_role = iam.Role(
             self, "RadiussDocumentationProcessingLambdaRole",
             role_name="Radiuss_Documentation_Processing_Lambda_Role",
@@ -9,6 +9,10 @@ from aws_cdk import (
     aws_cloudwatch as cw,
     aws_ssm as ssm,
     aws_logs as logs,
+    aws_sqs as sqs,
+    aws_dynamodb as dynamodb,
+    aws_s3 as s3,
+    aws_lambda_event_sources as event_sources,
     SecretValue,
     Duration,
 )
@@ -32,6 +36,10 @@ class SlackStack(Stack):
         ])
 
         self.bedrock_model_id = "anthropic.claude-v2:1"
+        # Tried in order when the primary model is throttled, they must accept the same request body
+        self.bedrock_fallback_model_ids = []
+        # Embeds passages for the dense index and questions for retriever_backend "dense" or "hybrid"
+        self.embedding_model_id = "amazon.titan-embed-text-v2:0"
         self.kendra = data_stack.kendra_index
         self.parent_channel_param_name = "/Radiuss/Spack/ParentChannelId"
         self.child_channel_param_name = "/Radiuss/Spack/ChildChannelId"
@@ -78,14 +86,35 @@ class SlackStack(Stack):
             description="Child channel ID parameter"
         )
 
+        # Modules shared by the Slack Lambdas (config loading, ...)
+        self.common_layer = lambda_.LayerVersion(
+            self, "RadiussCommonLayer",
+            code=lambda_.Code.from_asset(
+                "lambdas/common",
+                bundling=cdk.BundlingOptions(
+                    image=lambda_.Runtime.PYTHON_3_12.bundling_image,
+                    command=[
+                        "bash",
+                        "-c",
+                        "mkdir -p /asset-output/python && cp -au . /asset-output/python"
+                    ]
+                )
+            ),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_12],
+            description="Shared modules for the Radiuss Slack Lambdas",
+        )
+
         # Create Lambda role and policy
         self.slackbot_lambda_policy = iam.Policy(
             self, "SlackbotLambdaPolicy",
             policy_name="User_Policies_Slackbot_Lambda",
             statements=[
                 iam.PolicyStatement(
-                    actions=["bedrock:InvokeModel"],
-                    resources=[f"arn:aws:bedrock:{cdk.Aws.REGION}::foundation-model/{self.bedrock_model_id}"],
+                    actions=["bedrock:InvokeModel", "bedrock:InvokeModelWithResponseStream"],
+                    resources=[
+                        f"arn:aws:bedrock:{cdk.Aws.REGION}::foundation-model/{model_id}"
+                        for model_id in [self.bedrock_model_id, self.embedding_model_id] + self.bedrock_fallback_model_ids
+                    ],
                     effect=iam.Effect.ALLOW,
                 ),
                 iam.PolicyStatement(
@@ -102,7 +131,75 @@ class SlackStack(Stack):
             role_name="User_Roles_Radiuss_Lambda_Role",
             assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
         )
+        # Queue between the fast-ack Slack handler and the answer worker
+        self.answer_queue_visibility_timeout = 540
+        self.answer_dead_letter_queue = sqs.Queue(
+            self, "AnswerDeadLetterQueue",
+            retention_period=Duration.days(14),
+            enforce_ssl=True,
+        )
+        self.answer_queue = sqs.Queue(
+            self, "AnswerQueue",
+            visibility_timeout=Duration.seconds(self.answer_queue_visibility_timeout),
+            enforce_ssl=True,
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=3,
+                queue=self.answer_dead_letter_queue,
+            ),
+        )
+
+        # Shared tier of the question-to-answer cache
+        self.answer_cache_table = dynamodb.Table(
+            self, "AnswerCacheTable",
+            partition_key=dynamodb.Attribute(name="cache_key", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            point_in_time_recovery=True,
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+        )
+
+        # Slack event_id -> IN_PROGRESS/COMPLETED, so retries are only processed when the first attempt failed
+        self.idempotency_table = dynamodb.Table(
+            self, "IdempotencyTable",
+            partition_key=dynamodb.Attribute(name="event_id", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            point_in_time_recovery=True,
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+        )
+
+        # Slack thread -> running summary and recent turns, so follow-ups carry bounded context
+        self.conversation_table = dynamodb.Table(
+            self, "ConversationTable",
+            partition_key=dynamodb.Attribute(name="thread_key", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            point_in_time_recovery=True,
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+        )
+
+        # BM25 and vector indexes over the processed buckets, for retriever_backend "lexical", "dense" or "hybrid"
+        self.retriever_backend = "kendra"
+        self.lexical_index_key = "lexical/index.bin"
+        self.dense_index_key = "dense/index.bin"
+        self.lexical_index_bucket = s3.Bucket(
+            self, "LexicalIndexBucket",
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+            auto_delete_objects=True,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            enforce_ssl=True,
+            server_access_logs_bucket=data_stack.logs_bucket
+        )
+
         self.slack_bot_token.grant_read(self.slackbot_lambda_role)
+        self.lexical_index_bucket.grant_read(self.slackbot_lambda_role)
+        self.idempotency_table.grant_read_write_data(self.slackbot_lambda_role)
+        self.answer_cache_table.grant_read_write_data(self.slackbot_lambda_role)
+        self.conversation_table.grant_read_write_data(self.slackbot_lambda_role)
+        data_stack.index_version_param.grant_read(self.slackbot_lambda_role)
+        self.answer_queue.grant_send_messages(self.slackbot_lambda_role)
+        self.answer_queue.grant_consume_messages(self.slackbot_lambda_role)
         self.parent_channel_param.grant_read(self.slackbot_lambda_role)
         self.slackbot_member_id_param.grant_read(self.slackbot_lambda_role)
 
@@ -137,15 +234,79 @@ class SlackStack(Stack):
             environment={
                 "kendra_index_id": self.kendra.attr_id,
                 "model_id": self.bedrock_model_id,
+                "fallback_model_ids": ",".join(self.bedrock_fallback_model_ids),
                 "slack_token_arn": self.slack_bot_token.secret_full_arn,
                 "POWERTOOLS_METRICS_NAMESPACE": "radiuss",
                 "POWERTOOLS_SERVICE_NAME": "radiuss",
                 "parent_channel_param_name": self.parent_channel_param_name,
                 "slackbot_member_id_param_name": self.slackbot_member_id_param_name,
+                "index_version_param_name": data_stack.index_version_param_name,
+                "answer_cache_table": self.answer_cache_table.table_name,
+                "idempotency_table": self.idempotency_table.table_name,
+                "conversation_table": self.conversation_table.table_name,
+                "retriever_backend": self.retriever_backend,
+                "lexical_index_uri": self.lexical_index_bucket.s3_url_for_object(self.lexical_index_key),
+                "dense_index_uri": self.lexical_index_bucket.s3_url_for_object(self.dense_index_key),
+                "embedding_model_id": self.embedding_model_id,
+                "stream_answers": "true",
+                "answer_queue_url": self.answer_queue.queue_url,
             },
+            layers=[self.common_layer],
             vpc=data_stack.vpc
         )
 
+        # Create answer worker Lambda function, fed by the answer queue
+        self.slackbot_worker_lambda_function = lambda_.Function(
+            self, "RadiussSlackWorkerLambda",
+            function_name="slackbot_worker",
+            code=lambda_.Code.from_asset(
+                "lambdas/slack_bot",
+                bundling=cdk.BundlingOptions(
+                    image=lambda_.Runtime.PYTHON_3_12.bundling_image,
+                    command=[
+                        "bash",
+                        "-c",
+                        "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output"
+                    ]
+                )
+            ),
+            handler="index.worker_handler",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            architecture=lambda_.Architecture.X86_64,
+            timeout=Duration.seconds(90),
+            role=self.slackbot_lambda_role,
+            environment={
+                "kendra_index_id": self.kendra.attr_id,
+                "model_id": self.bedrock_model_id,
+                "fallback_model_ids": ",".join(self.bedrock_fallback_model_ids),
+                "slack_token_arn": self.slack_bot_token.secret_full_arn,
+                "POWERTOOLS_METRICS_NAMESPACE": "radiuss",
+                "POWERTOOLS_SERVICE_NAME": "radiuss",
+                "parent_channel_param_name": self.parent_channel_param_name,
+                "slackbot_member_id_param_name": self.slackbot_member_id_param_name,
+                "index_version_param_name": data_stack.index_version_param_name,
+                "answer_cache_table": self.answer_cache_table.table_name,
+                "idempotency_table": self.idempotency_table.table_name,
+                # Outlasts the wait for SQS to redeliver a failed answer request
+                "idempotency_worker_lease": str(self.answer_queue_visibility_timeout + 60),
+                "conversation_table": self.conversation_table.table_name,
+                "retriever_backend": self.retriever_backend,
+                "lexical_index_uri": self.lexical_index_bucket.s3_url_for_object(self.lexical_index_key),
+                "dense_index_uri": self.lexical_index_bucket.s3_url_for_object(self.dense_index_key),
+                "embedding_model_id": self.embedding_model_id,
+                "stream_answers": "true",
+            },
+            layers=[self.common_layer],
+            vpc=data_stack.vpc
+        )
+        self.slackbot_worker_lambda_function.add_event_source(
+            event_sources.SqsEventSource(
+                self.answer_queue,
+                batch_size=1,
+                report_batch_item_failures=True,
+            )
+        )
+
         self.metrics_lambda_policy = iam.Policy(
             self, "MetricsLambdaPolicy",
             policy_name="User_Policies_Metrics_Lambda",
@@ -200,6 +361,7 @@ class SlackStack(Stack):
                 "POWERTOOLS_METRICS_NAMESPACE": "radiuss",
                 "POWERTOOLS_SERVICE_NAME": "radiuss"
             },
+            layers=[self.common_layer],
             vpc=data_stack.vpc
         )
 
@@ -299,9 +461,21 @@ class SlackStack(Stack):
         self.slack_ingest_lambda_role.add_managed_policy(
             iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaVPCAccessExecutionRole")
         )
+        # Per-channel ingestion checkpoints, kept apart from the raw bucket that CloudFront serves
+        self.slack_ingest_checkpoint_bucket = s3.Bucket(
+            self, "SlackIngestCheckpointBucket",
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+            auto_delete_objects=True,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            enforce_ssl=True,
+            server_access_logs_bucket=data_stack.logs_bucket
+        )
+
         self.slack_bot_token.grant_read(self.metrics_lambda_role)
-        data_stack.processed_slack_document_ingestion_bucket.grant_write(self.slack_ingest_lambda_role)
-        data_stack.raw_slack_document_ingestion_bucket.grant_write(self.slack_ingest_lambda_role)
+        self.slack_ingest_checkpoint_bucket.grant_read_write(self.slack_ingest_lambda_role)
+        data_stack.processed_slack_document_ingestion_bucket.grant_read_write(self.slack_ingest_lambda_role)
+        data_stack.raw_slack_document_ingestion_bucket.grant_read_write(self.slack_ingest_lambda_role)
         self.parent_channel_param.grant_read(self.slack_ingest_lambda_role)
         self.slackbot_member_id_param.grant_read(self.slack_ingest_lambda_role)
 
@@ -335,11 +509,14 @@ class SlackStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_12,
             architecture=lambda_.Architecture.X86_64,
             timeout=Duration.minutes(15),
+            # Runs read and advance a shared checkpoint, so they must not overlap
+            reserved_concurrent_executions=1,
             role=self.slack_ingest_lambda_role,
             environment={
                 "slack_token_arn": self.slack_bot_token.secret_full_arn,
                 "raw_bucket_name": data_stack.raw_slack_document_ingestion_bucket.bucket_name,
                 "processed_bucket_name": data_stack.processed_slack_document_ingestion_bucket.bucket_name,
+                "checkpoint_bucket_name": self.slack_ingest_checkpoint_bucket.bucket_name,
                 "kendra_index_id": self.kendra.attr_id,
                 "kendra_data_source_id": data_stack.slack_kendra_data_source.attr_id,
                 "parent_channel_param_name": self.parent_channel_param_name,
@@ -347,11 +524,82 @@ class SlackStack(Stack):
                 "POWERTOOLS_METRICS_NAMESPACE": "radiuss",
                 "POWERTOOLS_SERVICE_NAME": "radiuss"
             },
+            layers=[self.common_layer],
             vpc=data_stack.vpc
         ) 
 
         self.slack_bot_token.grant_read(self.slack_ingest_lambda_function)
 
+        self.index_builder_lambda_role = iam.Role(
+            self, "IndexBuilderLambdaRole",
+            role_name="Radiuss_Index_Builder_Lambda_Role",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+        )
+        self.index_builder_lambda_role.add_managed_policy(
+            iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole")
+        )
+        self.index_builder_lambda_role.add_managed_policy(
+            iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaVPCAccessExecutionRole")
+        )
+        data_stack.processed_documentation_document_ingestion_bucket.grant_read(self.index_builder_lambda_role)
+        data_stack.processed_slack_document_ingestion_bucket.grant_read(self.index_builder_lambda_role)
+        self.lexical_index_bucket.grant_read_write(self.index_builder_lambda_role)
+        data_stack.index_version_param.grant_write(self.index_builder_lambda_role)
+        self.index_builder_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["bedrock:InvokeModel"],
+                resources=[f"arn:aws:bedrock:{cdk.Aws.REGION}::foundation-model/{self.embedding_model_id}"]
+            ),
+        )
+
+        # Rebuilds the indexes from the processed buckets after the nightly Slack ingestion, embedding only changed passages
+        self.index_builder_lambda_function = lambda_.Function(
+            self, "IndexBuilderLambda",
+            function_name="index_builder",
+            code=lambda_.Code.from_asset(
+                "lambdas/slack_bot",
+                bundling=cdk.BundlingOptions(
+                    image=lambda_.Runtime.PYTHON_3_12.bundling_image,
+                    command=[
+                        "bash",
+                        "-c",
+                        "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output"
+                    ]
+                )
+            ),
+            handler="index_builder.lambda_handler",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            architecture=lambda_.Architecture.X86_64,
+            timeout=Duration.minutes(15),
+            memory_size=2048,
+            ephemeral_storage_size=cdk.Size.gibibytes(2),
+            role=self.index_builder_lambda_role,
+            environment={
+                "processed_bucket_names": ",".join([
+                    data_stack.processed_documentation_document_ingestion_bucket.bucket_name,
+                    data_stack.processed_slack_document_ingestion_bucket.bucket_name,
+                ]),
+                "lexical_index_bucket": self.lexical_index_bucket.bucket_name,
+                "lexical_index_key": self.lexical_index_key,
+                "dense_index_key": self.dense_index_key,
+                "embedding_model_id": self.embedding_model_id,
+                # A changed index only invalidates cached answers when the bot retrieves from it
+                "retriever_backend": self.retriever_backend,
+                "index_version_param_name": data_stack.index_version_param_name,
+                "POWERTOOLS_METRICS_NAMESPACE": "radiuss",
+                "POWERTOOLS_SERVICE_NAME": "radiuss"
+            },
+            layers=[self.common_layer],
+            vpc=data_stack.vpc
+        )
+
+        self.index_builder_schedule = events.Rule(
+            self, "IndexBuilderScheduleRule",
+            schedule=events.Schedule.cron(hour="1", minute="0"),
+            targets=[targets.LambdaFunction(self.index_builder_lambda_function)]
+        )
+
         self.daily_schedule = events.Rule(
             self, "ScheduleRule",
             schedule=events.Schedule.cron(hour="0", minute="0"),
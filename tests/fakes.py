@@ -0,0 +1,580 @@
+"""
+In-process stand-ins for the AWS services the Lambdas call, for local tests and benchmarks.
+
+Each fake mirrors the request and response shapes of the boto3 client methods it replaces, so it
+can stand in for that client, e.g. `clients.bedrock_runtime.set(FakeStreamingBedrock())`.
+"""
+import collections
+import datetime
+import io
+import json
+import math
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from botocore.exceptions import ClientError
+
+
+class LatencyModel:
+    """
+    Log-normal service latency, fitted to a `median` and `p99` in seconds, plus an error rate.
+
+    `p99=None` makes every call take exactly `median`. Fakes call `wait()` once per request and
+    fail the request when `fails()` is true, so one model describes a whole latency and error
+    distribution.
+    """
+
+    def __init__(self, median=0.0, p99=None, error_rate=0.0, seed=None):
+        self.median = median
+        self.p99 = p99
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    @classmethod
+    def parse(cls, spec, seed=None):
+        """Build from "median[,p99[,error_rate]]", e.g. "0.12,0.4,0.01"."""
+        values = [float(value) for value in spec.split(',')] if spec else []
+        return cls(*values, seed=seed)
+
+    def sample(self):
+        if self.median <= 0:
+            return 0.0
+        if not self.p99 or self.p99 <= self.median:
+            return self.median
+        # 2.326 is the z-score of the 99th percentile
+        sigma = math.log(self.p99 / self.median) / 2.326
+        return self._random.lognormvariate(math.log(self.median), sigma)
+
+    def wait(self):
+        time.sleep(self.sample())
+
+    def fails(self):
+        return self._random.random() < self.error_rate
+
+
+def service_error(code, operation):
+    return ClientError({'Error': {'Code': code, 'Message': f"Simulated {code}"}}, operation)
+
+
+class FakeSSM:
+    """
+    ssm stand-in serving `get_parameters` and `get_parameter` from a dict of name to value.
+    `put_parameter` writes to it and records the time as the parameter's LastModifiedDate.
+    """
+
+    def __init__(self, parameters, latency=None):
+        self.parameters = parameters
+        self.latency = latency or LatencyModel()
+        self.last_modified = {name: datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc) for name in parameters}
+        self.requests = collections.Counter()
+
+    def get_parameter(self, Name, **kwargs):
+        self.requests['GetParameter'] += 1
+        if Name not in self.parameters:
+            raise service_error('ParameterNotFound', 'GetParameter')
+        return {'Parameter': {'Name': Name, 'Value': self.parameters[Name], 'LastModifiedDate': self.last_modified[Name]}}
+
+    def put_parameter(self, Name, Value, Overwrite=False, **kwargs):
+        self.requests['PutParameter'] += 1
+        if Name in self.parameters and not Overwrite:
+            raise service_error('ParameterAlreadyExists', 'PutParameter')
+        self.parameters[Name] = Value
+        self.last_modified[Name] = datetime.datetime.now(datetime.timezone.utc)
+        return {'Version': 1}
+
+    def get_parameters(self, Names):
+        self.requests['GetParameters'] += 1
+        self.latency.wait()
+        if self.latency.fails():
+            raise service_error('InternalServerError', 'GetParameters')
+        return {
+            'Parameters': [{'Name': name, 'Value': self.parameters[name]} for name in Names if name in self.parameters],
+            'InvalidParameters': [name for name in Names if name not in self.parameters],
+        }
+
+
+class FakeSecretsManager:
+    """secretsmanager stand-in serving `get_secret_value` from a dict of secret id to string."""
+
+    def __init__(self, secrets, latency=None):
+        self.secrets = secrets
+        self.latency = latency or LatencyModel()
+
+    def get_secret_value(self, SecretId):
+        self.latency.wait()
+        if self.latency.fails():
+            raise service_error('InternalServiceError', 'GetSecretValue')
+        if SecretId not in self.secrets:
+            raise service_error('ResourceNotFoundException', 'GetSecretValue')
+        return {'ARN': SecretId, 'SecretString': self.secrets[SecretId]}
+
+
+class FakeS3Exceptions:
+    """The modeled exceptions of an s3 client, `client.exceptions`, that the Lambdas catch."""
+
+    ClientError = ClientError
+
+    class NoSuchKey(ClientError):
+        pass
+
+
+class FakeS3:
+    """
+    In-memory s3 stand-in, in the spirit of moto's mock_aws: `put_object`, `get_object`, `head_object`,
+    server-side `copy_object`, `list_objects_v2` with its paginator, and the transfer methods
+    `upload_file` and `download_file` on a set of named buckets.
+
+    Missing buckets and keys fail with the error codes S3 uses. `requests` counts calls per operation
+    and `bytes_uploaded` the request bodies sent, which a server-side copy does not add to.
+    """
+
+    exceptions = FakeS3Exceptions
+
+    def __init__(self, buckets=(), latency=None):
+        self.buckets = {bucket: {} for bucket in buckets}
+        self.latency = latency or LatencyModel()
+        self.requests = collections.Counter()
+        self.bytes_uploaded = 0
+        self._lock = threading.Lock()
+
+    def _request(self, operation, bucket):
+        with self._lock:
+            self.requests[operation] += 1
+        self.latency.wait()
+        if self.latency.fails():
+            raise service_error('InternalError', operation)
+        if bucket not in self.buckets:
+            raise service_error('NoSuchBucket', operation)
+        return self.buckets[bucket]
+
+    def _object(self, operation, bucket, key, missing='NoSuchKey'):
+        objects = self._request(operation, bucket)
+        if key not in objects:
+            if missing == 'NoSuchKey':
+                raise FakeS3Exceptions.NoSuchKey({'Error': {'Code': missing, 'Message': "Simulated NoSuchKey"}}, operation)
+            raise service_error(missing, operation)
+        return objects[key]
+
+    def put_object(self, Bucket, Key, Body=b'', Metadata=None, ContentType='binary/octet-stream', **kwargs):
+        objects = self._request('PutObject', Bucket)
+        body = Body.encode('utf-8') if isinstance(Body, str) else bytes(Body)
+        with self._lock:
+            self.bytes_uploaded += len(body)
+            objects[Key] = {'Body': body, 'Metadata': dict(Metadata or {}), 'ContentType': ContentType}
+        return {'ETag': f'"{hash(body) & 0xffffffff:08x}"'}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        stored = self._object('GetObject', Bucket, Key)
+        return {**self._head(stored), 'Body': io.BytesIO(stored['Body'])}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        # HEAD responses carry no body, so S3 reports a missing key as a bare 404
+        return self._head(self._object('HeadObject', Bucket, Key, missing='404'))
+
+    def copy_object(self, Bucket, Key, CopySource, MetadataDirective='COPY', Metadata=None, **kwargs):
+        objects = self._request('CopyObject', Bucket)
+        stored = self.buckets.get(CopySource['Bucket'], {}).get(CopySource['Key'])
+        if stored is None:
+            raise service_error('NoSuchKey', 'CopyObject')
+        with self._lock:
+            objects[Key] = {
+                **stored,
+                'Metadata': dict(Metadata or {}) if MetadataDirective == 'REPLACE' else dict(stored['Metadata']),
+            }
+        return {'CopyObjectResult': {}}
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000, ContinuationToken=None, **kwargs):
+        objects = self._request('ListObjectsV2', Bucket)
+        with self._lock:
+            keys = sorted(key for key in objects if key.startswith(Prefix) and key > (ContinuationToken or ''))
+        page = {'KeyCount': min(len(keys), MaxKeys), 'IsTruncated': len(keys) > MaxKeys}
+        if keys:
+            page['Contents'] = [{'Key': key, 'Size': len(objects[key]['Body'])} for key in keys[:MaxKeys]]
+        if page['IsTruncated']:
+            page['NextContinuationToken'] = keys[MaxKeys - 1]
+        return page
+
+    def get_paginator(self, operation_name):
+        assert operation_name == 'list_objects_v2', operation_name
+        return FakeListObjectsPaginator(self)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, **kwargs):
+        with open(Filename, 'rb') as f:
+            self.put_object(Bucket=Bucket, Key=Key, Body=f.read(), **(ExtraArgs or {}))
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        # The transfer manager HEADs the object first, so a missing key is a bare 404
+        stored = self._object('HeadObject', Bucket, Key, missing='404')
+        with open(Filename, 'wb') as f:
+            f.write(stored['Body'])
+
+    def object_text(self, bucket, key):
+        return self.buckets[bucket][key]['Body'].decode('utf-8')
+
+    @staticmethod
+    def _head(stored):
+        return {'ContentLength': len(stored['Body']), 'ContentType': stored['ContentType'], 'Metadata': dict(stored['Metadata'])}
+
+
+class FakeListObjectsPaginator:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, **kwargs):
+        token = None
+        while True:
+            page = self.s3.list_objects_v2(ContinuationToken=token, **kwargs)
+            yield page
+            if not page['IsTruncated']:
+                return
+            token = page['NextContinuationToken']
+
+
+SPACK_PASSAGES = [
+    ("Mirrors", "https://spack.readthedocs.io/en/latest/mirrors.html",
+     "A mirror is a URL that points to a directory containing Spack packages. Use spack mirror add <name> <url> "
+     "to register a mirror and spack mirror create to populate one for offline installs."),
+    ("Environments", "https://spack.readthedocs.io/en/latest/environments.html",
+     "An environment is a set of specs built together. spack env create myenv makes one, spack env activate "
+     "switches to it, spack add queues specs and spack install builds everything in the environment."),
+    ("Compilers", "https://spack.readthedocs.io/en/latest/getting_started.html",
+     "spack compiler find searches PATH for compilers and adds them to compilers.yaml. Use spack compilers to "
+     "list what Spack knows about and %gcc@12 in a spec to pick one."),
+    ("Build caches", "https://spack.readthedocs.io/en/latest/binary_caches.html",
+     "Binary caches hold prebuilt packages. spack buildcache push uploads installed specs to a mirror, and "
+     "spack install uses matching binaries from configured mirrors instead of building from source."),
+    ("Spec syntax", "https://spack.readthedocs.io/en/latest/basic_usage.html",
+     "Specs describe what to build: a package name, @version, %compiler, +variant or ~variant, and ^dependency "
+     "constraints, for example hdf5@1.14 +mpi ^openmpi."),
+]
+
+
+class FakeKendra:
+    """
+    kendra stand-in whose `retrieve` returns Retrieve API result items.
+
+    Passages are (title, uri, content) tuples; the first `top_k` come back with descending
+    confidence for every query.
+    """
+
+    CONFIDENCE = ["VERY_HIGH", "HIGH", "MEDIUM", "LOW"]
+
+    def __init__(self, passages=SPACK_PASSAGES, top_k=5, latency=None):
+        self.passages = passages
+        self.top_k = top_k
+        self.latency = latency or LatencyModel()
+        self.queries = []
+
+    def retrieve(self, IndexId, QueryText, **kwargs):
+        self.queries.append(QueryText)
+        self.latency.wait()
+        if self.latency.fails():
+            raise service_error('InternalServerException', 'Retrieve')
+        return {
+            'QueryId': f"query-{len(self.queries)}",
+            'ResultItems': [
+                {
+                    'Id': f"{IndexId}-{i}",
+                    'DocumentId': uri,
+                    'DocumentTitle': title,
+                    'DocumentURI': uri,
+                    'Content': content,
+                    'ScoreAttributes': {'ScoreConfidence': self.CONFIDENCE[min(i, len(self.CONFIDENCE) - 1)]},
+                }
+                for i, (title, uri, content) in enumerate(self.passages[:self.top_k])
+            ],
+        }
+
+
+class FakeSlackResponse:
+    def __init__(self, status, payload, headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self.data = json.dumps(payload).encode('utf-8')
+
+
+class FakeSlackHttp:
+    """
+    urllib3.PoolManager stand-in for the Slack Web API, e.g. `SlackClient(token, http=FakeSlackHttp())`.
+
+    Answers auth.test, chat.postMessage, chat.update and chat.delete like Slack does. A failed request comes
+    back as HTTP 429 with a Retry-After header, the way Slack rejects rate-limited calls.
+    """
+
+    def __init__(self, latency=None, retry_after=1):
+        self.latency = latency or LatencyModel()
+        self.retry_after = retry_after
+        self.requests = []
+        self._ts = 0
+
+    def request(self, method, url, headers=None, body=None, fields=None, **kwargs):
+        self.requests.append((method, url, body if body is not None else fields))
+        self.latency.wait()
+        if self.latency.fails():
+            return FakeSlackResponse(429, {'ok': False, 'error': 'ratelimited'}, {'Retry-After': str(self.retry_after)})
+
+        api_method = url.rsplit('/', 1)[-1].split('?', 1)[0]
+        if api_method == 'auth.test':
+            return FakeSlackResponse(200, {'ok': True, 'team': 'Spack', 'user': 'spackbot', 'user_id': 'B1'})
+        if api_method == 'chat.postMessage':
+            self._ts += 1
+            return FakeSlackResponse(200, {'ok': True, 'channel': json.loads(body)['channel'], 'ts': f"{self._ts}.000100"})
+        if api_method in ('chat.update', 'chat.delete'):
+            data = json.loads(body)
+            return FakeSlackResponse(200, {'ok': True, 'channel': data['channel'], 'ts': data['ts']})
+        return FakeSlackResponse(200, {'ok': False, 'error': 'unknown_method'})
+
+
+class FakeSlackServer:
+    """
+    Local HTTP server for the read side of the Slack Web API: auth.test, conversations.info,
+    conversations.history and conversations.replies, with cursor pagination.
+
+    Unlike FakeSlackHttp it listens on a real socket, so connection pooling and concurrency are
+    exercised too: `SlackClient(token, base_url=server.url)`. `history` maps a channel to its
+    messages, newest first, and `threads` maps (channel, ts) to a thread, parent first. `limits`
+    maps a method to (requests, window seconds); calls over it get HTTP 429 with Retry-After,
+    and `latency` failures come back as HTTP 500.
+    """
+
+    def __init__(self, history=None, threads=None, latency=None, limits=None, max_page_size=200):
+        self.history = history or {}
+        self.threads = threads or {}
+        self.latency = latency or LatencyModel()
+        self.limits = limits or {}
+        self.max_page_size = max_page_size
+        self.requests = collections.Counter()
+        self.rate_limited = collections.Counter()
+        self._calls = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @classmethod
+    def synthetic(cls, channel, messages, thread_share=0.4, max_replies=300, seed=0, **kwargs):
+        """A channel of `messages`, `thread_share` of them threads with 1 to `max_replies` replies."""
+        rng = random.Random(seed)
+        history, threads = [], {}
+        for i in range(messages):
+            ts = f"{1700000000 + messages - i}.000100"
+            message = {'type': 'message', 'user': f"U{rng.randrange(50)}", 'text': f"Message {i} about spack", 'ts': ts}
+            if rng.random() < thread_share:
+                replies = rng.randint(1, max_replies)
+                message['reply_count'] = replies
+                threads[(channel, ts)] = [dict(message)] + [
+                    {'type': 'message', 'user': f"U{rng.randrange(50)}", 'text': f"Reply {j} to {i}",
+                     'ts': f"{ts[:-4]}{j:04d}", 'thread_ts': ts}
+                    for j in range(1, replies + 1)
+                ]
+            history.append(message)
+        return cls(history={channel: history}, threads=threads, **kwargs)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/api/"
+
+    def __enter__(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                params = dict(urllib.parse.parse_qsl(url.query))
+                status, payload, headers = fake.handle(url.path.rsplit('/', 1)[-1], params)
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                for name, value in dict(headers, **{'Content-Type': 'application/json',
+                                                    'Content-Length': str(len(body))}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-slack", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _retry_after(self, method):
+        if method not in self.limits:
+            return None
+        requests, window = self.limits[method]
+        now = time.monotonic()
+        with self._lock:
+            calls = self._calls[method]
+            while calls and calls[0] <= now - window:
+                calls.popleft()
+            if len(calls) >= requests:
+                return calls[0] + window - now
+            calls.append(now)
+        return None
+
+    def handle(self, method, params):
+        self.requests[method] += 1
+        retry_after = self._retry_after(method)
+        if retry_after is not None:
+            self.rate_limited[method] += 1
+            return 429, {'ok': False, 'error': 'ratelimited'}, {'Retry-After': str(max(math.ceil(retry_after), 1))}
+        self.latency.wait()
+        if self.latency.fails():
+            return 500, {'ok': False, 'error': 'internal_error'}, {}
+
+        if method == 'auth.test':
+            return 200, {'ok': True, 'team': 'Spack', 'user': 'spackbot', 'user_id': 'B1'}, {}
+        if method == 'conversations.info':
+            if params.get('channel') not in self.history:
+                return 200, {'ok': False, 'error': 'channel_not_found'}, {}
+            return 200, {'ok': True, 'channel': {'id': params['channel'], 'name': 'spack'}}, {}
+        if method == 'conversations.history':
+            oldest = float(params.get('oldest') or 0)
+            items = [m for m in self.history.get(params.get('channel'), []) if float(m['ts']) > oldest]
+        elif method == 'conversations.replies':
+            items = self.threads.get((params.get('channel'), params.get('ts')))
+            if items is None:
+                return 200, {'ok': False, 'error': 'thread_not_found'}, {}
+        else:
+            return 200, {'ok': False, 'error': 'unknown_method'}, {}
+
+        start = int(params.get('cursor') or 0)
+        end = start + min(int(params.get('limit') or 100), self.max_page_size)
+        next_cursor = str(end) if end < len(items) else ""
+        return 200, {
+            'ok': True,
+            'messages': items[start:end],
+            'has_more': bool(next_cursor),
+            'response_metadata': {'next_cursor': next_cursor},
+        }, {}
+
+
+class FakeStreamingBedrock:
+    """
+    bedrock-runtime stand-in that replies with a fixed answer.
+
+    `invoke_model_with_response_stream` emits the answer as Anthropic messages-API stream events,
+    `chunk_size` characters per delta. It waits `first_token_latency` seconds before the first
+    delta, or a sample of `latency` when given, and `token_interval` seconds between deltas.
+    """
+
+    def __init__(self, answer="Use `spack mirror add <name> <url>` to add a mirror.", chunk_size=8,
+                 first_token_latency=0.0, token_interval=0.0, latency=None):
+        self.answer = answer
+        self.chunk_size = chunk_size
+        self.first_token_latency = first_token_latency
+        self.token_interval = token_interval
+        self.latency = latency
+        self.requests = []
+
+    def _first_token_latency(self):
+        return self.latency.sample() if self.latency is not None else self.first_token_latency
+
+    def invoke_model(self, modelId, body):
+        self.requests.append((modelId, json.loads(body)))
+        time.sleep(self._first_token_latency() + self.token_interval * len(self._chunks()))
+        payload = {
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "text", "text": self.answer}],
+            "stop_reason": "end_turn",
+            "usage": {"input_tokens": self._prompt_tokens(body), "output_tokens": self._output_tokens()},
+        }
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+    def invoke_model_with_response_stream(self, modelId, body):
+        self.requests.append((modelId, json.loads(body)))
+        return {"body": self._events(self._prompt_tokens(body))}
+
+    def _chunks(self):
+        return [self.answer[i:i + self.chunk_size] for i in range(0, len(self.answer), self.chunk_size)]
+
+    @staticmethod
+    def _prompt_tokens(body):
+        # Same 4 characters per token estimate as packing.py
+        return sum(len(block["text"]) for message in json.loads(body).get("messages", []) for block in message["content"]) // 4
+
+    def _output_tokens(self):
+        return len(self.answer) // 4
+
+    def _events(self, prompt_tokens):
+        yield self._event({
+            "type": "message_start",
+            "message": {"role": "assistant", "content": [], "usage": {"input_tokens": prompt_tokens, "output_tokens": 1}},
+        })
+        yield self._event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        time.sleep(self._first_token_latency())
+        for i, chunk in enumerate(self._chunks()):
+            if i:
+                time.sleep(self.token_interval)
+            yield self._event({
+                "type": "content_block_delta",
+                "index": 0,
+                "delta": {"type": "text_delta", "text": chunk},
+            })
+        yield self._event({"type": "content_block_stop", "index": 0})
+        yield self._event({
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn"},
+            "usage": {"output_tokens": self._output_tokens()},
+        })
+        yield self._event({"type": "message_stop"})
+
+    @staticmethod
+    def _event(payload):
+        return {"chunk": {"bytes": json.dumps(payload).encode("utf-8")}}
+
+
+class ThrottlingBedrock:
+    """
+    Wraps a bedrock-runtime stand-in and raises ThrottlingException on a schedule.
+
+    `schedule(model_id, call_number)` decides whether a call is throttled; call numbers count
+    from 0 per model. Use `every_nth`, `first_n` or `always` to build one.
+    """
+
+    def __init__(self, inner, schedule):
+        self.inner = inner
+        self.schedule = schedule
+        self.calls = {}
+
+    def invoke_model(self, modelId, body):
+        self._maybe_throttle(modelId, 'InvokeModel')
+        return self.inner.invoke_model(modelId=modelId, body=body)
+
+    def invoke_model_with_response_stream(self, modelId, body):
+        self._maybe_throttle(modelId, 'InvokeModelWithResponseStream')
+        return self.inner.invoke_model_with_response_stream(modelId=modelId, body=body)
+
+    def _maybe_throttle(self, model_id, operation):
+        call_number = self.calls.get(model_id, 0)
+        self.calls[model_id] = call_number + 1
+        if self.schedule(model_id, call_number):
+            raise ClientError(
+                {'Error': {'Code': 'ThrottlingException', 'Message': 'Too many requests, please wait.'}},
+                operation,
+            )
+
+    @staticmethod
+    def every_nth(n):
+        return lambda model_id, call_number: call_number % n == 0
+
+    @staticmethod
+    def first_n(n, model_ids=None):
+        return lambda model_id, call_number: call_number < n and (model_ids is None or model_id in model_ids)
+
+    @staticmethod
+    def always(model_ids):
+        return lambda model_id, call_number: model_id in model_ids
+
+    @staticmethod
+    def at_rate(error_rate, seed=None):
+        rng = random.Random(seed)
+        return lambda model_id, call_number: rng.random() < error_rate
@@ -0,0 +1,16 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Each Lambda imports its modules flat from its own directory. The two `index` handlers are not
+# imported here, since slack_bot and slack_ingest would shadow each other's
+for path in ("common", "slack_ingest", "slack_bot"):
+    path = os.path.join(ROOT, "lambdas", path)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Required settings read when rag is imported; nothing here reaches AWS
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("kendra_index_id", "unit-test")
+os.environ.setdefault("model_id", "anthropic.claude-v2:1")
@@ -0,0 +1,51 @@
+from answer_cache import AnswerCache, SqliteAnswerStore
+
+QUESTION = "How do I add a mirror?"
+
+
+class FailingStore(SqliteAnswerStore):
+    def get(self, key):
+        raise RuntimeError("table unavailable")
+
+    def put(self, key, value, ttl):
+        raise RuntimeError("table unavailable")
+
+
+def test_answers_are_cached_per_index_version():
+    cache = AnswerCache()
+    cache.put(QUESTION, "v1", "Run spack mirror add.", "*Sources:*")
+
+    assert cache.get(QUESTION, "v1") == {'index_version': "v1", 'answer': "Run spack mirror add.",
+                                         'sources': "*Sources:*"}
+    # Normalized questions share an entry
+    assert cache.get("  how do i add a MIRROR ", "v1")['answer'] == "Run spack mirror add."
+    assert cache.get("How do I remove a mirror?", "v1") is None
+
+
+def test_a_new_index_version_drops_the_entry_from_both_tiers():
+    store = SqliteAnswerStore()
+    cache = AnswerCache(store=store)
+    cache.put(QUESTION, "v1", "Run spack mirror add.", "")
+
+    assert cache.get(QUESTION, "v2") is None
+    assert store.get(AnswerCache.key(QUESTION)) is None
+    # Not served again to a reader still on the old version either
+    assert cache.get(QUESTION, "v1") is None
+
+
+def test_shared_store_hits_fill_the_local_tier():
+    store = SqliteAnswerStore()
+    AnswerCache(store=store).put(QUESTION, "v1", "Run spack mirror add.", "")
+    cache = AnswerCache(store=store)
+
+    assert cache.get(QUESTION, "v1")['answer'] == "Run spack mirror add."
+    store.delete(AnswerCache.key(QUESTION))
+    assert cache.get(QUESTION, "v1")['answer'] == "Run spack mirror add."
+
+
+def test_store_failures_fall_back_to_the_local_tier():
+    cache = AnswerCache(store=FailingStore())
+
+    assert cache.get(QUESTION, "v1") is None
+    cache.put(QUESTION, "v1", "Run spack mirror add.", "")
+    assert cache.get(QUESTION, "v1")['answer'] == "Run spack mirror add."
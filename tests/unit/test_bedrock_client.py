@@ -0,0 +1,148 @@
+import time
+
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+from bedrock_client import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ResilientBedrock
+from rate_limit import TokenBucket
+from tests.fakes import service_error
+
+
+def test_breaker_opens_after_consecutive_throttles():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+
+    assert [breaker.record_throttle() for _ in range(3)] == [False, False, True]
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_throttle()
+    breaker.record_success()
+
+    assert not breaker.record_throttle()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_trial_closes_or_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_throttle()
+
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    assert breaker.record_throttle()
+    assert breaker.state == OPEN
+
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_token_bucket_allows_a_burst_then_reports_the_wait():
+    bucket = TokenBucket(rate=10, capacity=2)
+
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert 0 < bucket.try_acquire() <= 0.1
+
+
+def test_token_bucket_acquire_gives_up_after_timeout():
+    bucket = TokenBucket(rate=1, capacity=1)
+    bucket.try_acquire()
+
+    assert bucket.acquire(timeout=0.01) is None
+
+
+def test_token_bucket_defer_pushes_the_next_token_back():
+    bucket = TokenBucket(rate=10, capacity=5)
+
+    bucket.defer(2)
+
+    assert bucket.try_acquire() == pytest.approx(2, abs=0.01)
+
+
+class ScriptedBedrock:
+    """bedrock-runtime stand-in that raises or returns the next scripted outcome per call."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.calls.append(modelId)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def resilient(client, model_ids=("primary",), max_attempts=4):
+    return ResilientBedrock(client, list(model_ids), max_attempts=max_attempts, base_delay=0, max_delay=0,
+                            limiter=TokenBucket(rate=1000, capacity=1000))
+
+
+@pytest.mark.parametrize("error", [
+    service_error('ThrottlingException', 'InvokeModel'),
+    service_error('InternalServerException', 'InvokeModel'),
+    ReadTimeoutError(endpoint_url="https://bedrock-runtime"),
+])
+def test_retries_throttles_server_and_network_errors(error):
+    client = ScriptedBedrock([error, {'body': "ok"}])
+
+    assert resilient(client).invoke_model("{}") == {'body': "ok"}
+    assert client.calls == ["primary", "primary"]
+
+
+def test_does_not_retry_invalid_requests():
+    client = ScriptedBedrock([service_error('ValidationException', 'InvokeModel')])
+
+    with pytest.raises(ClientError):
+        resilient(client).invoke_model("{}")
+    assert client.calls == ["primary"]
+
+
+def test_falls_back_when_the_breaker_opens():
+    throttle = service_error('ThrottlingException', 'InvokeModel')
+    client = ScriptedBedrock([throttle] * 5 + [{'body': "fallback"}])
+    bedrock = resilient(client, model_ids=("primary", "fallback"), max_attempts=6)
+
+    assert bedrock.invoke_model("{}") == {'body': "fallback"}
+    assert client.calls == ["primary"] * 5 + ["fallback"]
+    assert bedrock.breakers["primary"].state == OPEN
+
+
+def test_transient_errors_do_not_open_the_breaker():
+    client = ScriptedBedrock([service_error('InternalServerException', 'InvokeModel')] * 6)
+    bedrock = resilient(client, max_attempts=6)
+
+    with pytest.raises(ClientError):
+        bedrock.invoke_model("{}")
+    assert bedrock.breakers["primary"].state == CLOSED
+
+
+def test_half_open_trial_failing_without_a_throttle_reopens_the_breaker():
+    client = ScriptedBedrock([
+        service_error('ThrottlingException', 'InvokeModel'),
+        service_error('ValidationException', 'InvokeModel'),
+        {'body': "ok"},
+    ])
+    bedrock = resilient(client, max_attempts=1)
+    breaker = bedrock.breakers["primary"] = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+
+    with pytest.raises(ClientError):
+        bedrock.invoke_model("{}")
+    assert breaker.state == OPEN
+
+    time.sleep(0.05)
+    with pytest.raises(ClientError) as error:
+        bedrock.invoke_model("{}")
+    assert error.value.response['Error']['Code'] == 'ValidationException'
+    assert breaker.state == OPEN
+
+    # Rejected until the reset timeout has passed again, then the next trial goes through
+    with pytest.raises(Exception, match="Circuit open"):
+        bedrock.invoke_model("{}")
+    time.sleep(0.05)
+    assert bedrock.invoke_model("{}") == {'body': "ok"}
+    assert breaker.state == CLOSED
@@ -0,0 +1,62 @@
+from checkpoint import Checkpoint, IncrementalScan, InMemoryCheckpointStore
+
+
+def message(ts, reply_count=0, latest_reply=None):
+    value = {'ts': ts, 'text': f"message {ts}"}
+    if reply_count:
+        value.update(reply_count=reply_count, latest_reply=latest_reply)
+    return value
+
+
+def test_selects_messages_newer_than_the_watermark():
+    scan = IncrementalScan(Checkpoint(watermark="100.0", threads={}), active_since=0)
+
+    selected = list(scan.select([message("120.0"), message("110.0"), message("100.0"), message("90.0")]))
+
+    assert [m['ts'] for m in selected] == ["120.0", "110.0"]
+    assert scan.new_messages == 2
+    assert scan.checkpoint().watermark == "120.0"
+
+
+def test_selects_old_threads_with_new_replies():
+    checkpoint = Checkpoint(watermark="100.0", threads={"50.0": "95.0", "60.0": "99.0"})
+    scan = IncrementalScan(checkpoint, active_since=0)
+
+    selected = list(scan.select([
+        message("60.0", reply_count=3, latest_reply="99.0"),
+        message("50.0", reply_count=4, latest_reply="105.0"),
+        # First reply to an untracked message since the last run
+        message("40.0", reply_count=1, latest_reply="101.0"),
+        message("30.0", reply_count=1, latest_reply="80.0"),
+    ]))
+
+    assert [m['ts'] for m in selected] == ["50.0", "40.0"]
+    assert (scan.new_messages, scan.updated_threads) == (0, 2)
+    assert scan.checkpoint().threads == {"50.0": "105.0", "60.0": "99.0", "40.0": "101.0"}
+    assert scan.checkpoint().watermark == "100.0"
+
+
+def test_threads_quiet_since_the_active_window_are_dropped():
+    checkpoint = Checkpoint(watermark="100.0", threads={"10.0": "20.0", "50.0": "95.0"})
+    scan = IncrementalScan(checkpoint, active_since=90)
+
+    list(scan.select([message("110.0", reply_count=1, latest_reply="85.0")]))
+
+    assert scan.checkpoint().threads == {"50.0": "95.0"}
+
+
+def test_threads_before_lists_tracked_parents_older_than_the_history_read():
+    checkpoint = Checkpoint(watermark="100.0", threads={"10.0": "95.0", "30.0": "96.0", "80.0": "97.0"})
+    scan = IncrementalScan(checkpoint, active_since=90)
+
+    assert scan.threads_before(50) == ["30.0", "10.0"]
+
+
+def test_checkpoint_round_trip():
+    store = InMemoryCheckpointStore()
+    checkpoint = Checkpoint(watermark="100.0", threads={"50.0": "95.0"})
+
+    store.put("C1", checkpoint.to_dict())
+
+    assert Checkpoint.from_dict(store.get("C1")) == checkpoint
+    assert store.get("C2") is None
@@ -0,0 +1,59 @@
+from citations import attribute_sentences, build_sources, rank_results, relative_confidence
+
+
+def result(uri, content, confidence="HIGH"):
+    return {'DocumentURI': uri, 'Content': content, 'ScoreAttributes': {'ScoreConfidence': confidence}}
+
+
+MIRRORS = result("https://spack.readthedocs.io/mirrors.html",
+                 "Use spack mirror add to register a mirror, then spack mirror list shows configured mirrors.")
+ENVIRONMENTS = result("https://spack.readthedocs.io/environments.html",
+                      "spack env create makes an environment and spack env activate switches to it.", "VERY_HIGH")
+SLACK_THREAD = result("https://example.cloudfront.net/C1-1700000000.000100.txt",
+                      "In our thread we registered the site mirror with spack mirror add.", "LOW")
+
+
+def test_rank_results_is_stable_within_a_bucket():
+    first, second = result("a", "x", "HIGH"), result("b", "y", "HIGH")
+
+    assert rank_results([first, ENVIRONMENTS, second]) == [ENVIRONMENTS, first, second]
+
+
+def test_sources_are_numbered_deduplicated_and_ordered_by_score():
+    duplicate = result(MIRRORS['DocumentURI'], "Mirrors can also be removed with spack mirror remove.", "LOW")
+
+    assert build_sources([MIRRORS, ENVIRONMENTS, duplicate]) == (
+        "*Sources:*\n"
+        " [1] https://spack.readthedocs.io/environments.html\n"
+        " [2] https://spack.readthedocs.io/mirrors.html"
+    )
+
+
+def test_sources_cite_only_passages_the_answer_uses():
+    answer = "Run spack mirror add to register a mirror. Then spack mirror list shows configured mirrors."
+
+    assert build_sources([MIRRORS, ENVIRONMENTS, SLACK_THREAD], answer=answer) == (
+        "*Sources:*\n [1] https://spack.readthedocs.io/mirrors.html"
+    )
+
+
+def test_sources_fall_back_to_top_results_when_nothing_matches():
+    sources = build_sources([MIRRORS, ENVIRONMENTS], answer="I am not sure.", max_sources=1)
+
+    assert sources == "*Sources:*\n [1] https://spack.readthedocs.io/environments.html"
+
+
+def test_no_results_means_no_sources_block():
+    assert build_sources([]) == ""
+
+
+def test_attribute_sentences():
+    answer = "Use spack env create to make an environment. Bananas are yellow."
+
+    assert attribute_sentences(answer, [MIRRORS, ENVIRONMENTS]) == [
+        ("Use spack env create to make an environment.", ENVIRONMENTS['DocumentURI']),
+    ]
+
+
+def test_relative_confidence_buckets():
+    assert [relative_confidence(score) for score in (1.0, 0.7, 0.5, 0.1)] == ["VERY_HIGH", "HIGH", "MEDIUM", "LOW"]
@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+
+import config_loader
+from config_loader import ParameterLoader
+from tests.fakes import FakeSSM
+
+NAMES = ["/Radiuss/Spack/ParentChannel", "/Radiuss/Spack/SlackbotMemberId", "/Radiuss/Spack/IndexVersion"]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class GatedSSM(FakeSSM):
+    """FakeSSM whose get_parameters blocks while `gate` is clear."""
+
+    def __init__(self, parameters):
+        super().__init__(parameters)
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def get_parameters(self, Names):
+        self.gate.wait(5)
+        return super().get_parameters(Names)
+
+
+@pytest.fixture
+def recorded_metrics(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(config_loader.metrics, 'add_metric', lambda name, **kwargs: recorded.append(name))
+    return recorded
+
+
+def wait_for_refresh():
+    for thread in threading.enumerate():
+        if thread.name == "parameter-refresh":
+            thread.join(5)
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def ssm():
+    return GatedSSM({name: f"{name}-v1" for name in NAMES})
+
+
+@pytest.fixture
+def loader(ssm, clock):
+    return ParameterLoader(NAMES + [None], ttl=300, client=ssm, clock=clock)
+
+
+def test_values_are_cached_until_they_expire(loader, ssm, clock, recorded_metrics):
+    assert loader.get_all() == {name: f"{name}-v1" for name in NAMES}
+    ssm.parameters[NAMES[0]] = "v2"
+
+    clock.now += 200
+    assert loader.get(NAMES[0]) == f"{NAMES[0]}-v1"
+
+    clock.now += 100
+    assert loader.get(NAMES[0]) == "v2"
+    assert ssm.requests['GetParameters'] == 2
+    assert recorded_metrics == ["ParameterCacheMiss", "ParameterCacheHit", "ParameterCacheMiss"]
+    assert (loader.hits, loader.misses) == (1, 2)
+
+
+def test_entries_past_refresh_ahead_are_reloaded_in_the_background(loader, ssm, clock, recorded_metrics):
+    loader.get_all()
+    ssm.parameters[NAMES[0]] = "v2"
+    ssm.gate.clear()
+
+    # Past 80% of the TTL the cached value is served while SSM is still being called
+    clock.now += 240
+    assert loader.get(NAMES[0]) == f"{NAMES[0]}-v1"
+    assert loader.get(NAMES[0]) == f"{NAMES[0]}-v1"
+
+    ssm.gate.set()
+    wait_for_refresh()
+    assert loader.get(NAMES[0]) == "v2"
+    # One foreground load and a single background refresh, however many reads saw the old value
+    assert ssm.requests['GetParameters'] == 2
+    assert recorded_metrics == ["ParameterCacheMiss"] + ["ParameterCacheHit"] * 3
+
+
+def test_failed_background_refresh_keeps_serving_cached_values(loader, ssm, clock):
+    loader.get_all()
+    del ssm.parameters[NAMES[0]]
+
+    clock.now += 240
+    loader.get_all()
+    wait_for_refresh()
+    assert loader.get(NAMES[0]) == f"{NAMES[0]}-v1"
+
+    # Once fully expired, the load blocks and fails
+    clock.now += 60
+    with pytest.raises(Exception, match="Parameters not found"):
+        loader.get_all()
+
+
+def test_more_than_ten_names_are_loaded_in_batches(clock):
+    names = [f"/Radiuss/Parameter{i}" for i in range(23)]
+    ssm = FakeSSM({name: name.upper() for name in names})
+
+    loader = ParameterLoader(names, client=ssm, clock=clock)
+
+    assert loader.get_all() == {name: name.upper() for name in names}
+    assert ssm.requests['GetParameters'] == 3
+
+
+def test_invalidate_forces_a_reload(loader, ssm):
+    loader.get_all()
+    loader.invalidate()
+    loader.get_all()
+
+    assert ssm.requests['GetParameters'] == 2
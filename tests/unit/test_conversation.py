@@ -0,0 +1,124 @@
+import pytest
+
+import index
+from answer_cache import AnswerCache
+from conversation import (
+    Conversation, ConversationMemory, InMemoryConversationStore, Turn, compact, retrieval_query, summarize_turns,
+)
+
+QUESTION = "How do I add a mirror to my spack setup?"
+
+
+def turn(i):
+    # About 10 tokens of question and 100 of answer
+    return Turn(f"Question {i}: " + "q" * 28, f"Answer {i} first sentence. " + "a" * 372)
+
+
+def test_summary_keeps_one_line_per_turn_with_the_first_sentence():
+    summary = summarize_turns("", [Turn("How do I add a mirror?", "Run spack mirror add. Then run spack buildcache.")])
+
+    assert summary == "- Asked: How do I add a mirror? Answered: Run spack mirror add."
+
+
+def test_summary_drops_the_oldest_lines_over_budget():
+    summary = summarize_turns("", [turn(i) for i in range(10)], token_budget=60)
+
+    assert summary.splitlines()[-1].startswith("- Asked: Question 9")
+    assert "Question 0" not in summary
+    assert Conversation(summary).tokens <= 60
+
+
+def test_compact_leaves_a_conversation_under_budget_alone():
+    conversation = Conversation("", (turn(0), turn(1)), "topic")
+
+    assert compact(conversation, token_budget=300) == conversation
+
+
+def test_compact_rolls_the_oldest_turns_into_the_summary():
+    compacted = compact(Conversation("", tuple(turn(i) for i in range(5)), "topic"), token_budget=300)
+
+    assert compacted.tokens <= 300
+    assert compacted.turns == (turn(3), turn(4))
+    assert [line.split(":")[1].strip() for line in compacted.summary.splitlines()] == ["Question 0", "Question 1",
+                                                                                       "Question 2"]
+    assert compacted.topic == "topic"
+
+
+def test_compact_clips_a_single_turn_over_budget():
+    question = "How do I add a mirror?"
+    compacted = compact(Conversation("", (Turn(question, "a" * 4000),)), token_budget=100)
+
+    assert compacted.turns[0].question == question
+    assert compacted.turns[0].answer.endswith("...")
+    assert compacted.tokens <= 100
+
+
+def test_memory_stays_within_budget_and_keeps_the_latest_turn():
+    memory = ConversationMemory(InMemoryConversationStore(), token_budget=300)
+
+    for i in range(8):
+        memory.record("C1", "1.0", *turn(i))
+
+    conversation = memory.get("C1", "1.0")
+    assert conversation.tokens <= 300
+    assert conversation.turns[-1] == turn(7)
+    assert conversation.topic.startswith("Question 0")
+    assert not memory.get("C1", "2.0")
+
+
+def test_memory_treats_store_failures_as_no_history():
+    class FailingStore(InMemoryConversationStore):
+        def get(self, key):
+            raise RuntimeError("table unavailable")
+
+        def put(self, key, value, ttl):
+            raise RuntimeError("table unavailable")
+
+    memory = ConversationMemory(FailingStore())
+
+    assert memory.get("C1", "1.0") == Conversation()
+    assert memory.record("C1", "1.0", "question", "answer").turns == (Turn("question", "answer"),)
+
+
+def test_short_follow_ups_are_retrieved_with_the_topic():
+    history = Conversation("", (Turn(QUESTION, "Run spack mirror add."),), topic=QUESTION)
+
+    assert retrieval_query("what about on macOS?", history) == f"{QUESTION} what about on macOS?"
+    long_question = "How do I make spack use a buildcache on a shared filesystem?"
+    assert retrieval_query(long_question, history) == long_question
+    assert retrieval_query("what about on macOS?", Conversation()) == "what about on macOS?"
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    queries = []
+    replies = []
+
+    class RecordingRetrieval:
+        def retrieve(self, query, index_version=None):
+            queries.append(query)
+            return {'ResultItems': []}
+
+    monkeypatch.setattr(index, 'index_version_param_name', None)
+    monkeypatch.setattr(index, 'answer_cache', AnswerCache())
+    monkeypatch.setattr(index, 'retrieval_cache', RecordingRetrieval())
+    monkeypatch.setattr(index, 'conversation_memory', ConversationMemory(InMemoryConversationStore()))
+    monkeypatch.setattr(index, 'stream_answers', False)
+    monkeypatch.setattr(index, 'call_bedrock', lambda prompt: "Run spack mirror add.")
+    monkeypatch.setattr(index, 'respond_to_question', lambda **kwargs: replies.append(kwargs))
+    return queries, replies
+
+
+def test_follow_ups_skip_the_answer_cache_and_use_the_topic(bot):
+    queries, replies = bot
+
+    index.answer_question("C1", "U1", "1.0", QUESTION)
+    # The same question in a new thread is answered from the cache
+    index.answer_question("C1", "U1", "2.0", QUESTION)
+    assert queries == [QUESTION]
+
+    # In a thread with history the answer depends on the conversation, so it is not cached
+    index.answer_question("C1", "U1", "1.1", QUESTION, thread_ts="1.0")
+    index.answer_question("C1", "U1", "1.2", "what about on macOS?", thread_ts="1.0")
+    assert queries == [QUESTION, QUESTION, f"{QUESTION} what about on macOS?"]
+    assert [reply['ts'] for reply in replies] == ["1.0", "2.0", "1.0", "1.0"]
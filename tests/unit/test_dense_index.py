@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from dense_index import DenseIndex, HashingEmbedder, build_dense_index, normalize, quantize
+
+PASSAGES = [
+    ("spack mirror add registers a mirror for binary and source downloads.", {'title': "Mirrors", 'uri': "m", 'document_id': "m"}),
+    ("spack env create makes an environment and spack env activate switches to it.", {'title': "Environments", 'uri': "e", 'document_id': "e"}),
+    ("spack compiler find adds compilers from PATH to compilers.yaml.", {'title': "Compilers", 'uri': "c", 'document_id': "c"}),
+]
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self, dimensions=64):
+        super().__init__(dimensions)
+        self.embedded = []
+
+    def embed(self, texts):
+        self.embedded.extend(texts)
+        return super().embed(texts)
+
+
+def test_quantize_round_trip():
+    vectors = normalize(np.random.default_rng(0).normal(size=(20, 32)))
+
+    rows, scales = quantize(vectors)
+
+    assert rows.dtype == np.int8 and scales.dtype == np.float32
+    assert np.abs(rows).max(axis=1).tolist() == [127] * 20
+    assert np.allclose(rows * scales[:, None], vectors, atol=scales.max() / 2 + 1e-6)
+
+
+def test_quantize_keeps_zero_rows():
+    rows, scales = quantize(np.zeros((1, 4), dtype=np.float32))
+
+    assert rows.tolist() == [[0, 0, 0, 0]]
+    assert scales.tolist() == [1.0]
+
+
+@pytest.mark.parametrize("quantized", [False, True])
+def test_round_trip_and_search_ordering(tmp_path, quantized):
+    embedder = HashingEmbedder(64)
+    path = tmp_path / "dense.bin"
+
+    assert build_dense_index(PASSAGES, path, embedder, quantized=quantized) == (3, 3)
+    index = DenseIndex.open(path, embedder=embedder)
+
+    assert index.quantized == quantized
+    assert index.text(1) == PASSAGES[1][0]
+    assert index.metadata(2) == PASSAGES[2][1]
+    expected = embedder.embed([text for text, _ in PASSAGES])
+    assert np.allclose([index.vector(i) for i in range(3)], expected, atol=0.01 if quantized else 0)
+
+    results = index.search("spack env activate environment", top_k=3)
+    assert results[0][0] == 1
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_quantized_scores_are_dequantized(tmp_path):
+    embedder = HashingEmbedder(64)
+    build_dense_index(PASSAGES, tmp_path / "float.bin", embedder)
+    build_dense_index(PASSAGES, tmp_path / "int8.bin", embedder, quantized=True)
+    queries = embedder.embed(["spack mirror add", "compilers.yaml"])
+
+    exact = DenseIndex.open(tmp_path / "float.bin").scores(queries)
+    approximate = DenseIndex.open(tmp_path / "int8.bin").scores(queries)
+
+    assert np.allclose(approximate, exact, atol=0.02)
+    assert (approximate.argmax(axis=1) == exact.argmax(axis=1)).all()
+
+
+def test_rebuild_reuses_vectors_of_unchanged_passages(tmp_path):
+    embedder = CountingEmbedder()
+    build_dense_index(PASSAGES, tmp_path / "previous.bin", embedder)
+    previous = DenseIndex.open(tmp_path / "previous.bin")
+    embedder.embedded.clear()
+    changed = ("spack compiler find --scope site adds compilers for every user.", PASSAGES[2][1])
+
+    counts = build_dense_index(PASSAGES[:2] + [changed], tmp_path / "dense.bin", embedder, previous=previous)
+
+    assert counts == (3, 1)
+    assert embedder.embedded == [changed[0]]
+    index = DenseIndex.open(tmp_path / "dense.bin")
+    assert np.array_equal(index.vector(0), previous.vector(0))
+
+
+def test_rebuild_with_another_embedder_embeds_everything(tmp_path):
+    build_dense_index(PASSAGES, tmp_path / "previous.bin", HashingEmbedder(64))
+    previous = DenseIndex.open(tmp_path / "previous.bin")
+
+    assert build_dense_index(PASSAGES, tmp_path / "dense.bin", CountingEmbedder(32), previous=previous) == (3, 3)
+
+
+def test_open_rejects_another_embedder(tmp_path):
+    build_dense_index(PASSAGES, tmp_path / "dense.bin", HashingEmbedder(64))
+
+    with pytest.raises(ValueError):
+        DenseIndex.open(tmp_path / "dense.bin", embedder=HashingEmbedder(32))
@@ -0,0 +1,52 @@
+import pytest
+
+import rag
+from fusion import RRF_K, reciprocal_rank_fusion
+
+
+def item(name, source="lexical"):
+    return {'DocumentId': name, 'DocumentURI': f"https://example.com/{name}", 'Content': f"passage {name}",
+            'Source': source}
+
+
+def response(*names, source="lexical"):
+    return {'ResultItems': [item(name, source) for name in names]}
+
+
+def names(fused):
+    return [result['DocumentId'] for result in fused['ResultItems']]
+
+
+def test_passages_in_both_lists_rank_first():
+    fused = reciprocal_rank_fusion([response("a", "b", "c"), response("b", "d", "a", source="dense")])
+
+    # b: 1/62 + 1/61, a: 1/61 + 1/63, d: 1/62, c: 1/63
+    assert names(fused) == ["b", "a", "d", "c"]
+    assert fused['ResultItems'][0]['Score'] == pytest.approx(1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+    assert fused['ResultItems'][0]['ScoreAttributes'] == {'ScoreConfidence': "VERY_HIGH"}
+
+
+def test_ties_keep_first_seen_order_and_first_copy():
+    fused = reciprocal_rank_fusion([response("x", "y"), response("y", "x", source="dense")])
+
+    assert names(fused) == ["x", "y"]
+    assert fused['ResultItems'][0]['Score'] == fused['ResultItems'][1]['Score']
+    assert {result['Source'] for result in fused['ResultItems']} == {"lexical"}
+
+
+def test_page_size():
+    assert names(reciprocal_rank_fusion([response("a", "b", "c")], page_size=2)) == ["a", "b"]
+
+
+def test_no_results():
+    assert reciprocal_rank_fusion([response(), response()])['ResultItems'] == []
+
+
+def test_hybrid_with_one_backend_empty(monkeypatch):
+    monkeypatch.setattr(rag, 'lexical_retrieve', lambda query: response())
+    monkeypatch.setattr(rag, 'dense_retrieve', lambda query: response("p", "q", "r", source="dense"))
+
+    fused = rag.hybrid_retrieve("how do I add a mirror?")
+
+    assert names(fused) == ["p", "q", "r"]
+    assert [result['ScoreAttributes']['ScoreConfidence'] for result in fused['ResultItems']] == ["VERY_HIGH"] * 3
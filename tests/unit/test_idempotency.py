@@ -0,0 +1,181 @@
+import threading
+from unittest import mock
+
+import pytest
+from botocore.exceptions import ClientError
+
+import idempotency
+from idempotency import COMPLETED, IN_PROGRESS, DynamoDBIdempotencyStore, InMemoryIdempotencyStore
+from tests.fakes import service_error
+
+
+def conditional_check_failed(item=None):
+    error = service_error('ConditionalCheckFailedException', 'PutItem')
+    if item is not None:
+        error.response['Item'] = item
+    return error
+
+
+def test_claim_then_complete():
+    store = InMemoryIdempotencyStore()
+
+    assert store.claim("Ev1") == (True, None)
+    assert store.claim("Ev1") == (False, IN_PROGRESS)
+    store.complete("Ev1")
+    assert store.claim("Ev1") == (False, COMPLETED)
+    assert store.status("Ev1") == COMPLETED
+
+
+def test_release_lets_the_next_retry_claim():
+    store = InMemoryIdempotencyStore()
+    store.claim("Ev1")
+
+    store.release("Ev1")
+
+    assert store.status("Ev1") is None
+    assert store.claim("Ev1") == (True, None)
+
+
+def test_release_keeps_a_completed_event():
+    store = InMemoryIdempotencyStore()
+    store.claim("Ev1")
+    store.complete("Ev1")
+
+    store.release("Ev1")
+
+    assert store.status("Ev1") == COMPLETED
+
+
+def test_expired_lease_can_be_claimed_again(monkeypatch):
+    store = InMemoryIdempotencyStore()
+    monkeypatch.setattr(idempotency, 'in_progress_timeout', -1)
+    store.claim("Ev1")
+
+    assert store.claim("Ev1") == (True, None)
+
+
+def test_renew_holds_the_event_until_it_is_completed():
+    store = InMemoryIdempotencyStore()
+    store.claim("Ev1")
+
+    assert store.renew("Ev1", lease=600, owner="attempt-1") == (True, None)
+    assert store.claim("Ev1") == (False, IN_PROGRESS)
+    assert store.complete("Ev1", owner="attempt-1")
+    assert store.renew("Ev1", lease=600, owner="attempt-2") == (False, COMPLETED)
+
+
+def test_concurrent_deliveries_only_one_holds_the_lease():
+    store = InMemoryIdempotencyStore()
+    store.claim("Ev1")
+    start = threading.Barrier(2)
+    results = {}
+
+    def deliver(owner):
+        start.wait()
+        results[owner] = store.renew("Ev1", lease=600, owner=owner)
+
+    threads = [threading.Thread(target=deliver, args=(owner,)) for owner in ("attempt-1", "attempt-2")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results.values()) == [(False, IN_PROGRESS), (True, None)]
+    winner = next(owner for owner, (renewed, _) in results.items() if renewed)
+    loser = next(owner for owner in results if owner != winner)
+    assert not store.complete("Ev1", owner=loser)
+    assert store.complete("Ev1", owner=winner)
+    assert store.renew("Ev1", lease=600, owner=loser) == (False, COMPLETED)
+
+
+def test_released_event_is_held_unowned_for_the_next_delivery():
+    store = InMemoryIdempotencyStore()
+    store.claim("Ev1")
+    store.renew("Ev1", lease=600, owner="attempt-1")
+
+    store.release("Ev1", owner="attempt-1", lease=600)
+
+    # Slack retries are still acknowledged, and the redelivery takes the event over
+    assert store.claim("Ev1") == (False, IN_PROGRESS)
+    assert store.renew("Ev1", lease=600, owner="attempt-2") == (True, None)
+    # A stale attempt cannot hand back or complete what it no longer holds
+    store.release("Ev1", owner="attempt-1", lease=600)
+    assert store.renew("Ev1", lease=600, owner="attempt-3") == (False, IN_PROGRESS)
+
+
+def test_expired_lease_of_a_crashed_attempt_is_taken_over():
+    store = InMemoryIdempotencyStore()
+    store.renew("Ev1", lease=-1, owner="attempt-1")
+
+    assert store.renew("Ev1", lease=600, owner="attempt-2") == (True, None)
+    assert not store.complete("Ev1", owner="attempt-1")
+
+
+def test_dynamodb_claim_is_conditional_on_an_unseen_or_expired_event():
+    client = mock.MagicMock()
+    store = DynamoDBIdempotencyStore("idempotency", client=client)
+
+    assert store.claim("Ev1") == (True, None)
+
+    request = client.put_item.call_args.kwargs
+    assert request['Item']['event_id'] == {'S': "Ev1"}
+    assert request['Item']['status'] == {'S': IN_PROGRESS}
+    assert "attribute_not_exists(event_id)" in request['ConditionExpression']
+    assert "lease_expires_at < :now" in request['ConditionExpression']
+
+
+def test_dynamodb_claim_reports_the_stored_status():
+    client = mock.MagicMock()
+    client.put_item.side_effect = conditional_check_failed({'status': {'S': COMPLETED}})
+    store = DynamoDBIdempotencyStore("idempotency", client=client)
+
+    assert store.claim("Ev1") == (False, COMPLETED)
+
+
+def test_dynamodb_renew_does_not_reopen_a_completed_event():
+    client = mock.MagicMock()
+    client.put_item.side_effect = conditional_check_failed({'status': {'S': COMPLETED}})
+    store = DynamoDBIdempotencyStore("idempotency", client=client)
+
+    assert store.renew("Ev1", lease=600, owner="attempt-1") == (False, COMPLETED)
+    request = client.put_item.call_args.kwargs
+    assert request['Item']['owner'] == {'S': "attempt-1"}
+    assert "#owner = :owner OR lease_expires_at < :now" in request['ConditionExpression']
+
+
+def test_dynamodb_complete_and_release_by_an_owner_are_conditional_on_it():
+    client = mock.MagicMock()
+    store = DynamoDBIdempotencyStore("idempotency", client=client)
+
+    assert store.complete("Ev1", owner="attempt-1")
+    assert client.update_item.call_args.kwargs['ConditionExpression'] == "#owner = :owner"
+
+    client.update_item.side_effect = conditional_check_failed()
+    assert not store.complete("Ev1", owner="attempt-1")
+    store.release("Ev1", owner="attempt-1", lease=600)
+    request = client.update_item.call_args.kwargs
+    assert request['UpdateExpression'].startswith("REMOVE #owner")
+    assert request['ExpressionAttributeValues'][':owner'] == {'S': "attempt-1"}
+    client.delete_item.assert_not_called()
+
+
+def test_dynamodb_complete_and_release():
+    client = mock.MagicMock()
+    store = DynamoDBIdempotencyStore("idempotency", client=client)
+
+    store.complete("Ev1")
+    assert client.update_item.call_args.kwargs['ExpressionAttributeValues'][':completed'] == {'S': COMPLETED}
+
+    # Releasing an event another attempt already completed leaves it alone
+    client.delete_item.side_effect = conditional_check_failed()
+    store.release("Ev1")
+    assert client.delete_item.call_args.kwargs['ConditionExpression'] == "#status = :in_progress"
+
+
+def test_dynamodb_other_errors_are_raised():
+    client = mock.MagicMock()
+    client.put_item.side_effect = service_error('ProvisionedThroughputExceededException', 'PutItem')
+    store = DynamoDBIdempotencyStore("idempotency", client=client)
+
+    with pytest.raises(ClientError):
+        store.claim("Ev1")
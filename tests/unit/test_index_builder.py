@@ -0,0 +1,92 @@
+import pytest
+
+import clients
+import index_builder
+from dense_index import HashingEmbedder, build_dense_index
+from lexical_index import build_index, document_passages
+from tests.fakes import SPACK_PASSAGES, FakeS3, FakeSSM
+
+BUCKET = "indexes"
+VERSION_PARAMETER = "/Radiuss/Spack/IndexVersion"
+
+
+def documents(passages=SPACK_PASSAGES):
+    return [(f"processed/{i}.txt", title, uri, text) for i, (title, uri, text) in enumerate(passages)]
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    s3 = FakeS3(buckets=(BUCKET,))
+    clients.s3.set(s3)
+    monkeypatch.setattr(index_builder, 'lexical_index_bucket', BUCKET)
+    yield s3
+    clients.s3.reset()
+
+
+@pytest.fixture
+def ssm(monkeypatch):
+    ssm = FakeSSM({VERSION_PARAMETER: "initial"})
+    clients.ssm.set(ssm)
+    monkeypatch.setattr(index_builder, 'index_version_param_name', VERSION_PARAMETER)
+    monkeypatch.setattr(index_builder, 'retriever_backend', 'lexical')
+    yield ssm
+    clients.ssm.reset()
+
+
+def test_unchanged_index_is_not_uploaded_again(s3, tmp_path):
+    first, second = tmp_path / "first.bin", tmp_path / "second.bin"
+    build_index(documents(), first)
+    build_index(documents(), second)
+
+    digest, changed = index_builder.upload_index(first, "lexical/index.bin", "LexicalIndexBytes")
+    assert changed
+    assert index_builder.upload_index(second, "lexical/index.bin", "LexicalIndexBytes") == (digest, False)
+    assert s3.requests['PutObject'] == 1
+    assert s3.buckets[BUCKET]["lexical/index.bin"]['Metadata'] == {index_builder.CONTENT_HASH_METADATA: digest}
+
+
+def test_changed_index_is_uploaded(s3, tmp_path):
+    first, second = tmp_path / "first.bin", tmp_path / "second.bin"
+    build_index(documents(), first)
+    build_index(documents(SPACK_PASSAGES[:-1]), second)
+
+    index_builder.upload_index(first, "lexical/index.bin", "LexicalIndexBytes")
+    _, changed = index_builder.upload_index(second, "lexical/index.bin", "LexicalIndexBytes")
+
+    assert changed
+    assert s3.buckets[BUCKET]["lexical/index.bin"]['Body'] == second.read_bytes()
+
+
+def test_changed_index_bumps_the_version(ssm):
+    version = index_builder.publish_index_version([("a" * 64, True), ("b" * 64, False)])
+
+    assert version.startswith("index-build:")
+    assert ssm.parameters[VERSION_PARAMETER] == version
+    # The version follows the content, so rebuilding the same indexes publishes the same one
+    assert index_builder.publish_index_version([("a" * 64, True), ("b" * 64, True)]) == version
+
+
+def test_unchanged_indexes_keep_the_version(ssm):
+    assert index_builder.publish_index_version([("a" * 64, False), ("b" * 64, False)]) is None
+    assert ssm.parameters[VERSION_PARAMETER] == "initial"
+
+
+def test_kendra_backend_keeps_the_version(ssm, monkeypatch):
+    monkeypatch.setattr(index_builder, 'retriever_backend', 'kendra')
+
+    assert index_builder.publish_index_version([("a" * 64, True)]) is None
+    assert ssm.requests['PutParameter'] == 0
+
+
+def test_previous_dense_index_is_reused(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(index_builder, 'dense_index_key', "dense/index.bin")
+    passages = list(document_passages(documents()))
+    assert index_builder.previous_dense_index(str(tmp_path / "missing.bin")) is None
+
+    build_dense_index(passages, tmp_path / "built.bin", HashingEmbedder(64))
+    index_builder.upload_index(tmp_path / "built.bin", "dense/index.bin", "DenseIndexBytes")
+    previous = index_builder.previous_dense_index(str(tmp_path / "previous.bin"))
+
+    assert previous.passage_count == len(passages)
+    assert build_dense_index(passages, tmp_path / "rebuilt.bin", HashingEmbedder(64), previous=previous) == (len(passages), 0)
+    assert (tmp_path / "rebuilt.bin").read_bytes() == (tmp_path / "built.bin").read_bytes()
@@ -0,0 +1,75 @@
+import importlib.util
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PUBLISHED = datetime(2024, 5, 1, 6, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture(scope="module")
+def index_version():
+    # Loaded under its own name, every Lambda's handler module is called index
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("kendra_index_id", "unit-test")
+        monkeypatch.setenv("kendra_data_source_ids", "docs,slack,")
+        monkeypatch.setenv("index_version_param_name", "/Radiuss/Spack/IndexVersion")
+        spec = importlib.util.spec_from_file_location(
+            "index_version_handler", os.path.join(ROOT, "lambdas", "index_version", "index.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+class FakeKendraSyncs:
+    """kendra stand-in for `list_data_source_sync_jobs`, two jobs per page."""
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def list_data_source_sync_jobs(self, Id, IndexId, StartTimeFilter, NextToken=None):
+        jobs = [job for job in self.jobs.get(Id, []) if job['StartTime'] >= StartTimeFilter['StartTime']]
+        start = int(NextToken or 0)
+        page = {'History': jobs[start:start + 2]}
+        if start + 2 < len(jobs):
+            page['NextToken'] = str(start + 2)
+        return page
+
+
+def sync(execution_id, ended, status="SUCCEEDED"):
+    return {'ExecutionId': execution_id, 'StartTime': ended - timedelta(hours=1), 'EndTime': ended, 'Status': status}
+
+
+def parameter(value="sync-1", last_modified=PUBLISHED):
+    return {'Value': value, 'LastModifiedDate': last_modified}
+
+
+def test_a_sync_ending_after_the_version_was_published_is_newer(index_version):
+    assert index_version.is_newer(sync("sync-2", PUBLISHED + timedelta(minutes=1)), parameter())
+
+
+@pytest.mark.parametrize("candidate", [
+    None,
+    sync("sync-1", PUBLISHED + timedelta(minutes=1)),
+    sync("sync-2", PUBLISHED),
+    # Ended before the index builder's later bump
+    sync("sync-2", PUBLISHED - timedelta(minutes=1)),
+])
+def test_older_or_already_published_syncs_are_not_newer(index_version, candidate):
+    assert not index_version.is_newer(candidate, parameter())
+
+
+def test_latest_finished_sync_across_data_sources_and_pages(index_version, monkeypatch):
+    now = datetime.now(timezone.utc)
+    running = dict(sync("docs-running", now), EndTime=None)
+    monkeypatch.setattr(index_version, 'kendra', FakeKendraSyncs({
+        'docs': [sync("docs-1", now - timedelta(hours=5)), sync("docs-2", now - timedelta(hours=3)),
+                 sync("docs-3", now - timedelta(hours=2), status="FAILED"), running],
+        'slack': [sync("slack-1", now - timedelta(hours=4)), sync("slack-old", now - timedelta(days=5))],
+    }))
+
+    latest = index_version.latest_finished_sync(now - timedelta(hours=48))
+
+    assert latest['ExecutionId'] == "docs-3"
+    assert index_version.latest_finished_sync(now) is None
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import bm25
+from lexical_index import LexicalIndex, build_index, map_arrays, split_passages, write_arrays
+
+CORPUS = [
+    ("docs/mirrors.txt", "Mirrors", "https://example.com/mirrors",
+     "spack mirror add registers a mirror. spack mirror list shows every configured mirror."),
+    ("docs/environments.txt", "Environments", "https://example.com/environments",
+     "spack env create makes an environment and spack env activate switches to it."),
+    ("docs/buildcache.txt", "Build caches", "https://example.com/buildcache",
+     "spack buildcache push uploads binaries to a mirror so installs can skip building."),
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = tmp_path / "index.bin"
+    assert build_index(CORPUS, path) == 3
+    return LexicalIndex.open(path)
+
+
+def test_array_file_round_trip(tmp_path):
+    path = tmp_path / "arrays.bin"
+    arrays = {
+        'bytes': np.frombuffer(b"abc", dtype=np.uint8),
+        'offsets': np.array([0, 1, 3], dtype=np.int64),
+        'scores': np.array([0.5, -1.25], dtype=np.float32),
+    }
+
+    write_arrays(path, arrays, {'passage_count': 2}, magic=b"TESTMAG\x01")
+    header, mapped = map_arrays(path, magic=b"TESTMAG\x01")
+
+    assert header['passage_count'] == 2
+    for name, values in arrays.items():
+        assert mapped[name].dtype == values.dtype
+        assert np.array_equal(mapped[name], values)
+        # Every array starts aligned, so it can be viewed in place
+        assert mapped[name].ctypes.data % 8 == 0
+
+
+def test_map_arrays_rejects_other_files(tmp_path):
+    path = tmp_path / "arrays.bin"
+    write_arrays(path, {'a': np.zeros(1, dtype=np.uint8)}, {}, magic=b"OTHERMG\x01")
+
+    with pytest.raises(ValueError):
+        map_arrays(path)
+
+
+def test_search_ranks_by_bm25(index):
+    results = index.search("spack mirror add", top_k=3)
+
+    assert [index.metadata(passage_id)['title'] for passage_id, _ in results] == ["Mirrors", "Build caches", "Environments"]
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_search_scores_match_bm25(index):
+    documents = [bm25.count_terms(text, title) for _, title, _, text in CORPUS]
+    expected = bm25.score(bm25.terms("environment activate"), documents)
+
+    results = dict(index.search("environment activate", top_k=3))
+
+    assert results.keys() == {1}
+    assert results[1] == pytest.approx(expected[1], rel=1e-5)
+
+
+def test_search_without_matches(index):
+    assert index.search("cuda") == []
+
+
+def test_retrieve_returns_kendra_shaped_results(index):
+    items = index.retrieve("spack env activate", page_size=1)['ResultItems']
+
+    assert len(items) == 1
+    assert items[0]['DocumentId'] == "docs/environments.txt"
+    assert items[0]['DocumentURI'] == "https://example.com/environments"
+    assert items[0]['Content'] == CORPUS[1][3]
+    assert items[0]['ScoreAttributes'] == {'ScoreConfidence': "VERY_HIGH"}
+
+
+def test_split_passages_on_paragraphs():
+    text = "one two three\n\nfour five\n\n" + " ".join(["word"] * 7)
+
+    assert split_passages(text, passage_words=5) == ["one two three\n\nfour five", "word word word word word", "word word"]
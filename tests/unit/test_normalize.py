@@ -0,0 +1,31 @@
+import pytest
+
+from normalize import normalize_query, strip_mentions
+
+
+def test_strip_mentions():
+    assert strip_mentions("<@U06D5B8AR8R> how do I add a mirror?").strip() == "how do I add a mirror?"
+
+
+@pytest.mark.parametrize("first, second", [
+    ("<@U06D5B8AR8R> How do I add a mirror?", "how do i add a mirror"),
+    ("How   do I add a mirror?!", "<@SpackChatbot> how do I add a mirror"),
+    ("What is `spack env`?", "what is spack env"),
+])
+def test_equivalent_questions_share_a_key(first, second):
+    assert normalize_query(first) == normalize_query(second)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("install py-numpy", "install py-numpy"),
+    ("Build hdf5+mpi ~fortran ^openmpi %gcc@12.1", "build hdf5+mpi ~fortran ^openmpi %gcc@12.1"),
+    ("Where is .spack/config.yaml?", "where is .spack/config.yaml"),
+    ("use gcc@12.1.", "use gcc@12.1"),
+])
+def test_spec_syntax_is_kept(text, expected):
+    assert normalize_query(text) == expected
+
+
+def test_spec_sigils_keep_questions_apart():
+    assert normalize_query("hdf5 +mpi") != normalize_query("hdf5 ~mpi")
+    assert normalize_query("hdf5 ^openmpi") != normalize_query("hdf5 openmpi")
@@ -0,0 +1,60 @@
+from packing import PASSAGE_SEPARATOR, estimate_tokens, pack_passages
+
+
+def result(content, confidence="HIGH", uri=None):
+    return {
+        'Content': content,
+        'DocumentURI': uri or f"https://example.com/{abs(hash(content))}",
+        'ScoreAttributes': {'ScoreConfidence': confidence},
+    }
+
+
+MIRRORS = "Use spack mirror add <name> <url> to register a mirror and spack mirror list to check it."
+ENVIRONMENTS = "spack env create myenv makes an environment and spack env activate myenv switches to it."
+COMPILERS = "spack compiler find searches PATH for compilers and adds them to compilers.yaml."
+
+
+def test_orders_by_confidence_unless_ranked():
+    items = [result(MIRRORS, "LOW"), result(ENVIRONMENTS, "VERY_HIGH"), result(COMPILERS, "MEDIUM")]
+
+    assert [item['Content'] for item in pack_passages(items).items] == [ENVIRONMENTS, COMPILERS, MIRRORS]
+    assert pack_passages(items, ranked=True).items == items
+
+
+def test_passage_string_and_token_count():
+    context = pack_passages([result(MIRRORS), result(ENVIRONMENTS)])
+
+    assert context.passage_str == PASSAGE_SEPARATOR + MIRRORS + PASSAGE_SEPARATOR + ENVIRONMENTS
+    assert context.tokens == estimate_tokens(PASSAGE_SEPARATOR + MIRRORS) + estimate_tokens(PASSAGE_SEPARATOR + ENVIRONMENTS)
+
+
+def test_skips_low_confidence_and_near_duplicates():
+    items = [result(MIRRORS), result(MIRRORS.replace("check it", "check it again")), result(COMPILERS, "LOW")]
+
+    context = pack_passages(items, min_confidence="MEDIUM", duplicate_threshold=0.8)
+
+    assert context.items == [items[0]]
+
+
+def test_stops_at_top_k():
+    items = [result(MIRRORS), result(ENVIRONMENTS), result(COMPILERS)]
+
+    assert len(pack_passages(items, top_k=2).items) == 2
+
+
+def test_skips_passages_over_budget_for_smaller_ones():
+    long_passage = "spack install " * 200
+    items = [result(MIRRORS), result(long_passage), result(COMPILERS)]
+
+    context = pack_passages(items, token_budget=60, ranked=True)
+
+    assert [item['Content'] for item in context.items] == [MIRRORS, COMPILERS]
+    assert context.tokens <= 60
+
+
+def test_truncates_a_first_passage_larger_than_the_budget():
+    context = pack_passages([result("spack install " * 200)], token_budget=50)
+
+    assert len(context.items) == 1
+    assert context.tokens <= 50
+    assert len(context.passage_str) <= 50 * 4
@@ -0,0 +1,50 @@
+from rag import rerank
+
+QUESTION = "How do I add a mirror?"
+
+
+def item(name, content, confidence):
+    return {'DocumentId': name, 'DocumentTitle': "", 'Content': content,
+            'ScoreAttributes': {'ScoreConfidence': confidence}}
+
+
+MIRROR = item("mirror", "Run spack mirror add to register a mirror for sources.", "LOW")
+ENVIRONMENTS = item("environments", "Environments group specs into one concretized lockfile.", "VERY_HIGH")
+PACKAGES = item("packages", "Use spack add in an environment to add a package.", "MEDIUM")
+RESULTS = [ENVIRONMENTS, PACKAGES, MIRROR]
+
+
+def names(result_items):
+    return [result['DocumentId'] for result in result_items]
+
+
+def test_lexical_score_orders_results_without_kendra_weight():
+    assert names(rerank(QUESTION, RESULTS, kendra_weight=0)) == ["mirror", "packages", "environments"]
+
+
+def test_kendra_confidence_orders_results_at_full_weight():
+    assert names(rerank(QUESTION, RESULTS, kendra_weight=1)) == ["environments", "packages", "mirror"]
+
+
+def test_blend_keeps_a_confident_result_above_weak_lexical_matches():
+    # mirror: 0.7 + 0.3 * 1/4, environments: 0.3 * 4/4, packages: 0.7 * (a partial match) + 0.3 * 2/4
+    assert names(rerank(QUESTION, RESULTS, kendra_weight=0.3))[0] == "mirror"
+    assert names(rerank(QUESTION, RESULTS, kendra_weight=0.6)) == ["environments", "mirror", "packages"]
+
+
+def test_top_n():
+    assert names(rerank(QUESTION, RESULTS, top_n=1, kendra_weight=0)) == ["mirror"]
+    assert len(rerank(QUESTION, RESULTS, top_n=10)) == 3
+
+
+def test_ties_keep_retrieve_order():
+    first = item("first", "Build caches hold binaries.", "HIGH")
+    second = item("second", "Build caches hold binaries.", "HIGH")
+
+    assert names(rerank(QUESTION, [first, second])) == ["first", "second"]
+    assert names(rerank(QUESTION, [second, first])) == ["second", "first"]
+
+
+def test_only_the_first_candidates_are_reranked():
+    assert names(rerank(QUESTION, RESULTS, kendra_weight=0, max_candidates=2)) == ["packages", "environments"]
+    assert rerank(QUESTION, [], max_candidates=2) == []
@@ -0,0 +1,52 @@
+import pytest
+
+import retrieval_cache
+from retrieval_cache import RetrievalCache
+
+
+@pytest.fixture
+def recorded_metrics(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(retrieval_cache.metrics, 'add_metric',
+                        lambda name, value, **kwargs: recorded.append((name, value)))
+    return recorded
+
+
+@pytest.fixture
+def cache():
+    queries = []
+
+    def retrieve(query):
+        queries.append(query)
+        return {'ResultItems': [{'Content': f"result {len(queries)}"}]}
+
+    cache = RetrievalCache(retrieve)
+    cache.queries = queries
+    return cache
+
+
+def names(recorded):
+    return [name for name, _ in recorded]
+
+
+def test_repeated_queries_are_served_from_the_cache(cache, recorded_metrics):
+    first = cache.retrieve("How do I add a mirror?", "v1")
+
+    assert cache.retrieve("how do I add a  mirror", "v1") is first
+    assert cache.queries == ["How do I add a mirror?"]
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert names(recorded_metrics) == ["RetrieveCacheMiss", "RetrieveCacheHitRate", "RetrieveCacheHit",
+                                       "RetrieveLatencySaved", "RetrieveCacheHitRate"]
+    assert recorded_metrics[-1] == ("RetrieveCacheHitRate", 50)
+
+
+def test_a_new_index_version_is_a_miss(cache, recorded_metrics):
+    cache.retrieve("How do I add a mirror?", "v1")
+    refreshed = cache.retrieve("How do I add a mirror?", "v2")
+
+    assert refreshed['ResultItems'][0]['Content'] == "result 2"
+    # The entry now belongs to v2, a reader on the stale version misses as well
+    assert cache.retrieve("How do I add a mirror?", "v1")['ResultItems'][0]['Content'] == "result 3"
+    assert cache.retrieve("How do I add a mirror?", "v1")['ResultItems'][0]['Content'] == "result 3"
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert names(recorded_metrics).count("RetrieveCacheMiss") == 3
@@ -0,0 +1,48 @@
+import pytest
+
+from router import BARE_MENTION, EMOJI_ONLY, GREETING, RAG, THANKS, Router, create_router
+
+
+@pytest.mark.parametrize("text, name", [
+    ("<@U0SPACKBOT> hi there", GREETING),
+    ("Good morning everyone", GREETING),
+    ("thanks so much!", THANKS),
+    ("ok got it, thx", THANKS),
+    ("<@U0SPACKBOT>", BARE_MENTION),
+    (":tada: 🎉", EMOJI_ONLY),
+    ("hi, how do I add a mirror?", RAG),
+    ("thanks, but spack install still fails with a compiler error", RAG),
+    ("spack env activate", RAG),
+    ("", BARE_MENTION),
+])
+def test_rules(text, name):
+    assert create_router().route(text).name == name
+
+
+def test_fast_path_replies():
+    router = create_router()
+
+    assert router.route("hello").fast_path
+    assert router.route("hello").reply is not None
+    assert router.route("thanks").reply is None
+    assert not router.route("how do I add a mirror?").fast_path
+
+
+def test_model_decides_undecided_messages_above_its_threshold():
+    router = Router(replies={THANKS: None}, model=lambda text: (THANKS, 0.95), threshold=0.9)
+
+    assert router.route("much appreciated, legend").name == THANKS
+
+
+def test_model_below_threshold_or_unknown_route_goes_to_rag():
+    assert Router(replies={THANKS: None}, model=lambda text: (THANKS, 0.5)).route("legend").name == RAG
+    assert Router(replies={THANKS: None}, model=lambda text: ("Other", 1.0)).route("legend").name == RAG
+
+
+def test_model_is_not_asked_about_long_messages():
+    def model(text):
+        raise AssertionError("model called")
+
+    router = Router(replies={THANKS: None}, model=model)
+
+    assert router.route("my build of hdf5 fails when linking against openmpi from the system").name == RAG
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+import urllib3
+
+import slack_client
+from slack_client import TIER_LIMITS, SlackClient, SlackError, SlackHttpError, SlackRateLimitedError
+from tests.fakes import FakeSlackHttp, FakeSlackResponse
+
+
+class ScriptedSlackHttp:
+    """urllib3.PoolManager stand-in that answers with `responses` in order; an exception in the list is raised."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def request(self, method, url, headers=None, body=None, fields=None, **kwargs):
+        self.requests.append((url.rsplit('/', 1)[-1], json.loads(body) if body is not None else fields))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def ok(**payload):
+    return FakeSlackResponse(200, dict(payload, ok=True))
+
+
+def ratelimited(retry_after):
+    return FakeSlackResponse(429, {'ok': False, 'error': 'ratelimited'}, {'Retry-After': str(retry_after)})
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(slack_client.random, 'uniform', lambda a, b: 0)
+
+
+def test_429_defers_the_methods_limiter_and_retries(monkeypatch):
+    http = ScriptedSlackHttp(ratelimited(0.05), ok(messages=[]))
+    client = SlackClient("xoxb-test", http=http)
+    limiter = client.limiter('conversations.history', {'channel': "C1"})
+    deferred = []
+    defer = limiter.defer
+    monkeypatch.setattr(limiter, 'defer', lambda seconds: (deferred.append(seconds), defer(seconds)))
+
+    assert client.call('conversations.history', channel="C1") == {'ok': True, 'messages': []}
+    assert deferred == [0.05]
+    assert len(http.requests) == 2
+
+
+def test_429_longer_than_the_allowed_wait_is_raised():
+    client = SlackClient("xoxb-test", http=ScriptedSlackHttp(ratelimited(120)), max_retry_wait=30)
+
+    with pytest.raises(SlackRateLimitedError) as e:
+        client.call('chat.postMessage', channel="C1", text="hi")
+    assert e.value.retry_after == 120
+
+
+@pytest.mark.parametrize("failure", [
+    FakeSlackResponse(503, {}),
+    urllib3.exceptions.ReadTimeoutError(None, "/api/chat.update", "read timed out"),
+])
+def test_idempotent_methods_are_retried_after_failures(failure):
+    http = ScriptedSlackHttp(failure, ok(ts="1.0"))
+    client = SlackClient("xoxb-test", http=http)
+
+    assert client.call('chat.update', channel="C1", ts="1.0", text="edited")['ts'] == "1.0"
+    assert len(http.requests) == 2
+
+
+@pytest.mark.parametrize("failure, error", [
+    (FakeSlackResponse(503, {}), SlackHttpError),
+    (urllib3.exceptions.ReadTimeoutError(None, "/api/chat.postMessage", "read timed out"), SlackError),
+])
+def test_post_message_is_not_retried_after_failures(failure, error):
+    http = ScriptedSlackHttp(failure, ok(ts="1.0"))
+    client = SlackClient("xoxb-test", http=http)
+
+    # Slack may already have posted the message, a retry could post it twice
+    with pytest.raises(error):
+        client.call('chat.postMessage', channel="C1", text="hi")
+    assert len(http.requests) == 1
+
+
+def test_retries_give_up_after_max_retries():
+    http = ScriptedSlackHttp(*[FakeSlackResponse(500, {})] * 3)
+    client = SlackClient("xoxb-test", http=http, max_retries=2)
+
+    with pytest.raises(SlackHttpError):
+        client.call('conversations.info', channel="C1")
+    assert len(http.requests) == 3
+
+
+def test_paginate_follows_next_cursor_until_empty():
+    http = ScriptedSlackHttp(
+        ok(messages=[1, 2], response_metadata={'next_cursor': "c2"}),
+        ok(messages=[3], response_metadata={'next_cursor': "c3"}),
+        ok(messages=[4], response_metadata={'next_cursor': ""}),
+    )
+    client = SlackClient("xoxb-test", http=http)
+
+    assert list(client.paginate('conversations.history', 'messages', limit=2, channel="C1")) == [1, 2, 3, 4]
+    assert [params.get('cursor') for _, params in http.requests] == [None, "c2", "c3"]
+    assert {params['limit'] for _, params in http.requests} == {2}
+
+
+def test_try_call_returns_none_when_the_bucket_is_empty():
+    http = FakeSlackHttp()
+    client = SlackClient("xoxb-test", http=http, tier_limits=dict(TIER_LIMITS, post=(0.001, 1)))
+
+    assert client.try_call('chat.postMessage', channel="C1", text="first")['ok']
+    assert client.try_call('chat.postMessage', channel="C1", text="second") is None
+    assert len(http.requests) == 1
+
+
+def test_post_limits_are_per_channel():
+    http = FakeSlackHttp()
+    client = SlackClient("xoxb-test", http=http, tier_limits=dict(TIER_LIMITS, post=(0.001, 1)))
+
+    assert client.limiter('chat.postMessage', {'channel': "C1"}) is client.limiter('chat.postMessage', {'channel': "C1"})
+    assert client.limiter('chat.postMessage', {'channel': "C1"}) is not client.limiter('chat.postMessage', {'channel': "C2"})
+    # Tiered methods share one bucket across channels
+    assert client.limiter('conversations.history', {'channel': "C1"}) is client.limiter('conversations.history', {'channel': "C2"})
+
+    assert client.try_call('chat.postMessage', channel="C1", text="hi")
+    assert client.try_call('chat.postMessage', channel="C2", text="hi")
+    assert client.try_call('chat.postMessage', channel="C1", text="again") is None
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+import clients
+import slack
+from constants import feedback_text, streaming_placeholder_text
+from tests.fakes import FakeSlackHttp
+
+
+@pytest.fixture
+def slack_http(monkeypatch):
+    clients.slack_token.set("xoxb-test")
+    http = FakeSlackHttp()
+    monkeypatch.setattr(slack.client, 'http', http)
+    monkeypatch.setattr(slack, 'token_validated_at', None)
+    return http
+
+
+def calls(http):
+    return [(url.rsplit('/', 1)[-1], json.loads(body) if isinstance(body, str) else body)
+            for _, url, body in http.requests]
+
+
+def test_placeholder_is_replaced_by_the_answer_and_sources(slack_http, monkeypatch):
+    monkeypatch.setattr(slack, 'stream_update_interval', 0)
+
+    answer, sources = slack.stream_response_to_question(
+        "C1", "U1", "1.0", iter(["Use spack ", "mirror add."]), get_sources=lambda answer: "*Sources:*")
+
+    assert (answer, sources) == ("Use spack mirror add.", "*Sources:*")
+    methods = [method for method, _ in calls(slack_http)]
+    assert methods[:2] == ["auth.test", "chat.postMessage"]
+    assert set(methods[2:]) == {"chat.update"}
+    posted = calls(slack_http)[1][1]
+    assert posted['text'] == "<@U1>" + streaming_placeholder_text
+    final = calls(slack_http)[-1][1]
+    assert final['text'] == "<@U1>Use spack mirror add.\n*Sources:*" + feedback_text
+
+
+def test_updates_are_throttled(slack_http, monkeypatch):
+    monkeypatch.setattr(slack, 'stream_update_interval', 60)
+
+    slack.stream_response_to_question("C1", "U1", "1.0", iter("many small chunks"), get_sources=lambda answer: "")
+
+    # Only the final edit lands within the interval
+    assert [method for method, _ in calls(slack_http)].count("chat.update") == 1
+
+
+def test_placeholder_is_deleted_when_the_stream_fails(slack_http):
+    def chunks():
+        yield "Use spack "
+        raise RuntimeError("model stream failed")
+
+    with pytest.raises(RuntimeError):
+        slack.stream_response_to_question("C1", "U1", "1.0", chunks(), get_sources=lambda answer: "")
+
+    posted_ts = "1.000100"
+    assert calls(slack_http)[-1] == ("chat.delete", {'channel': "C1", 'ts': posted_ts})
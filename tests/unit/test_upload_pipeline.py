@@ -0,0 +1,115 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from tests.fakes import FakeS3, service_error
+from upload_pipeline import CONTENT_HASH_METADATA, UploadPipeline, content_hash
+
+RAW = "raw"
+PROCESSED = "processed"
+
+
+def metadata(name):
+    return json.dumps({"Title": name, "ContentType": "PLAIN_TEXT"})
+
+
+def upload(s3, documents, workers=2, prefix=None):
+    pipeline = UploadPipeline(s3, RAW, PROCESSED, workers=workers, prefix=prefix)
+    with pipeline:
+        for name, text in documents:
+            pipeline.submit(name, text, metadata(name))
+    return pipeline.stats
+
+
+def test_writes_text_and_metadata_with_content_hash():
+    s3 = FakeS3(buckets=(RAW, PROCESSED))
+
+    stats = upload(s3, [("C1-1.0", "how do I add a mirror?\n")])
+
+    assert stats.saved == 1
+    assert s3.object_text(RAW, "C1-1.0.txt") == "how do I add a mirror?\n"
+    assert s3.object_text(PROCESSED, "C1-1.0.txt") == "how do I add a mirror?\n"
+    stored = s3.buckets[PROCESSED]["C1-1.0.txt.metadata.json"]
+    assert json.loads(stored["Body"]) == json.loads(metadata("C1-1.0"))
+    assert stored["Metadata"] == {CONTENT_HASH_METADATA: content_hash("how do I add a mirror?\n")}
+
+
+def test_skips_documents_whose_content_hash_is_unchanged():
+    s3 = FakeS3(buckets=(RAW, PROCESSED))
+    upload(s3, [("C1-1.0", "thread text\n"), ("C1-2.0", "other thread\n")])
+    s3.requests.clear()
+
+    stats = upload(s3, [("C1-1.0", "thread text\n"), ("C1-2.0", "other thread, with a new reply\n")])
+
+    assert (stats.saved, stats.unchanged, stats.errors) == (1, 1, 0)
+    assert s3.requests == {"HeadObject": 2, "PutObject": 2, "CopyObject": 1}
+    assert s3.object_text(PROCESSED, "C1-2.0.txt") == "other thread, with a new reply\n"
+
+
+def test_listing_the_prefix_skips_the_head_for_new_documents():
+    s3 = FakeS3(buckets=(RAW, PROCESSED))
+    upload(s3, [("C1-1.0", "thread text\n"), ("C2-1.0", "other channel\n")])
+    s3.requests.clear()
+
+    stats = upload(s3, [("C1-1.0", "thread text\n"), ("C1-2.0", "new thread\n"), ("C1-3.0", "another\n")], prefix="C1-")
+
+    assert (stats.saved, stats.unchanged) == (2, 1)
+    # One List for the channel, and only the document already stored is checked with a HEAD
+    assert s3.requests == {"ListObjectsV2": 1, "HeadObject": 1, "PutObject": 4, "CopyObject": 2}
+
+
+def test_listing_an_empty_prefix_writes_without_any_head():
+    s3 = FakeS3(buckets=(RAW, PROCESSED))
+
+    stats = upload(s3, [(f"C1-{i}.0", f"message {i}\n") for i in range(5)], prefix="C1-")
+
+    assert stats.saved == 5
+    assert "HeadObject" not in s3.requests
+    assert s3.requests["ListObjectsV2"] == 1
+
+
+def test_renamed_document_is_copied_server_side():
+    s3 = FakeS3(buckets=(RAW, PROCESSED))
+    text = "spack env create myenv\n" * 50
+    upload(s3, [("old-name", text)])
+    s3.requests.clear()
+    s3.bytes_uploaded = 0
+
+    stats = upload(s3, [("C1-1.0", text)])
+
+    # A new key has no stored hash, so it is written, but its text is only sent to the raw bucket
+    assert stats.saved == 1
+    assert s3.requests["CopyObject"] == 1
+    assert s3.object_text(PROCESSED, "C1-1.0.txt") == text
+    assert s3.bytes_uploaded == len(text) + len(metadata("C1-1.0"))
+    assert stats.bytes_uploaded == s3.bytes_uploaded
+
+
+class FailingCopyS3(FakeS3):
+    def __init__(self, failing_key, **kwargs):
+        super().__init__(**kwargs)
+        self.failing_key = failing_key
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        if Key == self.failing_key:
+            raise service_error("InternalError", "CopyObject")
+        return super().copy_object(Bucket=Bucket, Key=Key, CopySource=CopySource, **kwargs)
+
+
+def test_worker_error_is_raised_after_the_rest_are_written():
+    s3 = FailingCopyS3("C1-2.0.txt", buckets=(RAW, PROCESSED))
+    pipeline = UploadPipeline(s3, RAW, PROCESSED, workers=2)
+
+    with pytest.raises(ClientError) as error:
+        with pipeline:
+            for i in range(1, 6):
+                pipeline.submit(f"C1-{i}.0", f"message {i}\n", metadata(f"C1-{i}.0"))
+
+    assert error.value.response["Error"]["Code"] == "InternalError"
+    assert (pipeline.stats.saved, pipeline.stats.errors) == (4, 1)
+    # The failed document has no metadata, so the next run writes it again
+    assert "C1-2.0.txt.metadata.json" not in s3.buckets[PROCESSED]
+    s3.failing_key = None
+    stats = upload(s3, [(f"C1-{i}.0", f"message {i}\n") for i in range(1, 6)])
+    assert (stats.saved, stats.unchanged) == (1, 4)